@@ -0,0 +1,192 @@
+"""Page dwell times of sessions, computed column-wise.
+
+The dashboard's page-visit rules: a ``pageView`` or ``quizPageNavigation``
+event ends the visit of the current page, which is charged the time since the
+previous event (when positive).  Every event then moves the session to the
+page it names: ``toPage`` for navigations, otherwise the page of its URL
+(``/quiz/page/N`` -> "N", ``/`` -> "home") or its ``page`` field.  The first
+malformed event stops the accounting for the rest of the session.
+
+Events are first reduced, in one pass, to columns: the categorical code of
+the page being left, the start time of that visit and the time it ended.
+Page strings are parsed once per distinct URL and ISO timestamps once per
+distinct string.  The per-page sums are then a vectorized diff and
+accumulation with NumPy when it is installed, or one loop over the columns
+without it.
+Timestamps are kept as float64 milliseconds, which is exact for the integer
+millisecond timestamps the tracker sends.
+"""
+import itertools
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the pure Python reduction gives the same sums
+    np = None
+
+NAVIGATION_EVENTS = ('pageView', 'quizPageNavigation')
+QUIZ_PAGE_PREFIX = '/quiz/page/'
+CHUNK_SIZE = 4096
+
+
+def _is_number(value):
+    return isinstance(value, (int, float))
+
+
+class _Malformed(Exception):
+    """An event the replay stops at; counted is True if its visit time was still charged"""
+
+    def __init__(self, counted):
+        self.counted = counted
+
+
+class DwellColumns:
+    """Visit columns of a run of events plus the replay state after them"""
+
+    def __init__(self, current_page, page_start_time):
+        self.pages = []        # Categorical page keys, code -> str(page)
+        self._codes = {}
+        self.page_code = []    # Page the visit was on
+        self.start_ms = []     # When the visit started
+        self.end_ms = []       # When the navigation event ended it
+        self.current_page = current_page
+        self.page_start_time = page_start_time
+        self.malformed = False
+        self.events = 0        # Events read, including a malformed last one
+        self._url_pages = {}
+        self._iso_times = {}
+
+    def _code(self, page):
+        key = str(page)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.pages)
+            self.pages.append(key)
+        return code
+
+    def _millis(self, timestamp, default):
+        # ISO strings are parsed to milliseconds, numbers pass through
+        if not isinstance(timestamp, str):
+            return timestamp
+        millis = self._iso_times.get(timestamp)
+        if millis is None:
+            try:
+                millis = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000
+            except ValueError:
+                millis = False
+            self._iso_times[timestamp] = millis
+        return default if millis is False else millis
+
+    def _url_page(self, url):
+        page = self._url_pages.get(url)
+        if page is None:
+            try:
+                page = str(int(url.split('/')[-1]))
+            except (ValueError, IndexError):
+                page = '0'
+            self._url_pages[url] = page
+        return page
+
+    def add(self, event):
+        """Reduce one event into the columns, raises _Malformed where the replay stops"""
+        if not isinstance(event, dict):
+            raise _Malformed(False)
+        event_name = event.get('eventName')
+        event_data = event.get('eventData', {})
+        current_page = self.current_page
+        page_start_time = self.page_start_time
+        counted = False
+        if event_name in NAVIGATION_EVENTS and current_page is not None and page_start_time is not None:
+            if not isinstance(event_data, dict):
+                raise _Malformed(False)
+            event_time = self._millis(event_data.get('timestamp', 0), page_start_time)
+            if not (_is_number(event_time) and _is_number(page_start_time)):
+                raise _Malformed(False)
+            self.page_code.append(self._code(current_page))
+            self.start_ms.append(page_start_time)
+            self.end_ms.append(event_time)
+            counted = True
+        if not isinstance(event_data, dict):
+            raise _Malformed(counted)
+        if event_name == 'quizPageNavigation':
+            current_page = event_data.get('toPage')
+        else:
+            url = event_data.get('url', '')
+            if not isinstance(url, str):
+                raise _Malformed(counted)
+            if url.startswith(QUIZ_PAGE_PREFIX):
+                current_page = self._url_page(url)
+            elif url == '/':
+                current_page = 'home'
+            else:
+                current_page = event_data.get('page', 'unknown')
+        self.current_page = current_page
+        self.page_start_time = event_data.get('timestamp')
+
+
+def load_columns(events, current_page=None, page_start_time=None):
+    """Reduce events to DwellColumns, starting from a replay state"""
+    columns = DwellColumns(current_page, page_start_time)
+    for event in events:
+        columns.events += 1
+        try:
+            columns.add(event)
+        except _Malformed:
+            columns.malformed = True
+            break
+    return columns
+
+
+def _add_dwell_numpy(page_visits, columns):
+    codes = np.asarray(columns.page_code, dtype=np.int64)
+    # Same operations as the scalar rules, (end - start) / 1000 / 60
+    minutes = (np.asarray(columns.end_ms, dtype=np.float64)
+               - np.asarray(columns.start_ms, dtype=np.float64)) / 1000 / 60
+    positive = minutes > 0
+    codes = codes[positive]
+    if not len(codes):
+        return
+    totals = np.array([page_visits.get(key, 0) for key in columns.pages], dtype=np.float64)
+    # add.at accumulates in event order, so the sums match the scalar replay bit for bit
+    np.add.at(totals, codes, minutes[positive])
+    charged, first = np.unique(codes, return_index=True)
+    for code in charged[np.argsort(first, kind='stable')]:
+        page_visits[columns.pages[code]] = float(totals[code])
+
+
+def _add_dwell_python(page_visits, columns):
+    pages = columns.pages
+    for code, start, end in zip(columns.page_code, columns.start_ms, columns.end_ms):
+        minutes = (end - start) / 1000 / 60
+        if minutes > 0:
+            key = pages[code]
+            page_visits[key] = page_visits.get(key, 0) + minutes
+
+
+def add_dwell(page_visits, columns):
+    """Charge the visits in the columns to page_visits ({page key: minutes})"""
+    if np is not None and len(columns.page_code) >= 64:
+        _add_dwell_numpy(page_visits, columns)
+    else:
+        _add_dwell_python(page_visits, columns)
+
+
+def replay_visits(record, events, chunk_size=CHUNK_SIZE):
+    """Advance the page-visit state of a session record over events
+
+    Only the visit fields of the record (page_visits, current_page,
+    page_start_time, visits_error) are touched.  Events are reduced to
+    columns as they are read and the columns are summed every chunk_size
+    events, so neither grows with the length of the session.
+    """
+    page_visits = record['page_visits']
+    events = iter(events)
+    while not record['visits_error']:
+        columns = load_columns(itertools.islice(events, chunk_size),
+                               record['current_page'], record['page_start_time'])
+        add_dwell(page_visits, columns)
+        record['current_page'] = columns.current_page
+        record['page_start_time'] = columns.page_start_time
+        record['visits_error'] = columns.malformed
+        if columns.events < chunk_size:
+            return
@@ -0,0 +1,92 @@
+"""Serialized and precompressed response bodies.
+
+A ``Payload`` holds the bytes of a response together with its gzip (and
+brotli, when the ``brotli`` package is installed) variants and an ETag, so
+repeated requests are answered without serializing or compressing again.
+``FileAssetCache`` keeps payloads of files on disk and rebuilds one only when
+the file's size or mtime changes.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+# Cache-Control for URLs that carry the content fingerprint
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class Payload:
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha1(body).hexdigest()
+        self.variants = {'identity': body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    @property
+    def fingerprint(self):
+        return self.digest[:12]
+
+    def choose(self, accept_encodings):
+        """Return (encoding, body) of the best variant the client accepts"""
+        encodings = [e for e in ('br', 'gzip') if e in self.variants]
+        encoding = accept_encodings.best_match(encodings) if encodings else None
+        if encoding is None:
+            encoding = 'identity'
+        return encoding, self.variants[encoding]
+
+    def response(self, request, cache_control='no-cache'):
+        """Build a response for request, honouring Accept-Encoding and If-None-Match"""
+        encoding, body = self.choose(request.accept_encodings)
+        response = Response(body, mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Content-Length'] = str(len(body))
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = cache_control
+        # Every representation gets its own strong ETag
+        response.set_etag(self.digest if encoding == 'identity' else f"{self.digest}-{encoding}")
+        return response.make_conditional(request)
+
+
+class FileAssetCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the payload of a file, None if it does not exist"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stamp = (st.st_size, st.st_mtime_ns)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        with open(path, 'rb') as f:
+            body = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        payload = Payload(body, mimetype)
+        with self._lock:
+            self._entries[path] = (stamp, payload)
+        return payload
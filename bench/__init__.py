@@ -0,0 +1 @@
+"""Benchmark harness: synthetic corpora and a load driver, run with ``python -m bench``."""
@@ -0,0 +1,72 @@
+"""Command line of the benchmark harness.
+
+    python -m bench generate /tmp/bench-data --scale 10k
+    python -m bench run /tmp/bench-data --threads 8 --requests 1000 -o before.json
+    python -m bench compare before.json after.json
+"""
+import argparse
+import json
+import sys
+
+from bench.corpus import SCALES, generate_corpus
+from bench.load import DEFAULT_SCENARIOS, compare, run_benchmark
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='write a synthetic data directory')
+    generate.add_argument('data_dir')
+    size = generate.add_mutually_exclusive_group()
+    size.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    size.add_argument('--sessions', type=int, help='exact number of sessions, instead of --scale')
+    generate.add_argument('--pages', type=int, default=13)
+    generate.add_argument('--questions-per-page', type=int, default=70)
+    generate.add_argument('--median-events', type=int, default=250)
+    generate.add_argument('--format', choices=('legacy', 'log'), default='legacy')
+    generate.add_argument('--seed', type=int, default=0)
+
+    run = commands.add_parser('run', help='load the app serving a data directory, print a JSON report')
+    run.add_argument('data_dir')
+    run.add_argument('--scenario', action='append', choices=DEFAULT_SCENARIOS,
+                     help='scenario to run, repeatable (default: all)')
+    run.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    run.add_argument('--threads', type=int, default=8)
+    run.add_argument('--mode', choices=('client', 'http'), default='client')
+    run.add_argument('--dashboard-limit', type=int, default=100)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('-o', '--output', help='write the report here instead of stdout')
+
+    diff = commands.add_parser('compare', help='compare two reports, ratios are candidate / baseline')
+    diff.add_argument('baseline')
+    diff.add_argument('candidate')
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        sessions = args.sessions if args.sessions is not None else SCALES[args.scale]
+        manifest = generate_corpus(args.data_dir, sessions, args.pages, args.questions_per_page,
+                                   args.median_events, args.seed, args.format)
+        json.dump(manifest, sys.stdout, indent=2)
+        print()
+    elif args.command == 'run':
+        report = run_benchmark(args.data_dir, tuple(args.scenario or DEFAULT_SCENARIOS), args.requests,
+                               args.threads, args.mode, args.dashboard_limit, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.candidate, 'r', encoding='utf-8') as f:
+            candidate = json.load(f)
+        print(f"{'scenario':<20} {'metric':<16} {'baseline':>12} {'candidate':>12} {'ratio':>8}")
+        for name, metric, old, new, ratio in compare(baseline, candidate):
+            print(f"{name:<20} {metric:<16} {old!s:>12} {new!s:>12} {ratio!s:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Synthetic data directories for benchmarks.
+
+Sessions follow the shape of the real ones in ``data/sessions``: one device
+and IP per session, a walk over quiz pages where each page is opened with a
+pageView/quizPageNavigation and its questions are viewed and answered, and
+the focus/visibility/timeSpent events the tracker sends in between, in about
+the same proportions.  Session lengths are log-normal, most sessions are a
+few hundred events and a few run into the thousands.
+
+Everything is derived from the seed, so a corpus can be rebuilt identically
+on another machine.  Sessions are written one at a time, so large corpora do
+not need to fit in memory.
+"""
+import json
+import math
+import os
+import random
+import uuid
+
+MANIFEST = 'bench_corpus.json'
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+# (os, model) and how often sessions come from it
+DEVICES = [
+    (('Windows', 'Desktop'), 53),
+    (('Android', '10'), 21),
+    (('macOS', 'Desktop'), 12),
+    (('Android', '6.0.1'), 7),
+    (('Android', '14'), 4),
+    (('Linux', 'Desktop'), 2),
+    (('Unknown OS', 'Unknown Model'), 1),
+]
+
+# Events sent between two question views, from the counts in the real corpus
+BACKGROUND_EVENTS = [
+    ('timeSpent', 34257),
+    ('pageHidden', 1152),
+    ('pageBlur', 1118),
+    ('pageFocus', 1012),
+    ('pageVisible', 840),
+    ('quizSearch', 62),
+]
+ANSWER_RATE = 8383 / 26005        # quizAnswer per questionView
+BACKGROUND_RATE = 38441 / 26005   # background events per questionView
+
+
+def _choice(rng, weighted):
+    return rng.choices([value for value, _ in weighted], [weight for _, weight in weighted])[0]
+
+
+def make_questions(pages, per_page, rng):
+    """Return {page: [question, ...]} with ids numbered across pages"""
+    bank = {}
+    question_id = 1
+    for page in range(pages):
+        questions = []
+        for _ in range(per_page):
+            correct = rng.choice('ABCD')
+            questions.append({
+                'id': question_id,
+                'question': f"Synthetic question {question_id} " + 'lorem ipsum ' * rng.randint(3, 12),
+                'options': [{'id': option, 'text': f"Option {option} " + 'dolor sit ' * rng.randint(1, 6)}
+                            for option in 'ABCD'],
+                'correct_answer': correct,
+                'explanation': 'Because ' + 'amet consectetur ' * rng.randint(5, 40),
+                'page': page,
+                'updated_at': '2025-01-01T00:00:00',
+            })
+            question_id += 1
+        bank[page] = questions
+    return bank
+
+
+def session_events(rng, session_id, bank, median_events, start_ms):
+    """Yield the events of one synthetic session"""
+    os_name, model = _choice(rng, DEVICES)
+    header = {
+        'sessionId': session_id,
+        'deviceInfo': {'os': os_name, 'model': model},
+        'ip': f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+    }
+    length = max(1, int(rng.lognormvariate(math.log(median_events), 1.3)))
+    now = start_ms
+    page = None
+    emitted = 0
+
+    def event(name, **data):
+        nonlocal now, emitted
+        now += int(rng.expovariate(1 / 8000)) + 1
+        emitted += 1
+        return dict(header, eventName=name, eventData=dict(data, timestamp=now))
+
+    while emitted < length:
+        previous = page
+        if page is None or rng.random() < 0.3:
+            page = rng.randrange(len(bank))
+        else:
+            page = min(page + 1, len(bank) - 1)
+        url = f"/quiz/page/{page}"
+        if previous is None:
+            yield event('pageView', page=str(page), url=url)
+        yield event('quizPageNavigation', fromPage=previous, toPage=page, url=url)
+        for question in bank[page]:
+            if emitted >= length:
+                break
+            yield event('questionView', questionId=question['id'], page=str(page), url=url)
+            for _ in range(int(rng.expovariate(1 / BACKGROUND_RATE))):
+                name = _choice(rng, BACKGROUND_EVENTS)
+                if name == 'timeSpent':
+                    yield event(name, duration=rng.randint(5, 60), url=url)
+                elif name == 'quizSearch':
+                    yield event(name, searchTerm=rng.choice('abcdefg'), page=page, url=url)
+                else:
+                    yield event(name, page=str(page), url=url)
+            if rng.random() < ANSWER_RATE:
+                answer = rng.choice('ABCD')
+                yield event('quizAnswer', questionId=str(question['id']), selectedAnswer=answer,
+                            isCorrect=answer == question['correct_answer'], page=str(page), url=url)
+    yield event('pageUnload', page='home', url='/')
+
+
+def generate_corpus(data_dir, sessions, pages=13, per_page=70, median_events=250, seed=0,
+                    session_format='legacy', start_ms=1735689600000, span_days=90):
+    """Write a synthetic data directory, returns its manifest
+
+    session_format is 'legacy' (one JSON array per session, like the files
+    in data/sessions) or 'log' (the .jsonl append logs).
+    """
+    rng = random.Random(seed)
+    sessions_dir = os.path.join(data_dir, 'sessions')
+    os.makedirs(sessions_dir, exist_ok=True)
+
+    bank = make_questions(pages, per_page, rng)
+    for page, questions in bank.items():
+        with open(os.path.join(data_dir, f"questions_{page}.json"), 'w', encoding='utf-8') as f:
+            json.dump(questions, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(data_dir, 'page-title.json'), 'w', encoding='utf-8') as f:
+        json.dump({str(page): f"Page {page}" for page in bank}, f, indent=2)
+
+    total_events = 0
+    total_bytes = 0
+    for _ in range(sessions):
+        session_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        start = start_ms + rng.randrange(span_days * 24 * 60 * 60 * 1000)
+        events = session_events(rng, session_id, bank, median_events, start)
+        if session_format == 'log':
+            path = os.path.join(sessions_dir, session_id + '.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                for e in events:
+                    f.write(json.dumps(e, ensure_ascii=False) + '\n')
+                    total_events += 1
+        else:
+            path = os.path.join(sessions_dir, session_id + '.json')
+            events = list(events)
+            total_events += len(events)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(events, f, indent=2, ensure_ascii=False)
+        total_bytes += os.path.getsize(path)
+
+    manifest = {
+        'sessions': sessions,
+        'events': total_events,
+        'session_bytes': total_bytes,
+        'pages': pages,
+        'questions_per_page': per_page,
+        'median_events': median_events,
+        'format': session_format,
+        'seed': seed,
+    }
+    with open(os.path.join(data_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(data_dir):
+    try:
+        with open(os.path.join(data_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
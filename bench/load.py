@@ -0,0 +1,292 @@
+"""Drive the app's hot endpoints with concurrent requests and measure them.
+
+Each scenario sends ``requests`` requests from ``threads`` threads, either
+through Flask test clients (no network, measures the app itself) or over HTTP
+to the app served by a local threaded werkzeug server.  The first request of a
+scenario is timed separately, since it is where the dashboards build their
+indexes, and is not part of the percentiles.
+
+The report is a JSON document with the commit, the environment, the corpus
+manifest and, per scenario, throughput and p50/p95/p99 latency, plus the peak
+RSS of the process (and of worker processes it waited for).
+
+Tracking requests append to the sessions of the data directory, so run the
+benchmark on a generated copy, not on real data.
+"""
+import datetime
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+from bench.corpus import read_manifest
+
+REPORT_VERSION = 1
+
+DEFAULT_SCENARIOS = ('track', 'questions', 'active_user', 'dashboard_sessions', 'quiz_dashboard')
+
+
+def _scenarios(pages, dashboard_limit):
+    """{name: (method, make_request(rng) -> (path, json body or None), needs admin)}"""
+
+    def track(rng):
+        page = rng.randrange(pages)
+        return '/api/track', {
+            'sessionId': f"bench-{rng.randrange(1000)}",
+            'deviceInfo': {'os': 'Android', 'model': '10'},
+            'eventName': rng.choice(('timeSpent', 'questionView', 'quizAnswer', 'pageBlur')),
+            'eventData': {'url': f"/quiz/page/{page}", 'page': str(page), 'questionId': rng.randrange(1, 100),
+                          'isCorrect': rng.random() < 0.6, 'timestamp': int(time.time() * 1000)},
+        }
+
+    def questions(rng):
+        return f"/api/questions/{rng.randrange(pages)}", None
+
+    def active_user(rng):
+        return '/api/active-user', {'sessionId': f"bench-{rng.randrange(1000)}", 'page': rng.randrange(pages),
+                                    'isActive': rng.random() < 0.95}
+
+    def dashboard_sessions(rng):
+        return f"/api/dashboard/sessions?limit={dashboard_limit}", None
+
+    def quiz_dashboard(rng):
+        return '/api/quiz_dashboard/data', None
+
+    return {
+        'track': ('POST', track, False),
+        'questions': ('GET', questions, False),
+        'active_user': ('POST', active_user, False),
+        'dashboard_sessions': ('GET', dashboard_sessions, True),
+        'quiz_dashboard': ('GET', quiz_dashboard, True),
+    }
+
+
+class _TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+
+    def client(self, admin):
+        client = self.app.test_client()
+        if admin:
+            client.post('/login', data={'username': 'admin', 'password': 'password'})
+        return client
+
+    def send(self, client, method, path, body):
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class _HTTPTransport:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def _request(self, method, path, body=None, headers=None, form=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=300)
+        try:
+            headers = dict(headers or {})
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            elif form is not None:
+                payload = urllib.parse.urlencode(form)
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            response.read()
+            return response
+        finally:
+            conn.close()
+
+    def client(self, admin):
+        if not admin:
+            return {}
+        response = self._request('POST', '/login', form={'username': 'admin', 'password': 'password'})
+        cookie = response.getheader('Set-Cookie', '').split(';', 1)[0]
+        return {'Cookie': cookie}
+
+    def send(self, headers, method, path, body):
+        return self._request(method, path, body, headers).status
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest rank
+    if not sorted_values:
+        return None
+    return sorted_values[max(1, math.ceil(fraction * len(sorted_values))) - 1]
+
+
+def _peak_rss_mb():
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20, 1),
+    }
+
+
+def run_scenario(transport, method, make_request, admin, requests, threads, seed):
+    """Send requests from threads, returns the scenario's measurements"""
+    rng = random.Random(seed)
+    warm_client = transport.client(admin)
+    path, body = make_request(rng)
+    started = time.perf_counter()
+    first_status = transport.send(warm_client, method, path, body)
+    first_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    errors = [0 if first_status < 400 else 1]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(worker_seed):
+        worker_rng = random.Random(worker_seed)
+        client = transport.client(admin)
+        mine = []
+        failed = 0
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            path, body = make_request(worker_rng)
+            started = time.perf_counter()
+            try:
+                status = transport.send(client, method, path, body)
+            except Exception:
+                status = 599
+            mine.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    workers = [threading.Thread(target=worker, args=(seed * 1000 + i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(latencies) / seconds, 1) if seconds > 0 else None,
+        'first_ms': round(first_ms, 2),
+        'p50_ms': _rounded(_percentile(latencies, 0.50)),
+        'p95_ms': _rounded(_percentile(latencies, 0.95)),
+        'p99_ms': _rounded(_percentile(latencies, 0.99)),
+        'max_ms': _rounded(latencies[-1] if latencies else None),
+        'peak_rss_mb_after': _peak_rss_mb()['self'],
+    }
+
+
+def _rounded(value):
+    return None if value is None else round(value, 2)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(data_dir, scenarios=DEFAULT_SCENARIOS, requests=500, threads=8, mode='client',
+                  dashboard_limit=100, seed=0):
+    """Run the scenarios against the app serving data_dir, returns the report dict
+
+    mode is 'client' (Flask test clients in this process) or 'http' (a local
+    threaded server on an ephemeral port).
+    """
+    import flask_app
+
+    manifest = read_manifest(data_dir) or {}
+    pages = manifest.get('pages') or 1
+    available = _scenarios(pages, dashboard_limit)
+    unknown = [name for name in scenarios if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+
+    previous_data_dir = flask_app.DATA_DIR
+    flask_app.DATA_DIR = os.path.abspath(data_dir)
+    server = None
+    try:
+        if mode == 'http':
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass  # One access log line per request would be measured too
+
+            server = make_server('127.0.0.1', 0, flask_app.app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+            transport = _HTTPTransport('127.0.0.1', server.server_port)
+        elif mode == 'client':
+            transport = _TestClientTransport(flask_app.app)
+        else:
+            raise ValueError(f"Unknown mode {mode!r}")
+
+        results = {}
+        for number, name in enumerate(scenarios):
+            method, make_request, admin = available[name]
+            results[name] = run_scenario(transport, method, make_request, admin, requests, threads,
+                                         seed + number)
+    finally:
+        if server is not None:
+            server.shutdown()
+        flask_app.DATA_DIR = previous_data_dir
+    # Before anything else is started, a forked child would count as a child's peak
+    peak_rss = _peak_rss_mb()
+
+    return {
+        'version': REPORT_VERSION,
+        'id': uuid.uuid4().hex,
+        'commit': _git_commit(),
+        'finished_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'storage_backend': flask_app.STORAGE_BACKEND,
+            'scan_workers': flask_app.SCAN_WORKERS,
+        },
+        'config': {'mode': mode, 'requests': requests, 'threads': threads,
+                   'dashboard_limit': dashboard_limit, 'seed': seed},
+        'corpus': manifest,
+        'scenarios': results,
+        'peak_rss_mb': peak_rss,
+    }
+
+
+def compare(baseline, candidate, metrics=('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')):
+    """Return rows (scenario, metric, baseline, candidate, ratio) for two reports"""
+    rows = []
+    for name, result in candidate['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        for metric in metrics:
+            old, new = base.get(metric), result.get(metric)
+            ratio = round(new / old, 3) if old and new is not None else None
+            rows.append((name, metric, old, new, ratio))
+    rows.append(('process', 'peak_rss_mb', baseline['peak_rss_mb']['self'], candidate['peak_rss_mb']['self'],
+                 round(candidate['peak_rss_mb']['self'] / baseline['peak_rss_mb']['self'], 3)
+                 if baseline['peak_rss_mb']['self'] else None))
+    return rows
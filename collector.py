@@ -0,0 +1,326 @@
+"""Single-writer ingestion collector for tracking events.
+
+Every web worker process forwards its tracking events to one collector
+process over a Unix domain socket; the collector is the only process that
+appends to the session logs.  Writers never contend for file locks, and
+batches that arrive together are written together: a writer thread takes
+whatever is pending, appends each session's events with one write and acks
+the batches once they are written (and synced, depending on the policy).
+
+The protocol is one JSON object per line in each direction.  A client sends
+``{"batch": {session_id: [event, ...]}}`` and gets ``{"ok": true}`` or
+``{"ok": false, "error": "..."}`` back once the batch has been handled.
+Batches are handled in the order they arrive, so the events of a connection
+(a worker thread) stay in order in every session log.
+
+fsync policies:
+
+* ``always``: the logs written by a group of batches are fsynced before any
+  of them is acked, so an acked event survives a power loss.  One fsync per
+  session per group, however many batches the group holds.
+* ``interval``: logs are fsynced every ``fsync_interval`` seconds, an acked
+  event can be lost in a crash of the machine (not of the process).
+* ``never``: flushing to disk is left to the operating system.
+"""
+import collections
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+# Longest request line accepted, a larger batch is refused
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+
+class CollectorUnavailable(OSError):
+    """The batch was not delivered to the collector, it is safe to write it elsewhere"""
+
+
+class _Pending:
+    __slots__ = ('batch', 'done', 'error')
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.done = threading.Event()
+        self.error = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        with self.server.connections_lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.connection)
+        super().finish()
+
+    def handle(self):
+        collector = self.server.collector
+        while True:
+            line = self.rfile.readline(MAX_FRAME_BYTES + 1)
+            if not line:
+                return
+            if len(line) > MAX_FRAME_BYTES:
+                self._reply({'ok': False, 'error': 'Batch too large'})
+                return
+            try:
+                batch = json.loads(line)['batch']
+                if not isinstance(batch, dict) or not all(isinstance(events, list) for events in batch.values()):
+                    raise ValueError('batch must map session ids to lists of events')
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply({'ok': False, 'error': f"Invalid batch: {e}"})
+                continue
+            error = collector.write(batch)
+            self._reply({'ok': True} if error is None else {'ok': False, 'error': error})
+
+    def _reply(self, message):
+        self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every thread of every worker connects, connect() fails with EAGAIN once the backlog is full
+    request_queue_size = socket.SOMAXCONN
+
+
+class Collector:
+    def __init__(self, write_events, sync_sessions, socket_path, fsync='interval', fsync_interval=1.0):
+        # write_events(session_id, events) appends, sync_sessions(session_ids) fsyncs their logs
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        self._write_events = write_events
+        self._sync_sessions = sync_sessions
+        self.socket_path = socket_path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._dirty = set()  # Sessions written since the last sync
+        self._last_sync = time.monotonic()
+        self._server = None
+        self._writer = None
+        self._stats = {'batches': 0, 'events': 0, 'groups': 0, 'syncs': 0, 'write_errors': 0}
+
+    def start(self):
+        """Bind the socket and start the writer, returns self"""
+        _remove_stale_socket(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.collector = self
+        self._server.connections = set()
+        self._server.connections_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run, name='collector-writer', daemon=True)
+        self._writer.start()
+        return self
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def serve_in_thread(self):
+        if self._server is None:
+            self.start()
+        threading.Thread(target=self._server.serve_forever, name='collector', daemon=True).start()
+        return self
+
+    def close(self, timeout=5):
+        """Stop accepting batches, finish the pending ones and remove the socket"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            # Batches being handled still get their reply, unread ones are not written
+            # and their clients see the connection close
+            with self._server.connections_lock:
+                for conn in self._server.connections:
+                    try:
+                        conn.shutdown(socket.SHUT_RD)
+                    except OSError:
+                        pass
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer is not None:
+            self._writer.join(timeout)
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, pending_batches=len(self._pending))
+
+    def write(self, batch):
+        """Queue a batch for the writer and wait for it, returns None or an error message"""
+        pending = _Pending(batch)
+        with self._cond:
+            if self._closed:
+                return 'Collector is shutting down'
+            self._pending.append(pending)
+            self._cond.notify_all()
+        pending.done.wait()
+        return pending.error
+
+    def _take_pending(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                timeout = None
+                if self.fsync == 'interval' and self._dirty:
+                    timeout = self._last_sync + self.fsync_interval - time.monotonic()
+                    if timeout <= 0:
+                        break
+                self._cond.wait(timeout)
+            group = list(self._pending)
+            self._pending.clear()
+        return group
+
+    def _sync(self, session_ids):
+        try:
+            self._sync_sessions(session_ids)
+        except OSError as e:
+            logger.error("Error syncing %d session logs: %s", len(session_ids), e)
+            return str(e)
+        with self._cond:
+            self._stats['syncs'] += 1
+        return None
+
+    def _run(self):
+        while True:
+            group = self._take_pending()
+            if not group and self._closed:
+                if self._dirty:
+                    self._sync(sorted(self._dirty))
+                return
+            # Each session's events of the whole group, in arrival order, with one write
+            by_session = {}
+            for pending in group:
+                for session_id, events in pending.batch.items():
+                    by_session.setdefault(session_id, []).extend(events)
+            failed = {}
+            for session_id, events in by_session.items():
+                try:
+                    self._write_events(session_id, events)
+                except Exception as e:
+                    logger.error("Error writing %d events for session %s: %s", len(events), session_id, e)
+                    failed[session_id] = str(e)
+            written = [session_id for session_id in by_session if session_id not in failed]
+            sync_error = None
+            if self.fsync == 'always' and written:
+                sync_error = self._sync(written)
+            elif self.fsync == 'interval':
+                self._dirty.update(written)
+                if self._dirty and time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync(sorted(self._dirty))
+                    self._dirty.clear()
+                    self._last_sync = time.monotonic()
+            with self._cond:
+                self._stats['groups'] += 1 if group else 0
+                self._stats['batches'] += len(group)
+                self._stats['events'] += sum(len(events) for events in by_session.values())
+                self._stats['write_errors'] += len(failed)
+            for pending in group:
+                errors = [failed[session_id] for session_id in pending.batch if session_id in failed]
+                if errors:
+                    pending.error = errors[0]
+                elif sync_error is not None:
+                    pending.error = f"Written but not synced: {sync_error}"
+                pending.done.set()
+
+
+def _remove_stale_socket(path):
+    """Remove a socket file left by a collector that is gone, refuse to replace a live one"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+    else:
+        raise RuntimeError(f"A collector is already listening on {path}")
+    finally:
+        probe.close()
+
+
+class CollectorClient:
+    """Forwards batches to a collector, one connection per thread (and per process)"""
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        """Return (socket, reader, reused)"""
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork would be shared with the parent
+        if conn is not None and self._local.pid == os.getpid():
+            return conn + (True,)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise CollectorUnavailable(f"Cannot connect to the collector at {self.socket_path}: {e}") from e
+        self._local.conn = (sock, sock.makefile('rb'))
+        self._local.pid = os.getpid()
+        return self._local.conn + (False,)
+
+    def _drop(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def send(self, events_by_session):
+        """Deliver {session_id: [events]} and wait until the collector has written it
+
+        Raises CollectorUnavailable if the batch certainly did not reach the
+        collector, OSError for any other failure (it may then have been
+        written).  A batch is only sent again when not a byte of it went out,
+        so a retry can never write it twice.
+        """
+        payload = json.dumps({'batch': events_by_session}, ensure_ascii=False).encode('utf-8') + b'\n'
+        while True:
+            sock, reader, reused = self._connection()
+            sent = 0
+            try:
+                while sent < len(payload):
+                    sent += sock.send(payload[sent:])
+                reply = reader.readline()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                self._drop()
+                if not sent:
+                    if reused:
+                        continue  # The collector restarted since this connection was opened
+                    raise CollectorUnavailable(f"Collector connection failed: {e}") from e
+                raise OSError(f"Collector connection failed: {e}") from e
+            except OSError:
+                self._drop()
+                raise
+            if not reply:
+                # The collector may have written the batch before it went away
+                self._drop()
+                raise OSError('Collector closed the connection')
+            break
+        reply = json.loads(reply)
+        if not reply.get('ok'):
+            raise OSError(f"Collector refused the batch: {reply.get('error')}")
+
+    def close(self):
+        self._drop()
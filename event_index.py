@@ -0,0 +1,242 @@
+"""Byte-offset index of the events of each session, for the dashboard's event windows.
+
+For every event the index keeps which file it is in, its byte position and
+length, its interned event name and its timestamp, and for events of compact
+files the header they are decoded with.  A window of events,
+filtered by name or time range, is selected from those columns and only the
+selected events are read (with a seek) and parsed.
+
+Indexes are stored per session in ``index_dir/<session_id>.json`` together with
+the size/mtime of the files they describe.  A grown ``.jsonl`` log is indexed
+from where the previous pass stopped; a changed legacy ``.json`` array is
+scanned again.
+"""
+import collections
+import json
+import os
+import threading
+from datetime import datetime
+
+import session_log
+
+INDEX_VERSION = 2
+
+def _event_time(event):
+    """Event timestamp in milliseconds, None if it has none"""
+    event_data = event.get('eventData') if isinstance(event, dict) else None
+    timestamp = event_data.get('timestamp') if isinstance(event_data, dict) else None
+    if isinstance(timestamp, str):
+        try:
+            return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000
+        except ValueError:
+            return None
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        return None
+    return timestamp
+
+
+def _scan_array(path):
+    """Yield (event, byte_position, byte_length) for each element of a JSON array file"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if not f.read(session_log.READ_CHUNK_SIZE).lstrip(' \t\n\r').startswith('['):
+            raise ValueError(f"{path} does not hold a JSON array")
+        f.seek(0)
+        yield from session_log.iter_json_array(f, session_log.READ_CHUNK_SIZE, spans=True)
+
+
+def _scan_log(path, offset):
+    """Yield (event, byte_position, byte_length, end_offset) for complete lines after offset"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                return
+            position = offset
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield event, position, len(raw), offset
+
+
+def _new_index():
+    return {'version': INDEX_VERSION, 'files': {}, 'names': [], 'headers': [],
+            'file': [], 'pos': [], 'len': [], 'name': [], 'time': [], 'header': []}
+
+
+class EventIndex:
+    def __init__(self, sessions_dir, index_dir, cache_size=16):
+        self.sessions_dir = sessions_dir
+        self.index_dir = index_dir
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()  # session_id -> index, most recent last
+        self._lock = threading.Lock()
+
+    def _index_path(self, session_id):
+        return os.path.join(self.index_dir, session_id + '.json')
+
+    def _load(self, session_id):
+        index = self._cache.get(session_id)
+        if index is not None:
+            self._cache.move_to_end(session_id)
+            return index
+        try:
+            with open(self._index_path(session_id), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION:
+                return index
+        except (OSError, ValueError, AttributeError):
+            pass
+        return None
+
+    def _save(self, session_id, index):
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = self._index_path(session_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'), ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _add(self, index, names, file_number, event, position, length, header=None):
+        name = event.get('eventName') if isinstance(event, dict) else None
+        if not isinstance(name, str):
+            name = None
+        if name not in names:
+            names[name] = len(index['names'])
+            index['names'].append(name)
+        index['file'].append(file_number)
+        index['pos'].append(position)
+        index['len'].append(length)
+        index['name'].append(names[name])
+        index['time'].append(_event_time(event))
+        index['header'].append(header)
+
+    def _build(self, paths):
+        index = _new_index()
+        names = {}
+        for file_number, path in enumerate(paths):
+            st = os.stat(path)
+            stamp = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+            if path.endswith(session_log.LOG_EXT):
+                offset = 0
+                for event, position, length, offset in _scan_log(path, 0):
+                    self._add(index, names, file_number, event, position, length)
+                stamp['offset'] = offset
+            elif path.endswith(session_log.COMPACT_EXT):
+                headers = {}
+                for event, position, length, header in session_log.iter_compact(path):
+                    if header is not None and id(header) not in headers:
+                        headers[id(header)] = len(index['headers'])
+                        index['headers'].append(header)
+                    self._add(index, names, file_number, event, position, length,
+                              None if header is None else headers[id(header)])
+            else:
+                for event, position, length in _scan_array(path):
+                    self._add(index, names, file_number, event, position, length)
+            index['files'][os.path.basename(path)] = stamp
+        return index
+
+    def _refresh(self, session_id):
+        """Return the up to date index of a session, None if the session does not exist"""
+        paths = session_log.session_paths(self.sessions_dir, session_id)
+        if not paths:
+            self._cache.pop(session_id, None)
+            return None
+        index = self._load(session_id)
+        stamps = {}
+        for path in paths:
+            st = os.stat(path)
+            stamps[os.path.basename(path)] = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+        dirty = False
+        if index is None or list(index['files']) != list(stamps):
+            index, dirty = self._build(paths), True
+        else:
+            for file_number, path in enumerate(paths):
+                name = os.path.basename(path)
+                old, new = index['files'][name], stamps[name]
+                if (old['size'], old['mtime']) == (new['size'], new['mtime']):
+                    continue
+                if not name.endswith(session_log.LOG_EXT) or new['size'] < old['offset']:
+                    index, dirty = self._build(paths), True
+                    break
+                names = {event_name: i for i, event_name in enumerate(index['names'])}
+                offset = old['offset']
+                for event, position, length, offset in _scan_log(path, offset):
+                    self._add(index, names, file_number, event, position, length)
+                index['files'][name] = dict(new, offset=offset)
+                dirty = True
+        if dirty:
+            self._save(session_id, index)
+        self._cache[session_id] = index
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return index
+
+    def window(self, session_id, offset=0, limit=None, event_name=None, start=None, end=None):
+        """Return (matching count, events) for a window of a session's events
+
+        Events are filtered by eventName and by timestamp (start inclusive, end
+        exclusive, in milliseconds), then offset/limit select the window.
+        Returns None if the session does not exist.
+        """
+        for attempt in range(2):
+            with self._lock:
+                index = self._refresh(session_id)
+                if index is None:
+                    return None
+                paths = [os.path.join(self.sessions_dir, name) for name in index['files']]
+                selected = range(len(index['pos']))
+                if event_name is not None:
+                    name_id = index['names'].index(event_name) if event_name in index['names'] else -1
+                    selected = [i for i in selected if index['name'][i] == name_id]
+                if start is not None or end is not None:
+                    times = index['time']
+                    selected = [i for i in selected if times[i] is not None
+                                and (start is None or times[i] >= start) and (end is None or times[i] < end)]
+                total = len(selected)
+                selected = selected[offset:None if limit is None else offset + limit]
+                spans = [(index['file'][i], index['pos'][i], index['len'][i], index['names'][index['name'][i]],
+                          index['headers'][index['header'][i]] if index['header'][i] is not None else None)
+                         for i in selected]
+                # The files are opened before the lock is released: an open file keeps the
+                # indexed contents even if compaction replaces or removes it afterwards
+                handles = {}
+                try:
+                    for file_number, *_ in spans:
+                        if file_number not in handles:
+                            handles[file_number] = open(paths[file_number], 'rb')
+                except FileNotFoundError:
+                    for f in handles.values():
+                        f.close()
+                    # Compacted or deleted since the index was refreshed, refreshed again once
+                    self._cache.pop(session_id, None)
+                    if attempt:
+                        raise
+                    continue
+            break
+        events = []
+        try:
+            for file_number, position, length, name, header in spans:
+                f = handles[file_number]
+                f.seek(position)
+                record = json.loads(f.read(length))
+                if paths[file_number].endswith(session_log.COMPACT_EXT):
+                    record = session_log.decode_compact_event(record, name, header)
+                events.append(record)
+        finally:
+            for f in handles.values():
+                f.close()
+        return total, events
+
+    def delete(self, session_id):
+        with self._lock:
+            self._cache.pop(session_id, None)
+            try:
+                os.remove(self._index_path(session_id))
+            except FileNotFoundError:
+                pass
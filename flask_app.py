@@ -1,106 +1,208 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for, send_from_directory
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, abort, g, Response, stream_with_context
 import json
 import os
+import re
 import uuid
 from datetime import datetime
 import html
+import atexit
+import base64
+import hashlib
+import io
+import logging
+import signal
+import time
+import click
+import session_log
+from ingest import WriteBehindQueue
+from collector import Collector, CollectorClient, CollectorUnavailable, FSYNC_POLICIES
+from storage import JsonFileStorage, SQLiteStorage
+from question_bank import validate_question
+from quiz_stats import MAX_PROGRESS_QUESTION_ID, is_progress_event
+from metrics import MetricsRegistry, LATENCY_BUCKETS, SIZE_BUCKETS
+from presence import PresenceTracker, SQLitePresence, CountBroadcaster
+from jobs import JobRunner
+from scan import ScanPool
+from retention import bulk_delete, public_rollup, retention_filters
+from asset_cache import FileAssetCache, Payload, IMMUTABLE_CACHE_CONTROL
+from werkzeug.security import safe_join
 
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this to a secure secret key
 
+# Debug logging on the hot paths is off unless LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
+logger = logging.getLogger(__name__)
+
 # Use absolute path for data directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 
-# Active users tracking
-active_users = {}  # {page: {session_id: timestamp}}
-import threading
-active_users_lock = threading.Lock()
+# Storage backend: 'json' (the files under data/, default) or 'sqlite'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+SQLITE_PATH = os.environ.get('SQLITE_PATH')
+
+# Worker processes the dashboards parse session files on.  The default of 1 parses them in
+# the request thread; several web workers each starting a pool would oversubscribe the CPUs
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', 1))
+scan_pool = ScanPool(SCAN_WORKERS)
+atexit.register(scan_pool.close)
+
+_storages = {}
+
+def get_storage():
+    """Return the storage backend of the current data directory"""
+    key = (STORAGE_BACKEND, DATA_DIR)
+    storage = _storages.get(key)
+    if storage is None:
+        if STORAGE_BACKEND == 'sqlite':
+            storage = SQLiteStorage(SQLITE_PATH or os.path.join(DATA_DIR, 'app.db'))
+        else:
+            storage = JsonFileStorage(DATA_DIR, scanner=scan_pool)
+        _storages[key] = storage
+    return storage
+
+# With INGEST_SOCKET set, tracking events are handed to the collector process
+# (flask --app flask_app run-collector) that does all the writing; without it
+# each worker process appends them itself
+INGEST_SOCKET = os.environ.get('INGEST_SOCKET')
+INGEST_FSYNC = os.environ.get('INGEST_FSYNC', 'interval')
+INGEST_FSYNC_INTERVAL = float(os.environ.get('INGEST_FSYNC_INTERVAL', 1.0))
+ingest_client = CollectorClient(INGEST_SOCKET) if INGEST_SOCKET else None
+
+def record_session_events(session_id, events):
+    """Persist tracking events of one session and update its quiz counters"""
+    if ingest_client is not None:
+        try:
+            ingest_client.send({session_id: events})
+            return
+        except CollectorUnavailable as e:
+            # The collector never saw these events, writing them here loses nothing
+            logger.warning("Writing tracking events directly: %s", e)
+    get_storage().append_events(session_id, events)
+
+# Request metrics, served in the Prometheus text format on /metrics
+metrics = MetricsRegistry()
+metrics.counter('http_requests_total', 'Requests by endpoint, method and status')
+metrics.histogram('http_request_duration_seconds', 'Request latency by endpoint', LATENCY_BUCKETS)
+metrics.histogram('http_response_size_bytes', 'Response body size by endpoint', SIZE_BUCKETS)
+metrics.counter('tracking_ingest_bytes_total', 'Request body bytes received by the tracking endpoints')
+metrics.counter('tracking_ingest_events_total', 'Tracking events accepted by the tracking endpoints')
+metrics.gauge('tracking_queue_events', 'Write-behind tracking queue counters by kind')
+# Optional bearer token so a scraper can read /metrics without an admin session
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+    # Streamed bodies (SSE, NDJSON, files) must not be buffered here just to measure them
+    size = response.content_length if response.is_streamed else response.calculate_content_length()
+    if size is not None:
+        metrics.observe('http_response_size_bytes', size, endpoint=endpoint)
+    return response
+
+def record_tracking_ingest(event_count):
+    metrics.inc('tracking_ingest_bytes_total', request.content_length or 0, endpoint=request.endpoint)
+    metrics.inc('tracking_ingest_events_total', event_count, endpoint=request.endpoint)
+
+# Bulk deletes and retention runs happen in the background, one at a time per process;
+# their state is kept in data/jobs so every worker can report on them
+_job_runners = {}
+
+def get_admin_jobs():
+    """Return the job runner of the current data directory"""
+    runner = _job_runners.get(DATA_DIR)
+    if runner is None:
+        runner = _job_runners[DATA_DIR] = JobRunner(os.path.join(DATA_DIR, 'jobs'))
+    return runner
+
+# Sessions older than this many days are rolled up and deleted by the retention
+# job (apply-retention command or /api/admin/retention/run)
+SESSION_RETENTION_DAYS = int(os.environ['SESSION_RETENTION_DAYS']) if os.environ.get('SESSION_RETENTION_DAYS') else None
+
+# Tracking events posted to /api/track/batch are written by a background thread
+TRACK_QUEUE_MAX_EVENTS = int(os.environ.get('TRACK_QUEUE_MAX_EVENTS', 10000))
+track_queue = WriteBehindQueue(record_session_events, max_pending=TRACK_QUEUE_MAX_EVENTS)
+atexit.register(track_queue.close)
+
+# Active users tracking, sessions drop out 5 minutes after their last heartbeat.
+# The default tracker is per process, run more than one worker process with
+# PRESENCE_BACKEND=sqlite so every worker reports the same counts.
+PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'memory')
+
+def create_presence():
+    if PRESENCE_BACKEND == 'sqlite':
+        path = os.environ.get('PRESENCE_DB_PATH') or os.path.join(DATA_DIR, 'presence.db')
+        return SQLitePresence(path, ttl=300)
+    return PresenceTracker(ttl=300)
+
+presence = create_presence()
+atexit.register(presence.close)
+# Streams of /api/active-users/<page>/stream share one snapshot per second
+presence_broadcaster = CountBroadcaster(lambda: presence.counts(), interval=1.0)
+ACTIVE_USERS_KEEPALIVE = 15
+# Streams end after this many seconds and EventSource reconnects, so a sync worker
+# is not held by one open tab for good
+ACTIVE_USERS_STREAM_SECONDS = 45
 
 # Page title helpers and API endpoints
 def get_page_titles():
-    path = os.path.join(DATA_DIR, 'page-title.json')
-    if not os.path.exists(path):
-        return {}
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    return get_storage().get_page_titles()
 
 def save_page_titles(titles):
-    path = os.path.join(DATA_DIR, 'page-title.json')
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(titles, f, indent=2, ensure_ascii=False)
+    get_storage().save_page_titles(titles)
 
 def update_active_user(session_id, page, is_active=True):
     """Update active user tracking for a specific page"""
-    with active_users_lock:
-        if page not in active_users:
-            active_users[page] = {}
-        
-        if is_active:
-            active_users[page][session_id] = datetime.now().timestamp()
-        else:
-            if session_id in active_users[page]:
-                del active_users[page][session_id]
-        
-        # Clean up old entries (older than 5 minutes)
-        current_time = datetime.now().timestamp()
-        active_users[page] = {
-            sid: ts for sid, ts in active_users[page].items() 
-            if current_time - ts < 300  # 5 minutes
-        }
+    presence.touch(session_id, page, is_active)
 
 def get_active_users_count(page):
     """Get the number of active users on a specific page"""
-    with active_users_lock:
-        if page not in active_users:
-            return 0
-        return len(active_users[page])
+    return presence.count(page)
 
 
 # Load users from JSON file
 
+def get_question_bank():
+    """Return the in-memory question bank of the current storage"""
+    return get_storage().questions
+
 # Function to get all questions from all files
 def get_all_questions():
-    all_questions = []
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR, exist_ok=True)
         return []
-    # Get all question files and sort them
-    question_files = [f for f in os.listdir(DATA_DIR) if f.startswith('questions_') and f.endswith('.json')]
-    question_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
-    for filename in question_files:
-        filepath = os.path.join(DATA_DIR, filename)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                questions = json.load(f)
-                all_questions.extend(questions)
-        except Exception as e:
-            print(f"Error loading {filename}: {e}")
-    return all_questions
+    return get_question_bank().all_questions()
 
 # Function to save all questions back to files
 def save_all_questions(questions):
-    # Clear existing files
-    for filename in os.listdir(DATA_DIR):
-        if filename.startswith('questions_') and filename.endswith('.json'):
-            os.remove(os.path.join(DATA_DIR, filename))
-    # Group questions by page
-    pages = {}
-    for q in questions:
-        page_num = q.get('page', 0)
-        if page_num not in pages:
-            pages[page_num] = []
-        pages[page_num].append(q)
-    # Save each page to a file
-    for page_num, page_questions in pages.items():
-        filename = f'questions_{page_num}.json'
-        filepath = os.path.join(DATA_DIR, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(page_questions, f, indent=2, ensure_ascii=False)
+    """Rewrite the page files whose questions changed, each one atomically
+
+    Callers doing a read-modify-write should hold question_write_lock() around
+    both steps so concurrent admin edits do not overwrite each other.
+    """
+    with question_write_lock():
+        get_question_bank().save(questions)
+
+def question_write_lock():
+    return get_question_bank().write_lock
+
+def get_total_questions():
+    """Count the questions of all pages the same way the quiz front end does"""
+    return get_question_bank().total_count()
+
+def invalidate_question_caches():
+    get_question_bank().bump()
 
 def cleanup_question_whitespace():
     """Clean up whitespace in existing questions"""
@@ -140,38 +242,58 @@ def cleanup_question_whitespace():
         
         if cleaned:
             save_all_questions(all_questions)
-            print("Cleaned up whitespace in questions")
+            logger.info("Cleaned up whitespace in questions")
         
         return cleaned
     except Exception as e:
-        print(f"Error cleaning up whitespace: {e}")
+        logger.error("Error cleaning up whitespace: %s", e)
         return False
 
 # Function to get questions for a specific page
 def get_questions_for_page(page_num):
-    print(f"get_questions_for_page called with page_num: {page_num}, type: {type(page_num)}")
-    questions = []
-    filename = f'questions_{page_num}.json'
-    filepath = os.path.join(DATA_DIR, filename)
-    print(f"Looking for file: {filepath}")
-    print(f"File exists: {os.path.exists(filepath)}")
-    if not os.path.exists(filepath):
-        print(f"File {filepath} does not exist")
-        return None
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            file_content = f.read()
-            print(f"File content length: {len(file_content)} characters")
-            print(f"First 200 characters: {file_content[:200]}")
-            questions = json.loads(file_content)
-            print(f"Successfully loaded {len(questions)} questions from {filename}")
-    except Exception as e:
-        print(f"Error loading {filename}: {e}")
-        print(f"Exception type: {type(e)}")
-        import traceback
-        traceback.print_exc()
+    """Return the questions of a page from the question bank, None if it does not exist"""
+    return get_question_bank().page(page_num)
+
+# Serialized (and compressed) /api/questions/<page> bodies: {(bank, page): (bank version, payload)}
+_question_page_payloads = {}
+
+def get_question_page_payload(page_num):
+    bank = get_question_bank()
+    # Read the version first, a reload in between then only costs a rebuild
+    version = bank.current_version()
+    questions = bank.page(page_num)
+    if questions is None:
         return None
-    return questions
+    key = (id(bank), page_num)
+    cached = _question_page_payloads.get(key)
+    if cached is None or cached[0] != version:
+        body = app.json.dumps(questions).encode('utf-8') + b'\n'
+        cached = (version, Payload(body, 'application/json'))
+        _question_page_payloads[key] = cached
+    return cached[1]
+
+# Static files and explainer pages are served from memory, precompressed
+asset_cache = FileAssetCache()
+
+@app.url_defaults
+def add_static_fingerprint(endpoint, values):
+    """Add the content fingerprint to static URLs so browsers can cache them for good"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        path = safe_join(app.static_folder, values['filename'])
+        payload = asset_cache.get(path) if path else None
+        if payload is not None:
+            values['v'] = payload.fingerprint
+
+def serve_static(filename):
+    path = safe_join(app.static_folder, filename)
+    payload = asset_cache.get(path) if path else None
+    if payload is None:
+        abort(404)
+    if request.args.get('v') == payload.fingerprint:
+        return payload.response(request, IMMUTABLE_CACHE_CONTROL)
+    return payload.response(request)
+
+app.view_functions['static'] = serve_static
 
 @app.route('/')
 def home():
@@ -186,7 +308,11 @@ def explainer():
 
 @app.route('/explainer_content/<path:filename>')
 def explainer_content(filename):
-    return send_from_directory('templates', 'explainer_content/' + filename)
+    path = safe_join(os.path.join(app.root_path, 'templates', 'explainer_content'), filename)
+    payload = asset_cache.get(path) if path else None
+    if payload is None:
+        abort(404)
+    return payload.response(request)
 
 @app.route('/quiz')
 def index():
@@ -250,168 +376,158 @@ def delete_session(session_id):
     if not session.get('logged_in') or session.get('role') != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
 
-    session_file = os.path.join(DATA_DIR, 'sessions', f"{session_id}.json")
-    if not os.path.exists(session_file):
+    storage = get_storage()
+    if not storage.session_exists(session_id):
         return jsonify({"error": "Session not found"}), 404
 
     try:
-        os.remove(session_file)
+        storage.delete_session(session_id)
         return jsonify({"success": True, "message": "Session deleted successfully"})
     except Exception as e:
         return jsonify({"error": f"Failed to delete session: {str(e)}"}), 500
 
+DASHBOARD_MAX_PAGE_SIZE = 1000
+
+def encode_session_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+def decode_session_cursor(cursor):
+    """Return the sort key encoded in a cursor, raises ValueError if it is not one"""
+    try:
+        start_time, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if isinstance(start_time, bool) or not isinstance(start_time, (int, float)) or not isinstance(session_id, str):
+        raise ValueError("Invalid cursor")
+    return (start_time, session_id)
+
+def parse_time_arg(value):
+    """Milliseconds since the epoch from a number or an ISO date/time"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000
+
+def parse_session_filters(values):
+    """Session filters from query arguments or a JSON body: os, model, ip, from, to"""
+    filters = {field: str(values[field]) for field in ('os', 'model', 'ip') if values.get(field)}
+    if values.get('from'):
+        filters['start_from'] = parse_time_arg(str(values['from']))
+    if values.get('to'):
+        filters['start_to'] = parse_time_arg(str(values['to']))
+    return filters
+
 @app.route('/api/dashboard/sessions')
 def get_dashboard_sessions():
+    """Session rows ordered by start time, newest first unless order=asc
+
+    Optional filters: os, model, ip, from, to (epoch milliseconds or ISO
+    dates, ``to`` is exclusive).  With ``limit`` the JSON list holds at most
+    that many rows and, if there are more, the X-Next-Cursor header carries
+    the ``cursor`` value for the next page.  ``format=ndjson`` streams one
+    row per line as rows are produced; a last ``{"next_cursor": ...}`` line
+    follows when a limit cut the stream short.
+    """
     if not session.get('logged_in') or session.get('role') != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
 
-    sessions_dir = os.path.join(DATA_DIR, 'sessions')
-    if not os.path.exists(sessions_dir):
-        return jsonify([])
-    
-    print(f"Processing sessions from: {sessions_dir}")
-    print(f"Files found: {[f for f in os.listdir(sessions_dir) if f.endswith('.json')]}")
-
-    sessions_summary = []
-    for filename in os.listdir(sessions_dir):
-        if filename.endswith('.json'):
-            session_id = filename.replace('.json', '')
-            session_file = os.path.join(sessions_dir, filename)
-            with open(session_file, 'r', encoding='utf-8') as f:
-                try:
-                    session_data = json.load(f)
-                    if session_data:
-                        first_event = session_data[0]
-                        device_info = first_event.get('deviceInfo', {})
-                        print(f"  First event: {first_event.get('eventName', 'Unknown')} at {first_event.get('eventData', {}).get('timestamp', 'No timestamp')}")
-                        
-                        # Calculate page visit times
-                        page_visits = {}
-                        current_page = None
-                        page_start_time = None
-                        
-                        try:
-                            for event in session_data:
-                                event_name = event.get('eventName')
-                                
-                                # Handle pageView and quizPageNavigation events
-                                if event_name in ['pageView', 'quizPageNavigation']:
-                                    if current_page is not None and page_start_time is not None:
-                                        # Calculate time spent on previous page
-                                        # Handle both ISO string and milliseconds timestamp
-                                        event_timestamp = event.get('eventData', {}).get('timestamp', 0)
-                                        try:
-                                            if isinstance(event_timestamp, str):
-                                                # Convert ISO string to timestamp
-                                                try:
-                                                    event_time = datetime.fromisoformat(event_timestamp.replace('Z', '+00:00')).timestamp() * 1000
-                                                except:
-                                                    event_time = page_start_time
-                                            else:
-                                                event_time = event_timestamp
-                                        except Exception as e:
-                                            print(f"    Error converting event timestamp: {e}")
-                                            event_time = page_start_time
-                                        
-                                        time_spent = (event_time - page_start_time) / 1000 / 60  # Convert to minutes
-                                        if time_spent > 0:  # Only add positive time
-                                            if current_page not in page_visits:
-                                                page_visits[current_page] = 0
-                                            page_visits[current_page] += time_spent
-                                
-                                # Extract page information from current data structure
-                                if event_name == 'quizPageNavigation':
-                                    # For quizPageNavigation, use the 'toPage' field if it exists
-                                    current_page = event.get('eventData', {}).get('toPage')
-                                else:
-                                    # For pageView, extract page from URL or use 'page' field
-                                    url = event.get('eventData', {}).get('url', '')
-                                    if url.startswith('/quiz/page/'):
-                                        # Extract page number from URL like "/quiz/page/0"
-                                        try:
-                                            current_page = str(int(url.split('/')[-1]))
-                                        except (ValueError, IndexError):
-                                            current_page = '0'
-                                    elif url == '/':
-                                        current_page = 'home'
-                                    else:
-                                        current_page = event.get('eventData', {}).get('page', 'unknown')
-                                
-                                page_start_time = event.get('eventData', {}).get('timestamp')
-                        except Exception as e:
-                            print(f"    Error in page visit calculation loop: {e}")
-                            # Continue with empty page_visits if there's an error
-                        
-                        # Add time for the last page if session is still active
-                        if current_page is not None and page_start_time is not None:
-                            if current_page not in page_visits:
-                                page_visits[current_page] = 0
-                            
-                            try:
-                                # Handle both ISO string and milliseconds timestamp for last page
-                                if isinstance(page_start_time, str):
-                                    try:
-                                        last_page_start = datetime.fromisoformat(page_start_time.replace('Z', '+00:00')).timestamp() * 1000
-                                    except:
-                                        last_page_start = page_start_time
-                                else:
-                                    last_page_start = page_start_time
-                                
-                                # Calculate time spent on the last page (current time - last page start time)
-                                current_time = datetime.now().timestamp() * 1000  # Convert to milliseconds
-                                if isinstance(last_page_start, (int, float)) and last_page_start > 0:
-                                    last_page_time = (current_time - last_page_start) / 1000 / 60  # Convert to minutes
-                                    if last_page_time > 0:  # Only add positive time
-                                        page_visits[current_page] += last_page_time
-                            except Exception as e:
-                                print(f"    Error calculating last page time: {e}")
-                                # Continue without adding time for the last page
-                        
-                        # Try to get IP from multiple sources
-                        ip_address = None
-                        # Check if IP exists in the current data structure
-                        if first_event.get('ip'):
-                            ip_address = first_event.get('ip')
-                        elif device_info.get('ip'):
-                            ip_address = device_info.get('ip')
-                        elif first_event.get('eventData', {}).get('ip'):
-                            ip_address = first_event.get('eventData', {}).get('ip')
-                        # For now, set to 'Unknown' if no IP found in current data
-                        if not ip_address:
-                            ip_address = 'Unknown'
-                        
-                        # Handle timestamp conversion for display
-                        start_timestamp = first_event.get('eventData', {}).get('timestamp')
-                        try:
-                            if isinstance(start_timestamp, str):
-                                try:
-                                    start_time = datetime.fromisoformat(start_timestamp.replace('Z', '+00:00')).timestamp() * 1000
-                                except:
-                                    start_time = start_timestamp
-                            else:
-                                start_time = start_timestamp
-                        except Exception as e:
-                            print(f"    Error converting start timestamp: {e}")
-                            start_time = start_timestamp
-                        
-                        session_summary = {
-                            "id": session_id,
-                            "os": device_info.get('os', 'Unknown'),
-                            "model": device_info.get('model', 'Unknown'),
-                            "ip": ip_address or 'Unknown',
-                            "start_time": start_time,
-                            "page_visits": page_visits
-                        }
-                        print(f"  Adding session: {session_summary}")
-                        sessions_summary.append(session_summary)
-                except json.JSONDecodeError as e:
-                    print(f"  JSON decode error in {filename}: {e}")
-                    continue
-                except Exception as e:
-                    print(f"  Error processing {filename}: {e}")
-                    continue
-    print(f"Returning {len(sessions_summary)} sessions")
-    return jsonify(sessions_summary)
+    try:
+        filters = parse_session_filters(request.args)
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 1 <= limit <= DASHBOARD_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {DASHBOARD_MAX_PAGE_SIZE}")
+        after = decode_session_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    descending = request.args.get('order', 'desc') != 'asc'
+
+    # Rows come from the summary index, only sessions whose files changed
+    # since the last call are (partially) replayed. One extra row tells
+    # whether there is a next page.
+    rows = get_storage().query_session_summaries(
+        filters, after, descending, None if limit is None else limit + 1)
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            last_key = None
+            for count, (key, row) in enumerate(rows):
+                if limit is not None and count == limit:
+                    yield json.dumps({"next_cursor": encode_session_cursor(last_key)}) + '\n'
+                    break
+                last_key = key
+                yield json.dumps(row) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    page = list(rows)
+    response = jsonify([row for key, row in page[:limit]])
+    if limit is not None and len(page) > limit:
+        response.headers['X-Next-Cursor'] = encode_session_cursor(page[limit - 1][0])
+    return response
+
+
+@app.route('/api/dashboard/rollups')
+def get_dashboard_rollups():
+    """Per-day aggregates of sessions removed by retention or bulk deletes
+
+    Optional from/to (YYYY-MM-DD, inclusive) select the days.
+    """
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    rollups = get_storage().rollups.days(request.args.get('from'), request.args.get('to'))
+    return jsonify([public_rollup(rollup) for rollup in rollups])
+
+
+@app.route('/api/admin/sessions/bulk-delete', methods=['POST'])
+def bulk_delete_sessions():
+    """Delete every session matching the filters in a background job
+
+    The JSON body takes the dashboard filters (os, model, ip, from, to), at
+    least one is required, and ``rollup`` (default true) to keep the
+    sessions' per-day aggregates.  Poll /api/admin/jobs/<id> for progress.
+    """
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        filters = parse_session_filters(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not filters:
+        return jsonify({"error": "At least one filter is required"}), 400
+    job = get_admin_jobs().submit('bulk-delete', bulk_delete, get_storage(), filters, rollup=bool(data.get('rollup', True)))
+    return jsonify(job), 202
+
+
+@app.route('/api/admin/retention/run', methods=['POST'])
+def run_retention():
+    """Roll up and delete sessions that started more than ``days`` days ago"""
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) or {}
+    days = data.get('days', SESSION_RETENTION_DAYS)
+    if isinstance(days, bool) or not isinstance(days, int) or days < 0:
+        return jsonify({"error": "days must be a non-negative integer (or set SESSION_RETENTION_DAYS)"}), 400
+    filters = retention_filters(days, time.time() * 1000)
+    job = get_admin_jobs().submit('retention', bulk_delete, get_storage(), filters, rollup=True,
+                                  undated_before=filters['start_to'])
+    return jsonify(job), 202
+
+
+@app.route('/api/admin/jobs')
+def list_jobs():
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(get_admin_jobs().list())
+
+
+@app.route('/api/admin/jobs/<job_id>')
+def get_job(job_id):
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    job = get_admin_jobs().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
 
 @app.route('/api/dashboard/session/<session_id>')
@@ -419,16 +535,34 @@ def get_session_details(session_id):
     if not session.get('logged_in') or session.get('role') != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
 
-    session_file = os.path.join(DATA_DIR, 'sessions', f"{session_id}.json")
-    if not os.path.exists(session_file):
+    storage = get_storage()
+    if not storage.session_exists(session_id):
         return jsonify({"error": "Session not found"}), 404
 
-    with open(session_file, 'r', encoding='utf-8') as f:
-        try:
-            session_data = json.load(f)
+    window_args = ('offset', 'limit', 'eventName', 'from', 'to')
+    try:
+        if not any(arg in request.args for arg in window_args):
+            session_data = storage.read_events(session_id)
             return jsonify(session_data)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Could not read session data"}), 500
+        # A window of the events, only the selected events are read from disk
+        try:
+            offset = request.args.get('offset', 0, type=int)
+            limit = request.args.get('limit', type=int)
+            if offset < 0 or (limit is not None and limit < 0):
+                raise ValueError("offset and limit must not be negative")
+            start = parse_time_arg(request.args['from']) if request.args.get('from') else None
+            end = parse_time_arg(request.args['to']) if request.args.get('to') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        window = storage.event_window(session_id, offset, limit, request.args.get('eventName') or None, start, end)
+        if window is None:
+            return jsonify({"error": "Session not found"}), 404
+        total, events = window
+        response = jsonify(events)
+        response.headers['X-Total-Count'] = str(total)
+        return response
+    except json.JSONDecodeError:
+        return jsonify({"error": "Could not read session data"}), 500
 
 
 @app.route('/quiz_dashboard')
@@ -442,69 +576,31 @@ def get_quiz_dashboard_data():
     if not session.get('logged_in') or session.get('role') != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
 
-    sessions_dir = os.path.join(DATA_DIR, 'sessions')
-    if not os.path.exists(sessions_dir):
-        return jsonify([])
+    total_questions = get_total_questions()
 
     quiz_data = []
-    
-    # Get total questions count exactly like the frontend does
-    total_questions = 0
-    start_page = 0
-    end_page = 0
-    
-    # Find the range of pages and count total questions
-    question_files = [f for f in os.listdir(DATA_DIR) if f.startswith('questions_') and f.endswith('.json')]
-    if question_files:
-        page_numbers = [int(f.split('_')[1].split('.')[0]) for f in question_files]
-        start_page = min(page_numbers)
-        end_page = max(page_numbers)
-        
-        # Count total questions across all pages
-        for page_num in range(start_page, end_page + 1):
-            questions = get_questions_for_page(page_num)
-            if questions:
-                total_questions += len(questions)
-
-    for filename in os.listdir(sessions_dir):
-        if filename.endswith('.json'):
-            session_id = filename.replace('.json', '')
-            session_file = os.path.join(sessions_dir, filename)
-            with open(session_file, 'r', encoding='utf-8') as f:
-                try:
-                    session_data = json.load(f)
-                    if session_data:
-                        # Get all quiz answers across all pages
-                        quiz_answers = [e for e in session_data if e.get('eventName') == 'quizAnswer']
-                        answered_questions = len(set(e['eventData']['questionId'] for e in quiz_answers))
-                        correct_answers = len([e for e in quiz_answers if e['eventData']['isCorrect']])
-                        
-                        # Calculate progress percentage exactly like the frontend
-                        # This matches the logic in updateProgress() function
-                        progress_percentage = round((answered_questions / total_questions) * 100) if total_questions > 0 else 0
-                        
-                        quiz_data.append({
-                            "id": session_id,
-                            "answered": answered_questions,
-                            "correct": correct_answers,
-                            "total": total_questions,
-                            "progress_percentage": progress_percentage
-                        })
-                except json.JSONDecodeError:
-                    continue
+    for session_id, answered_questions, correct_answers in get_storage().quiz_progress():
+
+        # Calculate progress percentage exactly like the frontend
+        # This matches the logic in updateProgress() function
+        progress_percentage = round((answered_questions / total_questions) * 100) if total_questions > 0 else 0
+
+        quiz_data.append({
+            "id": session_id,
+            "answered": answered_questions,
+            "correct": correct_answers,
+            "total": total_questions,
+            "progress_percentage": progress_percentage
+        })
     return jsonify(quiz_data)
 
 
 @app.route('/api/questions/<int:page>')
 def get_questions(page):
-    print(f"API called for page: {page}, type: {type(page)}")
-    questions = get_questions_for_page(page)
-    print(f"Questions returned: {questions}")
-    if questions is None:
-        print(f"No questions found for page {page}")
+    payload = get_question_page_payload(page)
+    if payload is None:
         return jsonify({"error": "No more questions"}), 404
-    print(f"Returning {len(questions)} questions for page {page}")
-    return jsonify(questions)
+    return payload.response(request)
 @app.route('/api/session', methods=['POST'])
 def save_session():
     if session.get('logged_in'):
@@ -537,38 +633,168 @@ def update_active_user_api():
 
 @app.route('/api/questions/count')
 def get_questions_count():
-    print("get_questions_count called")
     if not os.path.exists(DATA_DIR):
-        print(f"DATA_DIR {DATA_DIR} does not exist")
         return jsonify({"total_pages": 0})
-    question_files = [f for f in os.listdir(DATA_DIR) if f.startswith('questions_') and f.endswith('.json')]
-    print(f"Found question files: {question_files}")
-    if not question_files:
-        print("No question files found")
+    page_numbers = get_question_bank().page_numbers()
+    if not page_numbers:
         return jsonify({"total_pages": 0, "start_page": 0, "end_page": 0})
-    page_numbers = sorted([int(f.split('_')[1].split('.')[0]) for f in question_files])
-    print(f"Page numbers: {page_numbers}")
-    start_page = page_numbers[0] if page_numbers else 0
-    end_page = page_numbers[-1] if page_numbers else 0
     result = {
-        "total_pages": len(question_files),
-        "start_page": start_page,
-        "end_page": end_page
+        "total_pages": len(page_numbers),
+        "start_page": page_numbers[0],
+        "end_page": page_numbers[-1]
     }
-    print(f"Returning: {result}")
     return jsonify(result)
 
+_questions_summary_cache = {}
+
+def get_questions_summary():
+    """Return the per-page counts, titles and page range, rebuilt only when those change"""
+    storage = get_storage()
+    bank = storage.questions
+    key = (id(storage), bank.current_version(), storage.page_titles_version())
+    cached = _questions_summary_cache.get('summary')
+    if cached is None or cached[0] != key:
+        page_numbers = bank.page_numbers()
+        counts = {str(page_num): len(bank.page(page_num)) for page_num in page_numbers}
+        summary = {
+            "total_pages": len(page_numbers),
+            "start_page": page_numbers[0] if page_numbers else 0,
+            "end_page": page_numbers[-1] if page_numbers else 0,
+            "total_questions": sum(counts.values()),
+            "counts": counts,
+            "titles": get_page_titles()
+        }
+        # Content based so every worker process hands out the same ETag
+        etag = hashlib.md5(json.dumps(summary, sort_keys=True).encode('utf-8')).hexdigest()
+        cached = (key, summary, etag)
+        _questions_summary_cache['summary'] = cached
+    return cached[1], cached[2]
+
+@app.route('/api/questions/summary')
+def get_questions_summary_api():
+    """Question counts per page, page titles and the page range in one response"""
+    summary, etag = get_questions_summary()
+    response = jsonify(summary)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# Page bitsets of question ids: {(storage, bank version): {page: (bitset, question count)}}
+_question_page_masks = {}
+
+def get_question_page_masks():
+    storage = get_storage()
+    bank = storage.questions
+    key = (id(storage), bank.current_version())
+    masks = _question_page_masks.get(key)
+    if masks is None:
+        masks = {}
+        for page_num in bank.page_numbers():
+            questions = bank.page(page_num)
+            mask = 0
+            for question in questions:
+                question_id = question.get('id') if isinstance(question, dict) else None
+                if isinstance(question_id, int) and 0 <= question_id <= MAX_PROGRESS_QUESTION_ID:
+                    mask |= 1 << question_id
+            masks[page_num] = (mask, len(questions))
+        _question_page_masks.clear()
+        _question_page_masks[key] = masks
+    return masks
+
+# Tracking session ids are UUIDs generated by the client
+PROGRESS_SESSION_ID = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+def bit_ids(bits):
+    """Return the question ids set in a bitset, in increasing order"""
+    ids = []
+    while bits:
+        low = bits & -bits
+        ids.append(low.bit_length() - 1)
+        bits ^= low
+    return ids
+
+@app.route('/api/progress')
+def get_quiz_progress():
+    """Quiz progress of the caller's tracking session, built from its quizAnswer events
+
+    The session is the one of the caller's tracking cookie.  Returns the
+    answered and correct totals and, per page of the current questions, the
+    counts and question ids.  Events still queued for writing are not
+    included, the client applies the ones it sent recently itself.
+    """
+    session_id = request.cookies.get('user_session_id')
+    if not session_id or not PROGRESS_SESSION_ID.fullmatch(session_id):
+        return jsonify({"error": "A tracking session cookie is required"}), 400
+
+    answered, correct = get_storage().session_progress(session_id)
+    pages = {}
+    for page_num, (mask, total) in get_question_page_masks().items():
+        answered_ids = bit_ids(answered & mask)
+        correct_ids = bit_ids(correct & mask)
+        pages[str(page_num)] = {
+            "answered": len(answered_ids),
+            "correct": len(correct_ids),
+            "total": total,
+            "answered_ids": answered_ids,
+            "correct_ids": correct_ids,
+        }
+    response = jsonify({
+        "answered": sum(counts["answered"] for counts in pages.values()),
+        "correct": sum(counts["correct"] for counts in pages.values()),
+        "total_questions": sum(counts["total"] for counts in pages.values()),
+        "pages": pages,
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/api/active-users/<int:page>')
 def get_active_users_count_api(page):
     """Get the number of active users on a specific page"""
     count = get_active_users_count(page)
     return jsonify({"page": page, "active_users": count})
 
+@app.route('/api/active-users/<int:page>/stream')
+def stream_active_users_count(page):
+    """Server-Sent Events stream of a page's active user count, sent only when it changes
+
+    The stream ends after ACTIVE_USERS_STREAM_SECONDS, the browser then
+    reconnects on its own.
+    """
+    def generate():
+        count = get_active_users_count(page)
+        yield f"retry: 5000\ndata: {json.dumps({'page': page, 'active_users': count})}\n\n"
+        deadline = time.monotonic() + ACTIVE_USERS_STREAM_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            new_count = presence_broadcaster.wait_for_change(page, count, min(ACTIVE_USERS_KEEPALIVE, remaining))
+            if new_count == count:
+                # Comment line, keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            count = new_count
+            yield f"data: {json.dumps({'page': page, 'active_users': count})}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/active-users')
+def get_all_active_users_api():
+    """Get the number of active users on every page with at least one"""
+    pages = {}
+    for page, count in presence.counts().items():
+        pages[str(page)] = pages.get(str(page), 0) + count
+    return jsonify({"pages": pages, "total": sum(pages.values())})
+
 @app.route('/api/admin/cleanup-whitespace', methods=['POST'])
 def cleanup_whitespace_api():
     """Clean up whitespace in existing questions"""
     try:
-        cleaned = cleanup_question_whitespace()
+        with question_write_lock():
+            cleaned = cleanup_question_whitespace()
         return jsonify({"success": True, "cleaned": cleaned})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -587,28 +813,19 @@ def admin_add_question():
         return jsonify({"error": "Unauthorized"}), 401
     
     data = request.get_json()
-    questions = get_all_questions()
-    
-    # Generate new ID
-    # Generate new ID
-    if questions:
-        new_id = max(q['id'] for q in questions) + 1
-    else:
-        new_id = 1
-    
-    # Sanitize input to prevent XSS
-    new_question = {
-        "id": new_id,
+    try:
+        page = int(data.get('page', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "page must be an integer"}), 400
+
+    # The id comes from the bank's allocator, ids are never reused
+    new_question = get_question_bank().add({
         "question": data.get('question', ''),
         "options": data.get('options', []),
         "correct_answer": data.get('correct_answer'),
         "explanation": data.get('explanation', ''),
         "created_at": datetime.now().isoformat(),
-        "page": 0
-    }
-    
-    questions.append(new_question)
-    save_all_questions(questions)
+    }, page=page)
     
     return jsonify({"success": True, "question": new_question})
 
@@ -618,34 +835,27 @@ def admin_update_question(question_id):
         return jsonify({"error": "Unauthorized"}), 401
     
     data = request.get_json()
-    questions = get_all_questions()
-    
-    question_found = False
-    for i, question in enumerate(questions):
-        if question['id'] == question_id:
-            questions.pop(i)
-            question_found = True
-            break
-
-    if not question_found:
-        return jsonify({"error": "Question not found"}), 404
+    try:
+        new_id = int(data.get('id') or question_id)
+        page = int(data.get('page', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "id and page must be integers"}), 400
 
-    # Add the updated question back to the list
     updated_question = {
-        "id": int(data.get('id', question_id)),
+        "id": new_id,
         "question": data.get('question', ''),
         "options": data.get('options', []),
         "correct_answer": data.get('correct_answer'),
         "explanation": data.get('explanation', ''),
-        "page": int(data.get('page', 0)),
+        "page": page,
         "updated_at": datetime.now().isoformat()
     }
-    questions.append(updated_question)
-    
-    # Sort questions by new ID to maintain order
-    questions.sort(key=lambda q: q['id'])
-    
-    save_all_questions(questions)
+    try:
+        updated = get_question_bank().update(question_id, updated_question)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    if updated is None:
+        return jsonify({"error": "Question not found"}), 404
     return jsonify({"success": True})
 
 @app.route('/api/admin/question/<int:question_id>', methods=['DELETE'])
@@ -653,43 +863,150 @@ def admin_delete_question(question_id):
     if not session.get('logged_in') or session.get('role') != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    questions = get_all_questions()
-    questions = [q for q in questions if q['id'] != question_id]
-    
-    # Re-assign IDs to maintain sequential order
-    for i, question in enumerate(questions):
-        question['id'] = i + 1
-        
-    save_all_questions(questions)
+    # Other questions keep their ids, answers logged for them stay valid
+    if not get_question_bank().delete(question_id):
+        return jsonify({"error": "Question not found"}), 404
     
     return jsonify({"success": True})
 
+def parse_question_moves(items):
+    """Return [(id, page, position)] for [{id, page, position}], raises ValueError"""
+    if not isinstance(items, list):
+        raise ValueError("moves must be a list")
+    moves = []
+    for item in items:
+        if not isinstance(item, dict) or 'id' not in item:
+            raise ValueError("Each move needs an id")
+        position = item.get('position')
+        try:
+            moves.append((int(item['id']), int(item.get('page', 0)),
+                          None if position is None else int(position)))
+        except (TypeError, ValueError):
+            raise ValueError("id, page and position must be integers")
+    return moves
+
+@app.route('/api/admin/questions/reorder', methods=['PATCH'])
+def admin_move_questions():
+    """Move only the questions listed in {"moves": [{id, page, position}]}
+
+    position is the question's index in its target page after the move,
+    questions that are not listed keep their page and relative order.
+    """
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        moves = parse_question_moves(data.get('moves', []))
+        changed = get_question_bank().move(moves)
+    except KeyError as e:
+        return jsonify({"error": f"Question {e.args[0]} not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "pages": changed})
+
 @app.route('/api/admin/questions/reorder', methods=['POST'])
 def admin_reorder_questions():
+    """Lay out the listed questions in list order, {"questions": [{id, page}]}"""
     if not session.get('logged_in') or session.get('role') != 'admin':
         return jsonify({"error": "Unauthorized"}), 401
     
-    data = request.get_json()
-    updated_questions_info = data.get('questions', [])
-    
-    all_questions = get_all_questions()
-    question_dict = {q['id']: q for q in all_questions}
-    
-    reordered_questions = []
-    for info in updated_questions_info:
-        qid = info.get('id')
-        if qid in question_dict:
-            question = question_dict[qid]
-            question['page'] = info.get('page', 0)
-            reordered_questions.append(question)
-
-    # Re-assign IDs to maintain sequential order
-    for i, question in enumerate(reordered_questions):
-        question['id'] = i + 1
-            
-    save_all_questions(reordered_questions)
+    data = request.get_json(silent=True) or {}
+    try:
+        items = parse_question_moves(data.get('questions', []))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    bank = get_question_bank()
+    moves = []
+    positions = {}
+    for qid, page, _ in items:
+        if bank.get(qid) is not None:
+            moves.append((qid, page, positions.get(page, 0)))
+            positions[page] = positions.get(page, 0) + 1
+    try:
+        bank.move(moves)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"success": True})
 
+@app.route('/api/admin/questions/export')
+def admin_export_questions():
+    """Stream every question as NDJSON, one per line in page and position order"""
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+
+    bank = get_question_bank()
+    # The page lists are replaced, never modified, so this is a consistent snapshot
+    pages = [bank.page(page_num) or [] for page_num in bank.page_numbers()]
+
+    def generate():
+        for questions in pages:
+            for question in questions:
+                yield json.dumps(question, ensure_ascii=False) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=questions.ndjson'})
+
+# Invalid records listed in the response to an import, the others are only counted
+IMPORT_MAX_ERRORS = 50
+
+def read_question_import(stream, json_array):
+    """Parse and validate an uploaded import as it streams in
+
+    Returns (questions, errors, invalid), errors being [{"record": n,
+    "error": ...}] for the first IMPORT_MAX_ERRORS of the invalid records
+    (numbered from 1).
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    if json_array:
+        records = ((None, record) for record in session_log.iter_json_array(text))
+    else:
+        records = ((line, None) for line in text if line.strip())
+    questions = []
+    errors = []
+    invalid = 0
+    for number, (line, record) in enumerate(records, 1):
+        try:
+            if line is not None:
+                record = json.loads(line)
+            validate_question(record)
+        except ValueError as e:
+            invalid += 1
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({"record": number, "error": str(e)})
+            continue
+        questions.append(record)
+    return questions, errors, invalid
+
+@app.route('/api/admin/questions/import', methods=['POST'])
+def admin_import_questions():
+    """Import questions from an NDJSON body (or a JSON array with a JSON content type)
+
+    Nothing is written unless every record is valid; the import is then
+    applied with one write per changed page and one cache invalidation.
+    mode=merge (the default) adds new questions and replaces those whose id
+    exists, mode=replace makes the import the whole question bank.
+    """
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+
+    mode = request.args.get('mode', 'merge')
+    if mode not in ('merge', 'replace'):
+        return jsonify({"error": "mode must be merge or replace"}), 400
+    try:
+        questions, errors, invalid = read_question_import(request.stream, request.mimetype == 'application/json')
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Unreadable import: {e}"}), 400
+    if invalid:
+        return jsonify({"error": f"{invalid} invalid questions, nothing was imported",
+                        "invalid": invalid, "errors": errors}), 400
+
+    try:
+        result = get_question_bank().import_questions(questions, replace=mode == 'replace')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(result, success=True))
+
 @app.route('/api/page-titles', methods=['GET'])
 def api_get_page_titles():
     return jsonify(get_page_titles())
@@ -729,32 +1046,147 @@ def track_session_data():
     if not session_id:
         return jsonify({"error": "Session ID is required"}), 400
 
-    # Do not track logged-in users (i.e., admins)
+    # Do not track logged-in users (i.e., admins), only keep their quiz progress
     if session.get('logged_in'):
+        get_storage().record_progress(session_id, [data])
         return jsonify({"success": True, "message": "Admin activity not tracked"})
 
-    # Ensure the sessions directory exists
-    sessions_dir = os.path.join(DATA_DIR, 'sessions')
-    os.makedirs(sessions_dir, exist_ok=True)
+    # Append the event to the session log, the cost does not depend on the session length
+    try:
+        record_session_events(session_id, [data])
+    except OSError as e:
+        # E.g. the collector refused the event or went away after reading it
+        logger.error("Error recording tracking event of session %s: %s", session_id, e)
+        return jsonify({"error": "The event could not be stored, it may have been written",
+                        "possibly_written": True}), 503
+    record_tracking_ingest(1)
+
+    return jsonify({"success": True})
+
 
-    # Save data to a session-specific file
-    session_file = os.path.join(sessions_dir, f"{session_id}.json")
+@app.route('/api/track/batch', methods=['POST'])
+def track_session_batch():
+    """Queue a batch of tracking events for the background writer"""
+    # sendBeacon posts a Blob, so do not insist on the JSON content type
+    data = request.get_json(force=True, silent=True)
+    events = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(events, list):
+        return jsonify({"error": "A list of events is required"}), 400
 
-    # Read existing data and append new event
-    session_data = []
-    if os.path.exists(session_file):
-        with open(session_file, 'r', encoding='utf-8') as f:
-            try:
-                session_data = json.load(f)
-            except json.JSONDecodeError:
-                pass  # Ignore if file is empty or corrupt
+    if session.get('logged_in'):
+        # Not tracked either, only the quiz progress is kept (without a session log)
+        progress = {}
+        for event in events:
+            if is_progress_event(event) and event.get('sessionId'):
+                progress.setdefault(event['sessionId'], []).append(event)
+        for session_id, session_events in progress.items():
+            get_storage().record_progress(session_id, session_events)
+        return jsonify({"success": True, "message": "Admin activity not tracked"})
 
-    session_data.append(data)
+    by_session = {}
+    skipped = 0
+    for event in events:
+        session_id = event.get('sessionId') if isinstance(event, dict) else None
+        if not session_id:
+            skipped += 1
+            continue
+        by_session.setdefault(session_id, []).append(event)
 
-    with open(session_file, 'w', encoding='utf-8') as f:
-        json.dump(session_data, f, indent=2)
+    if not track_queue.submit(by_session):
+        response = jsonify({"error": "Tracking queue is full", "stats": track_queue.stats()})
+        response.headers['Retry-After'] = '5'
+        return response, 503
 
-    return jsonify({"success": True})
+    record_tracking_ingest(len(events) - skipped)
+    return jsonify({"success": True, "accepted": len(events) - skipped, "skipped": skipped})
+
+
+@app.route('/api/track/stats')
+def track_queue_stats():
+    if not session.get('logged_in') or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(track_queue.stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request and ingest metrics in the Prometheus text format"""
+    authorized = session.get('logged_in') and session.get('role') == 'admin'
+    if not authorized and METRICS_TOKEN:
+        authorized = request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if not authorized:
+        return jsonify({"error": "Unauthorized"}), 401
+    for kind, value in track_queue.stats().items():
+        metrics.set('tracking_queue_events', int(value), kind=kind)
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.cli.command('migrate-sessions')
+def migrate_sessions_command():
+    """Convert legacy .json session files to the append-only .jsonl log"""
+    migrated, failed = session_log.migrate_sessions(os.path.join(DATA_DIR, 'sessions'))
+    click.echo(f"Migrated {len(migrated)} sessions, {len(failed)} failed")
+    for session_id in failed:
+        click.echo(f"  failed: {session_id}")
+
+
+@app.cli.command('compact-sessions')
+@click.option('--idle-minutes', default=30, show_default=True,
+              help='Only compact sessions not written to for this long')
+def compact_sessions_command(idle_minutes):
+    """Rewrite idle sessions in the compact .cjsonl encoding"""
+    compacted, failed, before, after = session_log.compact_sessions(
+        os.path.join(DATA_DIR, 'sessions'), idle_seconds=idle_minutes * 60)
+    click.echo(f"Compacted {len(compacted)} sessions ({before} -> {after} bytes), {len(failed)} failed")
+    for session_id in failed:
+        click.echo(f"  failed: {session_id}")
+
+
+@app.cli.command('apply-retention')
+@click.option('--days', type=int, default=None, help='Defaults to SESSION_RETENTION_DAYS')
+def apply_retention_command(days):
+    """Roll up and delete sessions that started more than --days days ago"""
+    days = SESSION_RETENTION_DAYS if days is None else days
+    if days is None:
+        raise click.UsageError('Pass --days or set SESSION_RETENTION_DAYS')
+    filters = retention_filters(days, time.time() * 1000)
+    result = bulk_delete(get_storage(), filters, rollup=True, undated_before=filters['start_to'])
+    click.echo(f"Rolled up and deleted {result['deleted']} of {result['matched']} sessions, "
+               f"{len(result['failed'])} failed")
+
+
+@app.cli.command('run-collector')
+@click.option('--socket', 'socket_path', default=None,
+              help='Unix socket to listen on, defaults to INGEST_SOCKET or data/ingest.sock')
+@click.option('--fsync', type=click.Choice(FSYNC_POLICIES), default=INGEST_FSYNC, show_default=True,
+              help='When appended events are synced to disk')
+@click.option('--fsync-interval', type=float, default=INGEST_FSYNC_INTERVAL, show_default=True,
+              help='Seconds between syncs with --fsync interval')
+def run_collector_command(socket_path, fsync, fsync_interval):
+    """Write the tracking events every worker process forwards to INGEST_SOCKET"""
+    storage = get_storage()
+    collector = Collector(storage.append_events, storage.sync_sessions,
+                          socket_path or INGEST_SOCKET or os.path.join(DATA_DIR, 'ingest.sock'),
+                          fsync=fsync, fsync_interval=fsync_interval)
+    click.echo(f"Collecting tracking events on {collector.socket_path} (fsync: {fsync})")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt  # Finish the pending batches and remove the socket
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        collector.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@app.cli.command('import-sqlite')
+@click.option('--path', default=None, help='Database file, defaults to SQLITE_PATH or data/app.db')
+def import_sqlite_command(path):
+    """Copy questions, page titles and sessions from data/ into the SQLite backend"""
+    target = SQLiteStorage(path or SQLITE_PATH or os.path.join(DATA_DIR, 'app.db'))
+    count = target.import_from(JsonFileStorage(DATA_DIR))
+    click.echo(f"Imported {len(target.questions.all_questions())} questions and {count} sessions into {target.path}")
 
 
 if __name__ == '__main__':
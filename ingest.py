@@ -0,0 +1,131 @@
+"""Write-behind queue for tracking events.
+
+Request threads hand events to the queue and return immediately, a single
+writer thread groups whatever is pending by session and appends each group
+with one write.  The queue is bounded by the number of events not written
+yet, pending or being written; when it is full new batches are rejected (and
+counted) so the caller can retry later instead of the process growing
+without limit.
+"""
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, write_events, max_pending=10000, flush_interval=0.5):
+        # write_events(session_id, events) is called from the writer thread
+        self._write_events = write_events
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending = collections.deque()
+        self._pending_events = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            'accepted_batches': 0,
+            'accepted_events': 0,
+            'rejected_batches': 0,
+            'rejected_events': 0,
+            'written_events': 0,
+            'write_errors': 0,
+            'flushes': 0,
+        }
+
+    def submit(self, events_by_session):
+        """Queue {session_id: [events]} as a whole, returns False if the queue is full
+
+        A batch is either accepted completely or not at all, so a client can
+        safely retry a rejected batch without duplicating events.
+        """
+        count = sum(len(events) for events in events_by_session.values())
+        if not count:
+            return True
+        with self._cond:
+            # Events being written still count, a slow writer must not let the backlog double
+            if self._closed or self._pending_events + self._in_flight + count > self.max_pending:
+                self._stats['rejected_batches'] += 1
+                self._stats['rejected_events'] += count
+                return False
+            for session_id, events in events_by_session.items():
+                self._pending.append((session_id, list(events)))
+            self._pending_events += count
+            self._stats['accepted_batches'] += 1
+            self._stats['accepted_events'] += count
+            self._ensure_started()
+            self._cond.notify_all()
+        return True
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending_events'] = self._pending_events
+            stats['in_flight_events'] = self._in_flight
+            stats['max_pending'] = self.max_pending
+            stats['queue_full'] = self._pending_events + self._in_flight >= self.max_pending
+        return stats
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _ensure_started(self):
+        # Called with the condition held; the thread is started lazily so that
+        # importing the app (tests, CLI commands, the reloader parent) stays cheap
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='track-writer', daemon=True)
+            self._thread.start()
+
+    def _take_pending(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait(self.flush_interval)
+            if not self._pending:
+                return None
+            batches = self._pending
+            self._pending = collections.deque()
+            self._in_flight = self._pending_events
+            self._pending_events = 0
+        return batches
+
+    def _run(self):
+        while True:
+            batches = self._take_pending()
+            if batches is None:
+                return
+            grouped = {}
+            for session_id, events in batches:
+                grouped.setdefault(session_id, []).extend(events)
+            written = errors = 0
+            for session_id, events in grouped.items():
+                try:
+                    self._write_events(session_id, events)
+                    written += len(events)
+                except Exception as e:
+                    logger.error("Error writing %d events for session %s: %s", len(events), session_id, e)
+                    errors += 1
+            with self._cond:
+                self._in_flight = 0
+                self._stats['written_events'] += written
+                self._stats['write_errors'] += errors
+                self._stats['flushes'] += 1
+                self._cond.notify_all()
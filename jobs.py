@@ -0,0 +1,166 @@
+"""Background jobs for long admin operations, with progress reporting.
+
+Jobs run one at a time, in submission order, on a single worker thread that
+is started when the first job is submitted.  Each web worker process has its
+own runner, so the state of the jobs is also written to ``jobs_dir/<id>.json``
+where any process can report on it; a job whose process exited before it
+finished is reported as failed.
+"""
+import collections
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+from question_bank import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+# Progress reports are written at most this often, status changes always
+PROGRESS_SAVE_INTERVAL = 0.5
+
+
+def _process_alive(pid):
+    if os.name != 'posix':
+        return True  # Signal 0 is not a liveness check on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobRunner:
+    def __init__(self, jobs_dir=None, keep_finished=50):
+        # Without jobs_dir the state is only kept in memory
+        self.jobs_dir = jobs_dir
+        self.keep_finished = keep_finished
+        self._jobs = collections.OrderedDict()
+        self._saved_at = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue fn(*args, progress=..., **kwargs), returns the job's status dict
+
+        fn reports progress by calling progress(done, total); its return
+        value becomes the job's result.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'status': 'queued',
+            'done': 0,
+            'total': None,
+            'result': None,
+            'error': None,
+            'submitted_at': time.time(),
+            'finished_at': None,
+            'pid': os.getpid(),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._save(job)
+            self._prune()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='admin-jobs', daemon=True)
+                self._thread.start()
+            snapshot = dict(job)
+        self._queue.put((job_id, fn, args, kwargs))
+        return snapshot
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.jobs_dir is None or not JOB_ID.fullmatch(job_id):
+            return None
+        return self._load(job_id)
+
+    def list(self):
+        with self._lock:
+            jobs = {job_id: dict(job) for job_id, job in self._jobs.items()}
+        for job in self._load_all():
+            jobs.setdefault(job['id'], job)
+        return sorted(jobs.values(), key=lambda job: job['submitted_at'], reverse=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        # Called with the lock held
+        if self.jobs_dir is None:
+            return
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        write_json_atomic(self._path(job['id']), job)
+        self._saved_at[job['id']] = time.monotonic()
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['finished_at'] is None and job['pid'] != os.getpid() and not _process_alive(job['pid']):
+            job.update(status='failed', error='The worker process exited before the job finished')
+        return job
+
+    def _load_all(self):
+        if self.jobs_dir is None or not os.path.isdir(self.jobs_dir):
+            return []
+        jobs = []
+        for filename in os.listdir(self.jobs_dir):
+            job_id, ext = os.path.splitext(filename)
+            if ext == '.json' and JOB_ID.fullmatch(job_id):
+                job = self._load(job_id)
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def _prune(self):
+        # Called with the lock held, only finished jobs are forgotten
+        finished = [job_id for job_id, job in self._jobs.items() if job['finished_at'] is not None]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+            self._saved_at.pop(job_id, None)
+        # Jobs of every process share the directory, and the same limit
+        finished = sorted((job for job in self._load_all() if job['finished_at'] is not None),
+                          key=lambda job: job['submitted_at'])
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            try:
+                os.remove(self._path(job['id']))
+            except FileNotFoundError:
+                pass
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            if not changes.keys() <= {'done', 'total'} or \
+                    time.monotonic() - self._saved_at.get(job_id, 0) >= PROGRESS_SAVE_INTERVAL:
+                self._save(job)
+
+    def _run(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            self._update(job_id, status='running')
+
+            def progress(done, total, job_id=job_id):
+                self._update(job_id, done=done, total=total)
+
+            try:
+                result = fn(*args, progress=progress, **kwargs)
+                self._update(job_id, status='done', result=result, finished_at=time.time())
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                self._update(job_id, status='failed', error=str(e), finished_at=time.time())
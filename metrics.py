@@ -0,0 +1,109 @@
+"""In-process request metrics rendered in the Prometheus text format.
+
+Only counters, gauges and fixed-bucket histograms, which is all the routes
+need; every update is a couple of dict operations under one lock.
+"""
+import threading
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._buckets = {}
+        self._values = {}  # name -> {labels tuple: value or _Histogram}
+
+    def _declare(self, name, kind, help_text, buckets=None):
+        self._help[name] = help_text
+        self._types[name] = kind
+        self._values[name] = {}
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def counter(self, name, help_text):
+        self._declare(name, 'counter', help_text)
+
+    def gauge(self, name, help_text):
+        self._declare(name, 'gauge', help_text)
+
+    def histogram(self, name, help_text, buckets):
+        self._declare(name, 'histogram', help_text, buckets)
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[name][key] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._buckets[name]
+        with self._lock:
+            values = self._values[name]
+            histogram = values.get(key)
+            if histogram is None:
+                histogram = values[key] = _Histogram(buckets)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram.counts[i] += 1
+                    break
+            histogram.total += value
+            histogram.count += 1
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, values in self._values.items():
+                lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {self._types[name]}')
+                for key, value in sorted(values.items()):
+                    if self._types[name] != 'histogram':
+                        lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self._buckets[name], value.counts):
+                        cumulative += count
+                        labels = key + (('le', _format_value(float(bound))),)
+                        lines.append(f'{name}_bucket{_format_labels(labels)} {cumulative}')
+                    labels = key + (('le', '+Inf'),)
+                    lines.append(f'{name}_bucket{_format_labels(labels)} {value.count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {_format_value(value.total)}')
+                    lines.append(f'{name}_count{_format_labels(key)} {value.count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,240 @@
+"""Who is looking at which quiz page, with entries expiring after a TTL.
+
+Sessions are sharded by page so heartbeats for different pages do not contend
+for one lock.  Each shard keeps ``{page: {session_id: deadline_slot}}`` and a
+timing wheel ``{slot: set of (page, session_id)}``: a touch is two dict/set
+operations, and expiry pops whole slots instead of scanning every session.  A
+slot still holding a session that was touched again later is skipped, the
+session is filed under its newer slot as well.
+
+Expired sessions are removed by a background sweep every ``resolution``
+seconds (started lazily) and counts are read without any scan, so a count can
+include a session for at most ``resolution`` seconds past its TTL.
+
+``PresenceTracker`` only sees the heartbeats of its own process.  When the app
+runs in several worker processes, ``SQLitePresence`` keeps the same state in a
+shared SQLite file instead and offers the same methods.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class _Shard:
+    __slots__ = ('lock', 'pages', 'wheel', 'swept_slot')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = {}  # {page: {session_id: deadline slot}}
+        self.wheel = {}  # {deadline slot: {(page, session_id), ...}}
+        self.swept_slot = None
+
+
+class _Sweeping:
+    """Runs self.sweep() every resolution seconds in a daemon thread, started on first use"""
+
+    def __init__(self, ttl, resolution, clock):
+        self.ttl = ttl
+        self.resolution = resolution
+        self.clock = clock
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def close(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._stop.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name='presence-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.resolution):
+            self.sweep()
+
+
+class PresenceTracker(_Sweeping):
+    def __init__(self, ttl=300, resolution=5, shards=16, clock=time.time):
+        super().__init__(ttl, resolution, clock)
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _slot(self, now):
+        return int(now // self.resolution)
+
+    def _shard(self, page):
+        return self._shards[hash(page) % len(self._shards)]
+
+    def touch(self, session_id, page, is_active=True):
+        """Mark session_id as active on page, or remove it when is_active is False"""
+        shard = self._shard(page)
+        with shard.lock:
+            sessions = shard.pages.get(page)
+            if not is_active:
+                if sessions is not None and sessions.pop(session_id, None) is not None and not sessions:
+                    del shard.pages[page]
+                return
+            # Round up so a session never expires before its full TTL has passed
+            deadline = self._slot(self.clock() + self.ttl) + 1
+            if sessions is None:
+                sessions = shard.pages[page] = {}
+            if sessions.get(session_id) == deadline:
+                return
+            sessions[session_id] = deadline
+            shard.wheel.setdefault(deadline, set()).add((page, session_id))
+        self._ensure_started()
+
+    def count(self, page):
+        shard = self._shard(page)
+        with shard.lock:
+            return len(shard.pages.get(page, ()))
+
+    def counts(self):
+        """Return {page: active session count} for every page with active sessions"""
+        result = {}
+        for shard in self._shards:
+            with shard.lock:
+                for page, sessions in shard.pages.items():
+                    result[page] = len(sessions)
+        return result
+
+    def sweep(self, now=None):
+        """Drop every session whose deadline has passed, returns how many were dropped"""
+        current = self._slot(self.clock() if now is None else now)
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                last = shard.swept_slot
+                if last is None or current - last > len(shard.wheel):
+                    # First sweep, or the sweeper fell far behind: scan the wheel instead
+                    due = [slot for slot in shard.wheel if slot <= current]
+                else:
+                    due = [slot for slot in range(last + 1, current + 1) if slot in shard.wheel]
+                shard.swept_slot = current
+                for slot in due:
+                    for page, session_id in shard.wheel.pop(slot):
+                        sessions = shard.pages.get(page)
+                        if sessions is None or sessions.get(session_id) != slot:
+                            continue  # touched again since, filed under a later slot
+                        del sessions[session_id]
+                        removed += 1
+                        if not sessions:
+                            del shard.pages[page]
+        return removed
+
+
+class SQLitePresence(_Sweeping):
+    """PresenceTracker interface over a SQLite table shared by every worker process
+
+    Expired rows are ignored by the count queries, so counts are exact; the
+    background sweep only keeps the table small.  The data is disposable,
+    writes are not synced to disk.
+    """
+
+    def __init__(self, path, ttl=300, resolution=5, clock=time.time):
+        super().__init__(ttl, resolution, clock)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(
+            'CREATE TABLE IF NOT EXISTS presence ('
+            ' page, session_id TEXT NOT NULL, expires REAL NOT NULL,'
+            ' PRIMARY KEY (page, session_id)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS idx_presence_expires ON presence (expires);')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork (gunicorn --preload) must not be reused
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def touch(self, session_id, page, is_active=True):
+        conn = self._connection()
+        if not is_active:
+            conn.execute('DELETE FROM presence WHERE page = ? AND session_id = ?', (page, session_id))
+            return
+        conn.execute(
+            'INSERT INTO presence (page, session_id, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(page, session_id) DO UPDATE SET expires = excluded.expires',
+            (page, session_id, self.clock() + self.ttl))
+        self._ensure_started()
+
+    def count(self, page):
+        row = self._connection().execute(
+            'SELECT COUNT(*) FROM presence WHERE page = ? AND expires > ?', (page, self.clock())).fetchone()
+        return row[0]
+
+    def counts(self):
+        rows = self._connection().execute(
+            'SELECT page, COUNT(*) FROM presence WHERE expires > ? GROUP BY page', (self.clock(),))
+        return dict(rows)
+
+    def sweep(self, now=None):
+        cursor = self._connection().execute(
+            'DELETE FROM presence WHERE expires <= ?', (self.clock() if now is None else now,))
+        return cursor.rowcount
+
+
+class CountBroadcaster:
+    """Fans per-page active user counts out to any number of waiting streams
+
+    One thread snapshots ``get_counts()`` every ``interval`` seconds while
+    anyone is subscribed, so however many heartbeats arrive in between, each
+    stream wakes up at most once per interval and only when its page's count
+    actually changed.
+    """
+
+    def __init__(self, get_counts, interval=1.0):
+        self._get_counts = get_counts
+        self.interval = interval
+        self._counts = {}
+        self._cond = threading.Condition()
+        self._subscribers = 0
+        self._thread = None
+
+    def wait_for_change(self, page, last_count, timeout):
+        """Block until page's count differs from last_count, returns the count (unchanged on timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._subscribers += 1
+            try:
+                self._ensure_started()
+                while True:
+                    count = self._counts.get(page, 0)
+                    remaining = deadline - time.monotonic()
+                    if count != last_count or remaining <= 0:
+                        return count
+                    self._cond.wait(remaining)
+            finally:
+                self._subscribers -= 1
+
+    def _ensure_started(self):
+        # Called with the condition held
+        if self._thread is None or not self._thread.is_alive():
+            self._counts = self._get_counts()
+            self._thread = threading.Thread(target=self._run, name='presence-broadcast', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            counts = self._get_counts()
+            with self._cond:
+                if counts != self._counts:
+                    self._counts = counts
+                    self._cond.notify_all()
+                if not self._subscribers:
+                    self._thread = None
+                    return
@@ -0,0 +1,474 @@
+"""Process-wide in-memory copy of the ``questions_*.json`` files.
+
+The bank is loaded once, with pages indexed by page number and questions by
+id, and revalidated by stat-ing the question files at most once per
+``revalidate_interval`` seconds.  Writers in this process call ``bump()`` so
+their changes are visible immediately; changes made by other processes are
+picked up by the mtime check.
+
+Returned lists are shared with every reader, callers must not modify them
+(``all_questions()`` returns a copy for the admin code that does).
+
+Question ids are stable: they are handed out by a monotonic allocator and
+never reused or renumbered, so ids logged in sessions and kept by clients
+stay valid.  A question's position is its index in its page.  ``add``,
+``update``, ``delete`` and ``move`` rewrite only the pages they change.
+"""
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows, writers are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def question_page_number(filename):
+    """Return N for ``questions_N.json``, None for any other file"""
+    if not (filename.startswith('questions_') and filename.endswith('.json')):
+        return None
+    try:
+        return int(filename[len('questions_'):-len('.json')])
+    except ValueError:
+        return None
+
+
+class WriteLock:
+    """Serializes question writers across threads and, where flock exists, processes"""
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            self._file = open(self.lock_path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+def write_json_atomic(path, data):
+    """Write data through a temp file and os.replace so readers never see a partial file
+
+    The temp file is unique, so threads and processes writing the same path
+    never share one.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _question_id(question):
+    return question.get('id') if isinstance(question, dict) else None
+
+
+def _max_id(by_id):
+    return max((qid for qid in by_id if isinstance(qid, int)), default=0)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_question(record):
+    """Check a question to import, raises ValueError naming the first problem
+
+    Text, at least one option (some questions only link to a solution),
+    options with distinct ids, correct_answer naming one option (or a list
+    of options for multiple answers) and a page number.  id is optional.
+    Answers match option ids regardless of case, as in the questions the
+    bank already holds ("b" for option "B").
+    """
+    if not isinstance(record, dict):
+        raise ValueError("a question must be an object")
+    if not isinstance(record.get('question'), str) or not record['question'].strip():
+        raise ValueError("question must be a non-empty string")
+    options = record.get('options')
+    if not isinstance(options, list) or not options:
+        raise ValueError("options must be a non-empty list")
+    option_ids = set()
+    for option in options:
+        if not (isinstance(option, dict) and isinstance(option.get('id'), str) and option['id'].strip()
+                and isinstance(option.get('text'), str)):
+            raise ValueError("each option needs a non-empty string id and a string text")
+        if option['id'] in option_ids:
+            raise ValueError(f"option id {option['id']!r} appears more than once")
+        option_ids.add(option['id'])
+    option_ids = {option_id.lower() for option_id in option_ids}
+    answer = record.get('correct_answer')
+    answers = answer if isinstance(answer, list) else [answer]
+    if not answers or not all(isinstance(a, str) and a.lower() in option_ids for a in answers):
+        raise ValueError("correct_answer must be an option id or a list of option ids")
+    page = record.get('page', 0)
+    if not _is_int(page) or page < 0:
+        raise ValueError("page must be a non-negative integer")
+    question_id = record.get('id')
+    if question_id is not None and (not _is_int(question_id) or question_id < 1):
+        raise ValueError("id must be a positive integer")
+
+
+class PageEdits:
+    """Per-question edits shared by the banks
+
+    Subclasses provide write_lock, bump(), _ensure_fresh(), the _pages,
+    _by_id and _page_of indexes and the storage methods _last_id(),
+    _store_last_id(last_id) and _write_pages({page: questions}).  Each edit
+    bumps again once the write lock is released, when other connections see
+    the change.
+    """
+
+    def _fresh_pages(self):
+        # Under the write lock: edit what is stored now, not what this process last saw
+        self.bump()
+        self._ensure_fresh()
+        return self._pages
+
+    def allocate_id(self):
+        """Return a question id that was never used, ids of deleted questions are not reused"""
+        with self.write_lock:
+            self._fresh_pages()
+            new_id = max(self._last_id(), _max_id(self._by_id)) + 1
+            self._store_last_id(new_id)
+        return new_id
+
+    def _retire_id(self, question_id):
+        # Recorded so the highest id is not handed out again once it is gone
+        if isinstance(question_id, int) and question_id > self._last_id():
+            self._store_last_id(question_id)
+
+    def add(self, question, page=0):
+        """Append a copy of question to the end of page with a new id, returns the copy"""
+        with self.write_lock:
+            pages = self._fresh_pages()
+            question = dict(question, id=self.allocate_id(), page=page)
+            self._write_pages({page: list(pages.get(page, [])) + [question]})
+        self.bump()
+        return question
+
+    def update(self, question_id, question):
+        """Replace a question, keeping its position unless its page changes
+
+        A question moved to another page goes to the end of it.  Returns the
+        stored question, None if there is no such question.  Raises
+        ValueError if question changes the id to one already in use.
+        """
+        with self.write_lock:
+            pages = self._fresh_pages()
+            if question_id not in self._by_id:
+                return None
+            old_page = self._page_of[question_id]
+            question = dict(question)
+            question.setdefault('id', question_id)
+            question.setdefault('page', old_page)
+            new_id = question['id']
+            if new_id != question_id and new_id in self._by_id:
+                raise ValueError(f"Question id {new_id} is already in use")
+            if new_id != question_id:
+                self._retire_id(question_id)
+            if question['page'] == old_page:
+                self._write_pages({old_page: [question if _question_id(q) == question_id else q
+                                              for q in pages[old_page]]})
+            else:
+                self._write_pages({
+                    question['page']: list(pages.get(question['page'], [])) + [question],
+                    old_page: [q for q in pages[old_page] if _question_id(q) != question_id],
+                })
+        self.bump()
+        return question
+
+    def delete(self, question_id):
+        """Remove a question, returns False if there is no such question"""
+        with self.write_lock:
+            pages = self._fresh_pages()
+            if question_id not in self._by_id:
+                return False
+            page = self._page_of[question_id]
+            self._retire_id(question_id)
+            self._write_pages({page: [q for q in pages[page] if _question_id(q) != question_id]})
+        self.bump()
+        return True
+
+    def move(self, moves):
+        """Move questions, moves is [(question_id, page, position)]
+
+        The moved questions are taken out of their pages, then inserted into
+        their target pages in order of position, each at its position (None
+        meaning the end).  So positions are where the questions end up, and
+        questions that were not moved keep their order.  Raises KeyError for
+        an unknown id, ValueError for an id moved twice.  Returns the page
+        numbers that changed.
+        """
+        with self.write_lock:
+            pages = self._fresh_pages()
+            moved = {}
+            for question_id, page, position in moves:
+                if question_id not in self._by_id:
+                    raise KeyError(question_id)
+                if question_id in moved:
+                    raise ValueError(f"Question {question_id} is moved twice")
+                moved[question_id] = (page, position)
+            touched = {self._page_of[qid] for qid in moved} | {page for page, _ in moved.values()}
+            edited = {page: [q for q in pages.get(page, []) if _question_id(q) not in moved]
+                      for page in touched}
+            for question_id, (page, position) in sorted(
+                    moved.items(), key=lambda item: (item[1][1] is None, item[1][1] or 0)):
+                questions = edited[page]
+                index = len(questions) if position is None else max(0, min(position, len(questions)))
+                questions.insert(index, dict(self._by_id[question_id], page=page))
+            changed = {page: questions for page, questions in edited.items()
+                       if questions != pages.get(page, [])}
+            if changed:
+                self._write_pages(changed)
+        self.bump()
+        return sorted(changed)
+
+    def import_questions(self, questions, replace=False):
+        """Add or replace many questions with one write of the pages they change
+
+        A question with the id of a stored one replaces it, in place if it
+        stays on the same page, otherwise at the end of its page like new
+        questions; questions without an id get new ones.  With replace the
+        bank ends up holding exactly the imported questions, in import order.
+        Returns {'added', 'updated', 'removed', 'pages'}.
+        """
+        ids = [q['id'] for q in questions if q.get('id') is not None]
+        if len(set(ids)) != len(ids):
+            raise ValueError("A question id appears more than once in the import")
+        with self.write_lock:
+            pages = self._fresh_pages()
+            last_id = self._last_id()
+            next_id = max(last_id, _max_id(self._by_id), _max_id(ids))
+            replaced = {}    # Stored questions updated on their page
+            moved_out = set()
+            appended = {}
+            updated = 0
+            for question in questions:
+                question = dict(question)
+                if question.get('id') is None:
+                    next_id += 1
+                    question['id'] = next_id
+                question_id = question['id']
+                page = question.setdefault('page', 0)
+                if question_id in self._by_id:
+                    updated += 1
+                    if not replace and self._page_of[question_id] == page:
+                        replaced[question_id] = question
+                        continue
+                    moved_out.add(question_id)
+                appended.setdefault(page, []).append(question)
+            removed = 0
+            if replace:
+                result = {page: [] for page in pages}
+                result.update(appended)
+                removed = len(self._by_id) - updated
+            else:
+                touched = {self._page_of[qid] for qid in moved_out.union(replaced)} | set(appended)
+                result = {page: [replaced.get(_question_id(q), q) for q in pages.get(page, [])
+                                 if _question_id(q) not in moved_out] + appended.get(page, [])
+                          for page in touched}
+            changed = {page: qs for page, qs in result.items() if qs != pages.get(page, [])}
+            # Once for the whole import, also retires the ids a replace removes
+            if next_id > last_id:
+                self._store_last_id(next_id)
+            if changed:
+                self._write_pages(changed)
+        self.bump()
+        return {
+            'added': len(questions) - updated,
+            'updated': updated,
+            'removed': removed,
+            'pages': sorted(changed),
+        }
+
+
+class QuestionBank(PageEdits):
+    def __init__(self, data_dir, revalidate_interval=1.0):
+        self.data_dir = data_dir
+        self.revalidate_interval = revalidate_interval
+        self.version = 0
+        self._pages = {}
+        self._by_id = {}
+        self._page_of = {}
+        self._stamp = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+        self.write_lock = WriteLock(os.path.join(data_dir, '.questions.lock'))
+
+    def _scan(self):
+        """Return ((page, mtime, size), ...) for the question files on disk"""
+        stamp = []
+        if not os.path.exists(self.data_dir):
+            return ()
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                page_num = question_page_number(entry.name)
+                if page_num is None:
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                stamp.append((page_num, st.st_mtime_ns, st.st_size))
+        return tuple(sorted(stamp))
+
+    def _load(self, stamp):
+        # Pages whose file did not change are kept, only changed files are parsed
+        previous = {page_num: (mtime, size) for page_num, mtime, size in (self._stamp or ())}
+        pages = {}
+        by_id = {}
+        page_of = {}
+        for page_num, mtime, size in stamp:
+            if previous.get(page_num) == (mtime, size) and page_num in self._pages:
+                questions = self._pages[page_num]
+            else:
+                filepath = os.path.join(self.data_dir, f'questions_{page_num}.json')
+                try:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        questions = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.error("Error loading questions_%s.json: %s", page_num, e)
+                    continue
+            pages[page_num] = questions
+            for question in questions:
+                if isinstance(question, dict) and 'id' in question:
+                    by_id[question['id']] = question
+                    page_of[question['id']] = page_num
+        self._pages = pages
+        self._by_id = by_id
+        self._page_of = page_of
+        self.version += 1
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.revalidate_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.revalidate_interval:
+                return
+            stamp = self._scan()
+            if stamp != self._stamp:
+                self._load(stamp)
+                self._stamp = stamp
+            self._checked_at = now
+
+    def bump(self):
+        """Force a stat check on the next read, used after writing question files"""
+        with self._lock:
+            self._checked_at = float('-inf')
+
+    def save(self, questions):
+        """Persist questions, rewriting only the page files whose content changed
+
+        Returns the page numbers that were written or removed.
+        """
+        pages = {}
+        for question in questions:
+            page_num = question.get('page', 0)
+            try:
+                page_num = int(page_num)
+            except (TypeError, ValueError):
+                pass
+            pages.setdefault(page_num, []).append(question)
+        with self.write_lock:
+            # Diff against what is on disk now, not what this process last saw
+            self.bump()
+            self._ensure_fresh()
+            current = self._pages
+            changed = []
+            for page_num, page_questions in pages.items():
+                if current.get(page_num) != page_questions:
+                    os.makedirs(self.data_dir, exist_ok=True)
+                    write_json_atomic(os.path.join(self.data_dir, f'questions_{page_num}.json'), page_questions)
+                    changed.append(page_num)
+            # Pages are removed last so a moved question is never missing from every file
+            for page_num in current:
+                if page_num not in pages:
+                    os.remove(os.path.join(self.data_dir, f'questions_{page_num}.json'))
+                    changed.append(page_num)
+            if changed:
+                self.bump()
+        return changed
+
+    def _ids_path(self):
+        return os.path.join(self.data_dir, 'question_ids.json')
+
+    def _last_id(self):
+        try:
+            with open(self._ids_path(), 'r', encoding='utf-8') as f:
+                return int(json.load(f)['last_id'])
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Error reading question_ids.json, allocating after the highest id: %s", e)
+            return 0
+
+    def _store_last_id(self, last_id):
+        os.makedirs(self.data_dir, exist_ok=True)
+        write_json_atomic(self._ids_path(), {'last_id': last_id})
+
+    def _write_pages(self, pages):
+        os.makedirs(self.data_dir, exist_ok=True)
+        for page_num, questions in pages.items():
+            if questions:
+                write_json_atomic(os.path.join(self.data_dir, f'questions_{page_num}.json'), questions)
+        # Emptied pages are removed last so a moved question is never missing from every file
+        for page_num, questions in pages.items():
+            if not questions:
+                try:
+                    os.remove(os.path.join(self.data_dir, f'questions_{page_num}.json'))
+                except FileNotFoundError:
+                    pass
+        self.bump()
+
+    def page(self, page_num):
+        """Return the questions of a page, None if the page does not exist"""
+        self._ensure_fresh()
+        return self._pages.get(page_num)
+
+    def get(self, question_id):
+        self._ensure_fresh()
+        return self._by_id.get(question_id)
+
+    def page_numbers(self):
+        self._ensure_fresh()
+        return sorted(self._pages)
+
+    def total_count(self):
+        self._ensure_fresh()
+        return sum(len(questions) for questions in self._pages.values())
+
+    def all_questions(self):
+        """Return a private copy of every question, ordered by page file"""
+        self._ensure_fresh()
+        pages = self._pages
+        return copy.deepcopy([q for page_num in sorted(pages) for q in pages[page_num]])
+
+    def current_version(self):
+        self._ensure_fresh()
+        return self.version
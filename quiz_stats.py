@@ -0,0 +1,255 @@
+"""Per-session quiz counters maintained at ingest time.
+
+Each session gets a small record (distinct answered question ids and the
+number of correct answers) next to its event log, so the quiz dashboard
+reads one small file per session instead of scanning every event.  Sessions
+that predate the counters are backfilled from their event log once.
+
+The record also holds the session's quiz progress as two bitsets, bit n
+standing for question id n: the questions answered and those whose latest
+answer was correct.  ``quizReset`` events (the client's "try again" and
+reset buttons) clear questions from both.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, only the threads of this process are serialized
+    fcntl = None
+
+
+# Larger question ids are left out of the bitsets, a client sending a huge id
+# would otherwise grow the session's record without bound
+MAX_PROGRESS_QUESTION_ID = 100000
+
+PROGRESS_EVENTS = ('quizAnswer', 'quizReset')
+
+
+def counted_answer_id(event):
+    """Question id of a quizAnswer event that counts in the dashboard, else None
+
+    Answers migrated from the old progress cookies were tracked when they
+    were given, so they only restore the progress bitsets.  Ids that are not
+    strings or integers (lists or objects sent by a client) are not counted.
+    """
+    if not isinstance(event, dict) or event.get('eventName') != 'quizAnswer':
+        return None
+    event_data = event.get('eventData')
+    if not isinstance(event_data, dict) or event_data.get('migrated'):
+        return None
+    question_id = event_data.get('questionId')
+    if not isinstance(question_id, (str, int)) or isinstance(question_id, bool):
+        return None
+    return question_id
+
+
+def is_progress_event(event):
+    return isinstance(event, dict) and event.get('eventName') in PROGRESS_EVENTS
+
+
+def new_stats():
+    return {'answered': [], 'correct': 0, 'answered_bits': '0', 'correct_bits': '0'}
+
+
+def encode_bits(bits):
+    return format(bits, 'x')
+
+
+def decode_bits(text):
+    try:
+        return int(text, 16)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _bit(question_id):
+    """Bit of a question id, None for ids that are not small non-negative integers"""
+    if isinstance(question_id, str) and question_id.strip().isdigit():
+        question_id = int(question_id)
+    if isinstance(question_id, int) and not isinstance(question_id, bool) \
+            and 0 <= question_id <= MAX_PROGRESS_QUESTION_ID:
+        return question_id
+    return None
+
+
+def _fold_progress(bits, event):
+    """Apply one event to bits, a [answered, correct] pair of ints"""
+    if not is_progress_event(event):
+        return
+    event_data = event.get('eventData')
+    if not isinstance(event_data, dict):
+        return
+    if event['eventName'] == 'quizAnswer':
+        bit = _bit(event_data.get('questionId'))
+        if bit is None:
+            return
+        bits[0] |= 1 << bit
+        if event_data.get('isCorrect'):
+            bits[1] |= 1 << bit
+        else:
+            bits[1] &= ~(1 << bit)
+    elif event_data.get('all'):
+        bits[0] = bits[1] = 0
+    elif isinstance(event_data.get('questionIds'), list):
+        mask = 0
+        for question_id in event_data['questionIds']:
+            bit = _bit(question_id)
+            if bit is not None:
+                mask |= 1 << bit
+        bits[0] &= ~mask
+        bits[1] &= ~mask
+
+
+def apply_progress(answered, correct, events):
+    """Fold quizAnswer and quizReset events into the bitsets, returns (answered, correct)"""
+    bits = [answered, correct]
+    for event in events:
+        _fold_progress(bits, event)
+    return bits[0], bits[1]
+
+
+def progress_bits(stats):
+    """Return the (answered, correct) bitsets of a stats record"""
+    return decode_bits(stats.get('answered_bits')), decode_bits(stats.get('correct_bits'))
+
+
+def apply_answers(stats, events):
+    """Fold quizAnswer and quizReset events into a stats record"""
+    answered = stats['answered']
+    seen = set(answered)
+    bits = list(progress_bits(stats))
+    for event in events:
+        _fold_progress(bits, event)
+        question_id = counted_answer_id(event)
+        if question_id is None:
+            continue
+        if question_id not in seen:
+            seen.add(question_id)
+            answered.append(question_id)
+        if event['eventData'].get('isCorrect'):
+            stats['correct'] += 1
+    stats['answered_bits'], stats['correct_bits'] = encode_bits(bits[0]), encode_bits(bits[1])
+    return stats
+
+
+class QuizStatsStore:
+    def __init__(self, stats_dir, iter_session_events):
+        # iter_session_events(session_id) yields the logged events of a session
+        self.stats_dir = stats_dir
+        self._iter_session_events = iter_session_events
+        self._lock = threading.Lock()
+
+    def _path(self, session_id):
+        return os.path.join(self.stats_dir, f"{session_id}.json")
+
+    @contextmanager
+    def _locked(self, session_id):
+        """Hold an exclusive flock on the session's lock file
+
+        Every worker process updates the records, so a lock in memory is not
+        enough.  As with the session logs, delete() removes the lock file
+        while holding the lock, and a waiter then locks the new file.
+        """
+        if fcntl is None:
+            with self._lock:
+                yield
+            return
+        os.makedirs(self.stats_dir, exist_ok=True)
+        path = os.path.join(self.stats_dir, f"{session_id}.lock")
+        while True:
+            f = open(path, 'a', encoding='utf-8')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        try:
+            yield
+        finally:
+            f.close()
+
+    def _load(self, session_id):
+        try:
+            with open(self._path(session_id), 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Records from before the progress bitsets are rebuilt from the log
+        return stats if 'answered_bits' in stats else None
+
+    def _save(self, session_id, stats):
+        os.makedirs(self.stats_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{session_id}.", suffix='.tmp', dir=self.stats_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self._path(session_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _backfill(self, session_id):
+        stats = apply_answers(new_stats(), self._iter_session_events(session_id))
+        self._save(session_id, stats)
+        return stats
+
+    def record_events(self, session_id, events, append_events):
+        """Append events through append_events() and update the counters
+
+        Both happen under the session's lock so a concurrent backfill cannot
+        see the new answers in the log and have them counted a second time.
+        """
+        answers = [e for e in events if is_progress_event(e)]
+        if not answers:
+            append_events(session_id, events)
+            return
+        with self._locked(session_id):
+            append_events(session_id, events)
+            stats = self._load(session_id)
+            if stats is None:
+                # The log already holds these events, so the backfill covers them
+                self._backfill(session_id)
+            else:
+                self._save(session_id, apply_answers(stats, answers))
+
+    def record_progress(self, session_id, events):
+        """Fold progress events into the bitsets only, for sessions whose events are not logged"""
+        events = [e for e in events if is_progress_event(e)]
+        if not events:
+            return
+        with self._locked(session_id):
+            stats = self._load(session_id) or self._backfill(session_id)
+            answered, correct = apply_progress(*progress_bits(stats), events)
+            stats['answered_bits'], stats['correct_bits'] = encode_bits(answered), encode_bits(correct)
+            self._save(session_id, stats)
+
+    def has(self, session_id):
+        return self._load(session_id) is not None
+
+    def add_backfill(self, session_id, stats):
+        """Store counters computed from the log elsewhere, unless the session has some by now"""
+        with self._locked(session_id):
+            if self._load(session_id) is None:
+                self._save(session_id, stats)
+
+    def get(self, session_id):
+        """Return the counters of a session, backfilling them if needed"""
+        stats = self._load(session_id)
+        if stats is None:
+            with self._locked(session_id):
+                stats = self._load(session_id) or self._backfill(session_id)
+        return stats
+
+    def delete(self, session_id):
+        with self._locked(session_id):
+            for path in (self._path(session_id), os.path.join(self.stats_dir, f"{session_id}.lock")):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
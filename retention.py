@@ -0,0 +1,195 @@
+"""Roll old sessions up into per-day aggregates and delete their raw events.
+
+A day's rollup (keyed by the UTC date the session started) keeps what the
+dashboards need once the events are gone: page dwell times, quiz answers per
+question and the device mix.  The ids of the sessions folded into a day are
+kept with it, so re-running a job that was interrupted between writing the
+rollup and deleting the session does not count that session twice.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from question_bank import WriteLock, write_json_atomic
+from session_index import apply_events, new_record
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def session_day(start_time):
+    """UTC date (YYYY-MM-DD) of a start time in milliseconds, 'unknown' without one"""
+    if isinstance(start_time, bool) or not isinstance(start_time, (int, float)):
+        return 'unknown'
+    return datetime.fromtimestamp(start_time / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def session_rollup(events):
+    """Aggregate the events of one session, returns (day, contribution)"""
+    record = new_record()
+    answers = {}
+
+    def count_answers(events):
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            yield event
+            if event.get('eventName') != 'quizAnswer':
+                continue
+            event_data = event.get('eventData') or {}
+            # Answers migrated from the progress cookies were counted when given
+            if event_data.get('questionId') is None or event_data.get('migrated'):
+                continue
+            counts = answers.setdefault(str(event_data['questionId']), [0, 0])
+            counts[0] += 1
+            if event_data.get('isCorrect'):
+                counts[1] += 1
+
+    apply_events(record, count_answers(events))
+    return session_day(record['start_time']), {
+        'events': record['event_count'],
+        'page_dwell_minutes': record['page_visits'],
+        'questions': answers,
+        'os': str(record['os']),
+        'model': str(record['model']),
+    }
+
+
+def new_day(day):
+    return {
+        'day': day,
+        'sessions': 0,
+        'events': 0,
+        'page_dwell_minutes': {},
+        'quiz': {'answers': 0, 'correct': 0, 'questions': {}},
+        'devices': {'os': {}, 'model': {}},
+        'session_ids': [],
+    }
+
+
+def merge_into_day(rollup, session_id, contribution):
+    """Add a session's contribution to a day rollup, returns False if it was already in it"""
+    if session_id in rollup['session_ids']:
+        return False
+    rollup['session_ids'].append(session_id)
+    rollup['sessions'] += 1
+    rollup['events'] += contribution['events']
+    dwell = rollup['page_dwell_minutes']
+    for page, minutes in contribution['page_dwell_minutes'].items():
+        dwell[page] = dwell.get(page, 0) + minutes
+    quiz = rollup['quiz']
+    for question_id, (answers, correct) in contribution['questions'].items():
+        totals = quiz['questions'].setdefault(question_id, {'answers': 0, 'correct': 0})
+        totals['answers'] += answers
+        totals['correct'] += correct
+        quiz['answers'] += answers
+        quiz['correct'] += correct
+    for field in ('os', 'model'):
+        counts = rollup['devices'][field]
+        counts[contribution[field]] = counts.get(contribution[field], 0) + 1
+    return True
+
+
+def public_rollup(rollup):
+    """A day rollup as the dashboards get it, without the session ids"""
+    return {key: value for key, value in rollup.items() if key != 'session_ids'}
+
+
+class RollupStore:
+    """Day rollups stored as ``rollup_dir/<day>.json``"""
+
+    def __init__(self, rollup_dir):
+        self.rollup_dir = rollup_dir
+        self._lock = threading.Lock()
+        self._day_locks = {}
+
+    def _day_lock(self, day):
+        # Jobs run in every worker process, so a day is updated under a flock of its own
+        with self._lock:
+            lock = self._day_locks.get(day)
+            if lock is None:
+                lock = self._day_locks[day] = WriteLock(os.path.join(self.rollup_dir, f"{day}.lock"))
+            return lock
+
+    def _path(self, day):
+        return os.path.join(self.rollup_dir, f"{day}.json")
+
+    def get(self, day):
+        try:
+            with open(self._path(day), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def add(self, session_id, day, contribution):
+        with self._day_lock(day):
+            rollup = self.get(day) or new_day(day)
+            if merge_into_day(rollup, session_id, contribution):
+                os.makedirs(self.rollup_dir, exist_ok=True)
+                write_json_atomic(self._path(day), rollup)
+
+    def days(self, start=None, end=None):
+        """Return the rollups of the days in [start, end], oldest first"""
+        if not os.path.exists(self.rollup_dir):
+            return []
+        rollups = []
+        for filename in sorted(os.listdir(self.rollup_dir)):
+            day, ext = os.path.splitext(filename)
+            if ext != '.json' or (start and day < start) or (end and day > end):
+                continue
+            rollup = self.get(day)
+            if rollup is not None:
+                rollups.append(rollup)
+        return rollups
+
+
+def bulk_delete(storage, filters, rollup=True, progress=None, undated_before=None):
+    """Delete the sessions matching dashboard filters, rolling them up first
+
+    With undated_before (milliseconds), sessions that start time filters
+    cannot match (empty, unreadable or without a start time) and that were
+    last written before it are deleted too, without a rollup.  A session is
+    rolled up while appends to it wait, so none is lost before the delete.
+
+    progress(done, total) is called after every session.  Returns the number
+    of matched, deleted, rolled up and undated sessions and the ids that failed.
+    """
+    session_ids = [row['id'] for _, row in storage.query_session_summaries(filters, descending=False)]
+    undated = []
+    if undated_before is not None:
+        matched = set(session_ids)
+        undated = [session_id for session_id in storage.undated_session_ids(undated_before)
+                   if session_id not in matched]
+    total = len(session_ids) + len(undated)
+    if progress is not None:
+        progress(0, total)
+    deleted, rolled_up, failed = 0, 0, []
+
+    def roll_up(session_id, events):
+        nonlocal rolled_up
+        day, contribution = session_rollup(events)
+        storage.rollups.add(session_id, day, contribution)
+        rolled_up += 1
+
+    for done, session_id in enumerate(session_ids + undated, 1):
+        before_delete = None
+        if rollup and done <= len(session_ids):
+            before_delete = lambda events, session_id=session_id: roll_up(session_id, events)
+        try:
+            if storage.delete_session(session_id, before_delete=before_delete):
+                deleted += 1
+        except (OSError, ValueError) as e:
+            logger.error("Error deleting session %s: %s", session_id, e)
+            failed.append(session_id)
+        if progress is not None:
+            progress(done, total)
+    return {'matched': total, 'deleted': deleted, 'rolled_up': rolled_up, 'undated': len(undated),
+            'failed': failed}
+
+
+def retention_filters(days, now_ms):
+    """Dashboard filters selecting the sessions that started more than days ago"""
+    return {'start_to': now_ms - days * DAY_MS}
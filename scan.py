@@ -0,0 +1,103 @@
+"""Spread per-session scan work (parsing and summarizing event files) over processes.
+
+Parsing session files is CPU bound, so in the request thread it uses one
+core however many the machine has.  ``ScanPool`` runs the same functions in a
+``ProcessPoolExecutor`` that is started on first use and then kept warm for
+later requests.  With one worker, for small batches, or where worker
+processes cannot be started it runs them in the calling thread instead, with
+the same results.
+
+Functions and their arguments are pickled to the workers, so they must be
+module-level functions taking plain data (paths, ids, records).
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+class ScanPool:
+    def __init__(self, workers=None, min_jobs=2):
+        # At most one worker means scanning serially, in the calling thread
+        self.workers = default_workers() if workers is None else workers
+        self.min_jobs = min_jobs
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            # A pool inherited through fork (gunicorn --preload) belongs to the parent
+            if self._executor is None or self._pid != os.getpid():
+                try:
+                    # Spawned, not forked: the web process has threads holding locks
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context('spawn'))
+                except (OSError, NotImplementedError, ValueError) as e:
+                    logger.warning("Scanning serially, cannot start worker processes: %s", e)
+                    self.workers = 1
+                    return None
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def map(self, fn, jobs):
+        """Yield (args, result, error) of fn(*args) for every args tuple in jobs, in order
+
+        error is the exception fn raised (result is then None), so one bad
+        session does not fail the whole scan.
+        """
+        jobs = list(jobs)
+        executor = None
+        if self.workers > 1 and len(jobs) >= self.min_jobs:
+            executor = self._get_executor()
+        if executor is None:
+            for args in jobs:
+                yield args, *_call(fn, args)
+            return
+        try:
+            futures = [executor.submit(fn, *args) for args in jobs]
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.warning("Scan pool unusable, scanning serially: %s", e)
+            self._discard(executor)
+            futures = []
+        for i, args in enumerate(jobs):
+            if i < len(futures):
+                try:
+                    yield args, futures[i].result(), None
+                    continue
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. killed for memory), finish in this process
+                    logger.warning("Scan pool broke, scanning the rest serially: %s", e)
+                    self._discard(executor)
+                    futures = []
+                except Exception as e:
+                    yield args, None, e
+                    continue
+            yield args, *_call(fn, args)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _call(fn, args):
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
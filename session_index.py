@@ -0,0 +1,343 @@
+"""Materialized per-session summaries for the dashboard.
+
+Each record keeps what the dashboard shows (os, model, ip, start_time,
+page_visits) together with the page-visit replay state and, per session
+file, the size/mtime/offset that has already been processed.  A refresh only
+stats the session files: unchanged sessions are served as stored, a grown
+``.jsonl`` log is replayed from its last offset, and a changed legacy ``.json``
+array (which cannot be tailed) is rebuilt.
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+import analytics
+import session_log
+from scan import ScanPool
+
+INDEX_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def _to_millis(timestamp, default=None):
+    """Convert an ISO string timestamp to milliseconds, numbers pass through"""
+    if isinstance(timestamp, str):
+        try:
+            return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000
+        except ValueError:
+            return default
+    return timestamp
+
+
+def new_record():
+    return {
+        'os': 'Unknown',
+        'model': 'Unknown',
+        'ip': 'Unknown',
+        'start_time': None,
+        'page_visits': {},
+        'current_page': None,
+        'page_start_time': None,
+        'visits_error': False,
+        'event_count': 0,
+        'files': {},
+    }
+
+
+def _set_header(record, first_event):
+    device_info = first_event.get('deviceInfo', {})
+    record['os'] = device_info.get('os', 'Unknown')
+    record['model'] = device_info.get('model', 'Unknown')
+    # Try to get IP from multiple sources
+    ip_address = (first_event.get('ip') or device_info.get('ip')
+                  or first_event.get('eventData', {}).get('ip'))
+    record['ip'] = ip_address or 'Unknown'
+    start_timestamp = first_event.get('eventData', {}).get('timestamp')
+    record['start_time'] = _to_millis(start_timestamp, default=start_timestamp)
+
+
+def apply_events(record, events):
+    """Advance a record over a batch of events"""
+    events = iter(events)
+    if record['event_count'] == 0:
+        first = next(events, None)
+        if first is None:
+            return
+        _set_header(record, first)
+        events = itertools.chain([first], events)
+
+    def counted(events):
+        for event in events:
+            record['event_count'] += 1
+            yield event
+
+    events = counted(events)
+    analytics.replay_visits(record, events)
+    for _ in events:
+        pass  # Past a malformed event the rest are only counted
+
+
+def apply_event(record, event):
+    """Advance the page-visit replay of a record by one event"""
+    apply_events(record, [event])
+
+
+def _apply_log_tail(record, path, offset=0):
+    """Apply the complete lines of a log after offset, returns the offset to resume from"""
+    end = offset
+
+    def events():
+        nonlocal end
+        for event, end in session_log.iter_log_tail(path, offset):
+            yield event
+
+    apply_events(record, events())
+    return end
+
+
+def summarize(session_id, record, now_ms=None):
+    """Build the dashboard row of a record, including time on the open page"""
+    page_visits = dict(record['page_visits'])
+    current_page = record['current_page']
+    page_start_time = record['page_start_time']
+    if current_page is not None and page_start_time is not None:
+        key = str(current_page)
+        page_visits.setdefault(key, 0)
+        last_page_start = _to_millis(page_start_time, default=page_start_time)
+        if now_ms is None:
+            now_ms = datetime.now().timestamp() * 1000
+        if isinstance(last_page_start, (int, float)) and last_page_start > 0:
+            last_page_time = (now_ms - last_page_start) / 1000 / 60
+            if last_page_time > 0:  # Only add positive time
+                page_visits[key] += last_page_time
+    return {
+        "id": session_id,
+        "os": record['os'],
+        "model": record['model'],
+        "ip": record['ip'],
+        "start_time": record['start_time'],
+        "page_visits": page_visits,
+    }
+
+
+def sort_key(session_id, start_time):
+    """Dashboard ordering, by start time then id; sessions without a start time sort first"""
+    if isinstance(start_time, bool) or not isinstance(start_time, (int, float)):
+        start_time = 0
+    return (start_time, session_id)
+
+
+def record_matches(record, filters):
+    """True if a record passes the dashboard filters
+
+    filters may hold os, model (case-insensitive), ip (exact) and
+    start_from/start_to (milliseconds, the upper bound is exclusive).
+    """
+    if not filters:
+        return True
+    for field in ('os', 'model'):
+        wanted = filters.get(field)
+        if wanted is not None and str(record[field]).lower() != wanted.lower():
+            return False
+    if filters.get('ip') is not None and record['ip'] != filters['ip']:
+        return False
+    if filters.get('start_from') is not None or filters.get('start_to') is not None:
+        start_time = record['start_time']
+        if isinstance(start_time, bool) or not isinstance(start_time, (int, float)):
+            return False
+        if filters.get('start_from') is not None and start_time < filters['start_from']:
+            return False
+        if filters.get('start_to') is not None and start_time >= filters['start_to']:
+            return False
+    return True
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def rebuild_record(sessions_dir, session_id):
+    """Build the record of a session from all of its files"""
+    record = new_record()
+    for path in session_log.session_paths(sessions_dir, session_id):
+        name = os.path.basename(path)
+        stamp = _file_stamp(path)
+        if path.endswith(session_log.LOG_EXT):
+            stamp['offset'] = _apply_log_tail(record, path)
+        else:
+            apply_events(record, session_log.iter_file_events(path))
+        record['files'][name] = stamp
+    return record
+
+
+def _unchanged(record, stamps):
+    known = record['files']
+    return set(known) == set(stamps) and all(
+        (known[name]['size'], known[name]['mtime']) == (stamp['size'], stamp['mtime'])
+        for name, stamp in stamps.items())
+
+
+def update_record(sessions_dir, session_id, record, stamps):
+    """Bring a record up to date with its files, returns the new record or None"""
+    if record is None:
+        return rebuild_record(sessions_dir, session_id)
+    known = record['files']
+    if set(known) != set(stamps):
+        return rebuild_record(sessions_dir, session_id)
+    for name, stamp in stamps.items():
+        old = known[name]
+        if name.endswith(session_log.LOG_EXT):
+            if stamp['size'] < old.get('offset', 0):
+                # Truncated or replaced, start over
+                return rebuild_record(sessions_dir, session_id)
+        elif stamp != old:
+            return rebuild_record(sessions_dir, session_id)
+    changed = False
+    for name, stamp in stamps.items():
+        if not name.endswith(session_log.LOG_EXT):
+            continue
+        old = known[name]
+        if stamp['size'] == old['size'] and stamp['mtime'] == old['mtime']:
+            continue
+        path = os.path.join(sessions_dir, name)
+        offset = _apply_log_tail(record, path, old.get('offset', 0))
+        known[name] = dict(stamp, offset=offset)
+        changed = True
+    return record if changed else None
+
+
+class SessionIndex:
+    def __init__(self, sessions_dir, index_path, scanner=None):
+        self.sessions_dir = sessions_dir
+        self.index_path = index_path
+        # Changed sessions are parsed on this scan.ScanPool, serially by default
+        self.scanner = scanner or ScanPool(workers=1)
+        self._records = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                return data.get('sessions', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return {}
+
+    def _save(self):
+        # Every worker process saves its own copy, each through a temp file of its own
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.index_path) + '.', suffix='.tmp',
+                                        dir=os.path.dirname(self.index_path) or '.')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'sessions': self._records}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _stat_sessions(self):
+        """Return {session_id: {filename: stamp}} for every session file"""
+        found = {}
+        if not os.path.exists(self.sessions_dir):
+            return found
+        with os.scandir(self.sessions_dir) as entries:
+            for entry in entries:
+                session_id, ext = os.path.splitext(entry.name)
+                if ext not in session_log.SESSION_EXTS:
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found.setdefault(session_id, {})[entry.name] = {
+                    'size': st.st_size, 'mtime': st.st_mtime_ns}
+        return found
+
+    def refresh(self):
+        """Process whatever changed on disk since the last refresh"""
+        with self._lock:
+            if self._records is None:
+                self._records = self._load()
+            stamps = self._stat_sessions()
+            dirty = False
+            for session_id in list(self._records):
+                if session_id not in stamps:
+                    del self._records[session_id]
+                    dirty = True
+            jobs = [(self.sessions_dir, session_id, self._records.get(session_id), session_stamps)
+                    for session_id, session_stamps in stamps.items()
+                    if session_id not in self._records or not _unchanged(self._records[session_id], session_stamps)]
+            for (_, session_id, _, session_stamps), updated, e in self.scanner.map(update_record, jobs):
+                if e is not None:
+                    # Unreadable (e.g. corrupt legacy JSON), remember the stamps so it
+                    # is only retried once the file changes
+                    logger.warning("Error indexing session %s: %s", session_id, e)
+                    updated = new_record()
+                    updated['files'] = session_stamps
+                    updated['invalid'] = True
+                    if self._records.get(session_id, {}).get('files') == session_stamps:
+                        updated = None
+                if updated is not None:
+                    self._records[session_id] = updated
+                    dirty = True
+            if dirty:
+                self._save()
+
+    def query(self, filters=None, after=None, descending=True, limit=None):
+        """Yield (sort key, dashboard row) of matching sessions, ordered by sort_key()
+
+        Rows start strictly after the ``after`` sort key.  With a limit only
+        that many keys are selected, and rows are summarized one at a time as
+        the caller consumes them.
+        """
+        self.refresh()
+        if after is not None:
+            after = tuple(after)
+        with self._lock:
+            keys = (sort_key(session_id, record['start_time'])
+                    for session_id, record in self._records.items()
+                    if record['event_count'] and not record.get('invalid') and record_matches(record, filters))
+            if after is not None:
+                keys = (key for key in keys if (key < after if descending else key > after))
+            if limit is None:
+                keys = sorted(keys, reverse=descending)
+            else:
+                # A page only keeps its limit of keys, not one per session
+                keys = (heapq.nlargest if descending else heapq.nsmallest)(limit, keys)
+        now_ms = datetime.now().timestamp() * 1000
+        for key in keys:
+            with self._lock:
+                record = self._records.get(key[1])
+                if record is None:
+                    continue  # Deleted meanwhile
+                row = summarize(key[1], record, now_ms)
+            yield key, row
+
+    def undated(self, before_ms):
+        """Ids of the sessions query() leaves out of start time filters (empty, unreadable or
+        without a numeric start time) whose files were last written before before_ms"""
+        self.refresh()
+        with self._lock:
+            return sorted(
+                session_id for session_id, record in self._records.items()
+                if (not record['event_count'] or record.get('invalid')
+                    or isinstance(record['start_time'], bool) or not isinstance(record['start_time'], (int, float)))
+                and max((stamp['mtime'] for stamp in record['files'].values()), default=0) / 1e6 < before_ms)
+
+    def summaries(self):
+        """Return the dashboard rows of every non-empty session"""
+        self.refresh()
+        now_ms = datetime.now().timestamp() * 1000
+        with self._lock:
+            return [summarize(session_id, record, now_ms)
+                    for session_id, record in sorted(self._records.items())
+                    if record['event_count'] and not record.get('invalid')]
@@ -0,0 +1,445 @@
+"""Session event storage.
+
+Sessions used to be stored as a single pretty-printed JSON array per session
+(``<id>.json``) that was rewritten on every tracked event.  New events are now
+appended to ``<id>.jsonl`` with one event per line, so a tracking write costs
+the same no matter how long the session already is.  Readers accept both
+formats (and a session that has both files, legacy events first).
+
+Sessions that are no longer written to can be compacted into
+``<id>.cjsonl``, which stores what every event repeats only once.  It is a
+sequence of JSON lines:
+
+* ``{"v": 1}`` first, the format version;
+* ``{"h": {...}}`` sets the header: the top-level fields other than
+  eventName/eventData (sessionId, deviceInfo, ip) of the events that follow;
+* ``{"n": "name"}`` defines the next event name, numbered from 0;
+* ``[name, timestamp, data]`` is an event: the name number (null when the
+  event has none), the integer eventData timestamp (null when it is not an
+  integer, it then stays in data) and the rest of eventData (null when the
+  event has none);
+* ``{"e": event}`` is an event stored as is, for anything that does not fit.
+
+Events are decoded back to their original shape.  Appends after compaction
+go to a new ``.jsonl`` log, read after the compact file.
+"""
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, appends and compaction are not serialized
+    fcntl = None
+
+LEGACY_EXT = '.json'
+COMPACT_EXT = '.cjsonl'
+LOG_EXT = '.jsonl'
+# In the order their events were written
+SESSION_EXTS = (LEGACY_EXT, COMPACT_EXT, LOG_EXT)
+COMPACT_VERSION = 1
+# Legacy arrays are parsed from chunks of this many characters
+READ_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def session_paths(sessions_dir, session_id):
+    """Return the existing files of a session, oldest events first"""
+    paths = []
+    for ext in SESSION_EXTS:
+        path = os.path.join(sessions_dir, session_id + ext)
+        if os.path.exists(path):
+            paths.append(path)
+    return paths
+
+
+def list_session_ids(sessions_dir):
+    """Return the ids of all sessions stored in sessions_dir"""
+    if not os.path.exists(sessions_dir):
+        return []
+    ids = set()
+    for filename in os.listdir(sessions_dir):
+        name, ext = os.path.splitext(filename)
+        if ext in SESSION_EXTS:
+            ids.add(name)
+    return sorted(ids)
+
+
+def session_exists(sessions_dir, session_id):
+    return bool(session_paths(sessions_dir, session_id))
+
+
+def encode_compact(events):
+    """Yield the records of the compact encoding of events"""
+    yield {'v': COMPACT_VERSION}
+    header = None
+    names = {}
+    for event in events:
+        event_data = event.get('eventData', {}) if isinstance(event, dict) else None
+        name = event.get('eventName') if isinstance(event, dict) else None
+        if (not isinstance(event_data, dict) or ('eventName' in event and not isinstance(name, str))
+                or ('eventData' in event and event_data is None)):
+            yield {'e': event}
+            continue
+        fields = {key: value for key, value in event.items() if key not in ('eventName', 'eventData')}
+        if fields != header or list(fields) != list(header):
+            header = fields
+            yield {'h': header}
+        if name is not None and name not in names:
+            names[name] = len(names)
+            yield {'n': name}
+        timestamp = event_data.get('timestamp')
+        if type(timestamp) is int:
+            event_data = {key: value for key, value in event_data.items() if key != 'timestamp'}
+        else:
+            timestamp = None
+        yield [names.get(name), timestamp, event_data if 'eventData' in event else None]
+
+
+def decode_compact_event(record, name, header):
+    """Rebuild an event from its compact record, its event name and the header in effect"""
+    if isinstance(record, dict):
+        return record['e']
+    _, timestamp, event_data = record
+    event = dict(header or {})
+    if name is not None:
+        event['eventName'] = name
+    if event_data is not None or timestamp is not None:
+        event_data = dict(event_data or {})
+        if timestamp is not None:
+            event_data['timestamp'] = timestamp
+        event['eventData'] = event_data
+    return event
+
+
+def iter_compact(path):
+    """Yield (event, byte_position, byte_length, header) for each event of a compact file
+
+    header is the header record the event was decoded with, None for events
+    stored as is.
+    """
+    header = None
+    names = []
+    position = 0
+    with open(path, 'rb') as f:
+        for raw in f:
+            line_position = position
+            position += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, list):
+                name = names[record[0]] if record[0] is not None else None
+                yield decode_compact_event(record, name, header), line_position, len(raw), header
+            elif 'e' in record:
+                yield record['e'], line_position, len(raw), None
+            elif 'h' in record:
+                header = record['h']
+            elif 'n' in record:
+                names.append(record['n'])
+            elif record.get('v') != COMPACT_VERSION:
+                raise ValueError(f"Unsupported compact session version in {path}: {record.get('v')}")
+
+
+def iter_json_array(f, chunk_size=READ_CHUNK_SIZE, spans=False):
+    """Yield the elements of the JSON array in text file f, one at a time
+
+    The file is read in chunks as parsing needs them and the parsed part of
+    the buffer is dropped, so memory holds one element and a chunk instead of
+    the whole array.  A file whose top-level value is not an array yields
+    nothing; malformed JSON raises json.JSONDecodeError, like json.load.
+
+    With spans, (element, byte_position, byte_length) tuples are yielded
+    instead, for a file opened with encoding='utf-8' and newline=''.
+    """
+    buf = f.read(chunk_size)
+    pos = 0
+    eof = not buf
+    # buf[mark] is at byte offset mark_byte of the file
+    mark = mark_byte = 0
+
+    def more():
+        # Append the next chunk, growing with the buffer so a huge element is read in few steps
+        nonlocal buf, pos, eof, mark, mark_byte
+        if eof:
+            return False
+        chunk = f.read(max(chunk_size, len(buf) - pos))
+        if not chunk:
+            eof = True
+            return False
+        if spans:
+            mark_byte += len(buf[mark:pos].encode('utf-8'))
+            mark = 0
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or not more():
+                return
+
+    skip_whitespace()
+    if buf[pos:pos + 1] != '[':
+        # Parsed in full only to raise on malformed JSON
+        json.loads(buf[pos:] + f.read())
+        return
+    pos += 1
+    skip_whitespace()
+    if buf[pos:pos + 1] == ']':
+        pos += 1
+    else:
+        while True:
+            try:
+                element, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if more():
+                    continue  # Cut off at the end of the chunk
+                raise
+            after = _WHITESPACE.match(buf, end).end()
+            if (after == len(buf) or buf[after] not in ',]') and more():
+                continue  # A number could go on in the next chunk, decode it again
+            if spans:
+                start_byte = mark_byte + len(buf[mark:pos].encode('utf-8'))
+                mark, mark_byte = end, start_byte + len(buf[pos:end].encode('utf-8'))
+                yield element, start_byte, mark_byte - start_byte
+            else:
+                yield element
+            pos = after
+            delimiter = buf[pos:pos + 1]
+            pos += 1
+            if delimiter == ']':
+                break
+            if delimiter != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos - 1)
+            skip_whitespace()
+    skip_whitespace()
+    if pos < len(buf):
+        raise json.JSONDecodeError("Extra data", buf, pos)
+
+
+def iter_file_events(path):
+    """Yield the events stored in a single legacy, compact or log file"""
+    if path.endswith(COMPACT_EXT):
+        for event, _, _, _ in iter_compact(path):
+            yield event
+    elif path.endswith(LOG_EXT):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted write
+                    continue
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from iter_json_array(f)
+
+
+def iter_log_tail(path, offset=0):
+    """Yield (event, end_offset) for the complete lines of a log after offset
+
+    A trailing line without its newline is still being written and is left
+    for the next call, so end_offset can always be used to resume.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                return
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield event, offset
+
+
+def iter_events(sessions_dir, session_id):
+    """Yield every event of a session regardless of its storage format"""
+    for path in session_paths(sessions_dir, session_id):
+        yield from iter_file_events(path)
+
+
+def read_events(sessions_dir, session_id):
+    return list(iter_events(sessions_dir, session_id))
+
+
+def _open_locked_log(path):
+    """Open the log for appending with an exclusive flock on it
+
+    compact_session() removes the log while holding the same lock, so an
+    appender that waited for it reopens the new file instead of writing to
+    the removed one.
+    """
+    while True:
+        f = open(path, 'a', encoding='utf-8')
+        if fcntl is None:
+            return f
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+@contextmanager
+def locked_session(sessions_dir, session_id):
+    """Hold the lock of a session's log, appends to the session wait meanwhile
+
+    If the block deletes or rewrites the session, the waiting appends go to
+    a new log.
+    """
+    os.makedirs(sessions_dir, exist_ok=True)
+    with _open_locked_log(os.path.join(sessions_dir, session_id + LOG_EXT)):
+        yield
+
+
+def append_events(sessions_dir, session_id, events):
+    """Append events to the session log with a single write"""
+    if not events:
+        return
+    os.makedirs(sessions_dir, exist_ok=True)
+    path = os.path.join(sessions_dir, session_id + LOG_EXT)
+    payload = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+    with _open_locked_log(path) as f:
+        f.write(payload)
+
+
+def sync_sessions(sessions_dir, session_ids):
+    """fsync the logs of sessions and the directory, so everything appended so far survives a crash"""
+    paths = [os.path.join(sessions_dir, session_id + LOG_EXT) for session_id in session_ids]
+    # The directory last: it holds the entries of logs created since the last sync
+    for path in paths + [sessions_dir]:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def append_event(sessions_dir, session_id, event):
+    append_events(sessions_dir, session_id, [event])
+
+
+def delete_session(sessions_dir, session_id):
+    """Remove every file of a session, returns False if there was none"""
+    paths = session_paths(sessions_dir, session_id)
+    for path in paths:
+        os.remove(path)
+    return bool(paths)
+
+
+def compact_session(sessions_dir, session_id):
+    """Rewrite every file of a session as one compact ``.cjsonl`` file
+
+    Returns the (old, new) size in bytes, None if the session does not exist.
+    """
+    paths = session_paths(sessions_dir, session_id)
+    if not paths:
+        return None
+    log_path = os.path.join(sessions_dir, session_id + LOG_EXT)
+    compact_path = os.path.join(sessions_dir, session_id + COMPACT_EXT)
+    # Appends wait for the lock, and then go to a new log after the compact file
+    log_file = _open_locked_log(log_path) if log_path in paths else None
+    try:
+        old_size = sum(os.path.getsize(path) for path in paths)
+        tmp_path = compact_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in encode_compact(iter_events(sessions_dir, session_id)):
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        os.replace(tmp_path, compact_path)
+        for path in paths:
+            if path != compact_path:
+                os.remove(path)
+        return old_size, os.path.getsize(compact_path)
+    finally:
+        if log_file is not None:
+            log_file.close()
+
+
+def compact_sessions(sessions_dir, idle_seconds=0, now=None):
+    """Compact every session not written to for idle_seconds
+
+    Returns (compacted ids, failed ids, bytes before, bytes after).
+    """
+    now = time.time() if now is None else now
+    compacted, failed = [], []
+    before = after = 0
+    for session_id in list_session_ids(sessions_dir):
+        paths = session_paths(sessions_dir, session_id)
+        try:
+            if paths == [os.path.join(sessions_dir, session_id + COMPACT_EXT)]:
+                continue  # Already compact
+            if now - max(os.path.getmtime(path) for path in paths) < idle_seconds:
+                continue
+            sizes = compact_session(sessions_dir, session_id)
+        except (OSError, ValueError) as e:
+            logger.error("Error compacting session %s: %s", session_id, e)
+            failed.append(session_id)
+            continue
+        if sizes is not None:
+            compacted.append(session_id)
+            before += sizes[0]
+            after += sizes[1]
+    return compacted, failed, before, after
+
+
+def migrate_session(sessions_dir, session_id):
+    """Rewrite a legacy ``.json`` session as a ``.jsonl`` log
+
+    Events already appended to the log are kept after the legacy ones.
+    Returns True if the session had a legacy file to migrate.
+    """
+    legacy_path = os.path.join(sessions_dir, session_id + LEGACY_EXT)
+    if not os.path.exists(legacy_path):
+        return False
+    if os.path.exists(os.path.join(sessions_dir, session_id + COMPACT_EXT)):
+        # The log can only hold events written after the compact file
+        compact_session(sessions_dir, session_id)
+        return True
+    log_path = os.path.join(sessions_dir, session_id + LOG_EXT)
+    # As in compact_session(), appends wait and then go to the new log
+    with _open_locked_log(log_path):
+        events = read_events(sessions_dir, session_id)
+        tmp_path = log_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, log_path)
+        os.remove(legacy_path)
+    return True
+
+
+def migrate_sessions(sessions_dir):
+    """Migrate every legacy session file, returns (migrated, failed) ids"""
+    migrated, failed = [], []
+    for session_id in list_session_ids(sessions_dir):
+        try:
+            if migrate_session(sessions_dir, session_id):
+                migrated.append(session_id)
+        except (OSError, ValueError) as e:
+            logger.error("Error migrating session %s: %s", session_id, e)
+            failed.append(session_id)
+    return migrated, failed
@@ -1,22 +1,36 @@
 document.addEventListener('DOMContentLoaded', function() {
     const questionList = document.getElementById('question-list');
     if (questionList) {
+        // Only dragged questions and questions given another page are sent
+        const moved = new Set();
         const sortable = new Sortable(questionList, {
             animation: 150,
             handle: '.handle',
-            ghostClass: 'blue-background-class'
+            ghostClass: 'blue-background-class',
+            onEnd: evt => moved.add(evt.item)
         });
 
         document.getElementById('save-order-btn').addEventListener('click', () => {
-            const questions = Array.from(questionList.children).map(item => ({
-                id: parseInt(item.dataset.id),
-                page: parseInt(item.querySelector('[data-page-input]').value)
-            }));
+            const positions = {};
+            const moves = [];
+            Array.from(questionList.children).forEach(item => {
+                const input = item.querySelector('[data-page-input]');
+                const page = parseInt(input.value);
+                const position = positions[page] || 0;
+                positions[page] = position + 1;
+                if (moved.has(item) || input.value !== input.defaultValue) {
+                    moves.push({ id: parseInt(item.dataset.id), page: page, position: position });
+                }
+            });
+            if (moves.length === 0) {
+                alert('Nothing to save');
+                return;
+            }
             
             fetch('/api/admin/questions/reorder', {
-                method: 'POST',
+                method: 'PATCH',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ questions: questions })
+                body: JSON.stringify({ moves: moves })
             })
             .then(response => response.json())
             .then(data => {
@@ -39,7 +53,6 @@ document.addEventListener('DOMContentLoaded', function() {
                         .then(data => {
                             if(data.success) {
                                 item.remove();
-                                location.reload(); // Reload to show re-ordered questions
                             } else {
                                 alert('Error deleting question: ' + (data.error || 'Unknown error'));
                             }
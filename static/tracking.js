@@ -85,8 +85,8 @@ async function initializeTracking() {
     clientIP = await getClientIP();
 }
 
-function trackEvent(eventName, eventData = {}) {
-    const payload = {
+function makeTrackEvent(eventName, eventData = {}) {
+    return {
         sessionId: getSessionId(),
         deviceInfo: getDeviceInfo(),
         ip: clientIP,
@@ -97,18 +97,129 @@ function trackEvent(eventName, eventData = {}) {
             timestamp: Date.now() // Use milliseconds timestamp for better precision
         }
     };
+}
+
+function trackEvent(eventName, eventData = {}) {
+    const payload = makeTrackEvent(eventName, eventData);
+    rememberProgressEvent(payload);
+    trackBuffer.push(payload);
+    if (trackBuffer.length >= TRACK_BATCH_SIZE) {
+        flushTrackBuffer();
+    }
+}
+
+// --- Batching ---
+// Events are buffered and posted to /api/track/batch on a timer, when the
+// buffer fills up, and with sendBeacon when the page is being hidden.
+const TRACK_BATCH_SIZE = 20;
+const TRACK_FLUSH_INTERVAL = 5000;
+const TRACK_BUFFER_LIMIT = 500;
+let trackBuffer = [];
+let trackFlushInFlight = false;
+let trackFlushQueued = false;
+let trackFlushPromise = Promise.resolve();
+
+// The server writes accepted events in the background, so /api/progress may
+// not include the latest quizAnswer and quizReset events yet.  They are kept
+// here for a while so the page can apply them to the progress it reads.
+const RECENT_PROGRESS_MS = 60000;
+let recentProgressEvents = [];
+
+function rememberProgressEvent(payload) {
+    if (payload.eventName === 'quizAnswer' || payload.eventName === 'quizReset') {
+        recentProgressEvents.push(payload);
+    }
+}
+
+// quizAnswer and quizReset events of the last minute, oldest first
+function getRecentProgressEvents() {
+    const since = Date.now() - RECENT_PROGRESS_MS;
+    recentProgressEvents = recentProgressEvents.filter(event => event.eventData.timestamp >= since);
+    return recentProgressEvents.slice();
+}
+
+function requeueTrackEvents(events) {
+    // Keep the newest events if the server keeps refusing them
+    trackBuffer = events.concat(trackBuffer).slice(-TRACK_BUFFER_LIMIT);
+}
 
-    fetch('/api/track', {
+// Browsers refuse keepalive requests and beacons over 64 KB, so batches are
+// kept under this size and the rest of the buffer goes in further requests
+const TRACK_KEEPALIVE_BYTES = 60000;
+
+// Removes the oldest buffered events that fit in one batch, at least one
+function takeTrackBatch() {
+    let size = JSON.stringify({ events: [] }).length;
+    let count = 0;
+    while (count < trackBuffer.length) {
+        size += new Blob([JSON.stringify(trackBuffer[count])]).size + 1;
+        if (count > 0 && size > TRACK_KEEPALIVE_BYTES) break;
+        count++;
+    }
+    return trackBuffer.splice(0, count);
+}
+
+// Resolves once the events buffered so far have been sent.  Events the server
+// could not store (5xx, 429 or a network error) are buffered again for the
+// next flush; a batch refused for another reason is dropped with a warning.
+function flushTrackBuffer() {
+    if (trackBuffer.length === 0) return trackFlushPromise;
+    if (trackFlushInFlight) {
+        // Send what was buffered meanwhile once the current request is done
+        if (!trackFlushQueued) {
+            trackFlushQueued = true;
+            trackFlushPromise = trackFlushPromise.then(() => {
+                trackFlushQueued = false;
+                if (trackBuffer.length > 0) return flushTrackBuffer();
+            });
+        }
+        return trackFlushPromise;
+    }
+    const events = takeTrackBatch();
+    const body = JSON.stringify({ events });
+    trackFlushInFlight = true;
+
+    trackFlushPromise = fetch('/api/track/batch', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         credentials: 'include', // Include cookies in the request
-        body: JSON.stringify(payload),
-        keepalive: true // This is important for requests sent during page unload
+        body: body,
+        // A single event over the limit is still sent, without keepalive
+        keepalive: new Blob([body]).size <= TRACK_KEEPALIVE_BYTES
+    }).then(response => {
+        if (response.ok) return true;
+        if (response.status >= 500 || response.status === 429) {
+            // Server queue full or storage failing, try again on the next flush
+            requeueTrackEvents(events);
+            return false;
+        }
+        console.warn(`Tracking: dropped ${events.length} events refused with status ${response.status}`);
+        return true;
     }).catch(error => {
         console.error('Tracking Error:', error);
+        requeueTrackEvents(events);
+        return false;
+    }).then(sent => {
+        trackFlushInFlight = false;
+        // Send the rest of a buffer larger than one batch right away
+        if (sent && trackBuffer.length > 0) return flushTrackBuffer();
     });
+    return trackFlushPromise;
+}
+
+function beaconTrackBuffer() {
+    while (trackBuffer.length > 0 && navigator.sendBeacon) {
+        const events = takeTrackBatch();
+        const body = new Blob([JSON.stringify({ events })], { type: 'application/json' });
+        if (!navigator.sendBeacon('/api/track/batch', body)) {
+            requeueTrackEvents(events);
+            break;
+        }
+    }
+    // Whatever the browser would not queue as a beacon is sent with fetch
+    flushTrackBuffer();
 }
 
 function trackPageView() {
@@ -150,6 +261,11 @@ function trackQuizAnswer(questionId, selectedAnswer, isCorrect, page) {
     });
 }
 
+function trackQuizReset(questionIds) {
+    // The server forgets these answers of the session, or all of them without questionIds
+    trackEvent('quizReset', questionIds ? { questionIds } : { all: true });
+}
+
 function trackQuizSearch(searchTerm, page) {
     trackEvent('quizSearch', { 
         searchTerm, 
@@ -180,6 +296,7 @@ async function initTracking() {
     document.addEventListener('visibilitychange', function() {
         if (document.hidden) {
             trackEvent('pageHidden', { page: getCurrentPage() });
+            beaconTrackBuffer();
         } else {
             trackEvent('pageVisible', { page: getCurrentPage() });
         }
@@ -189,6 +306,10 @@ async function initTracking() {
     window.addEventListener('beforeunload', function() {
         trackEvent('pageUnload', { page: getCurrentPage() });
     });
+
+    // Send whatever is buffered while the page can still make requests
+    setInterval(flushTrackBuffer, TRACK_FLUSH_INTERVAL);
+    window.addEventListener('pagehide', beaconTrackBuffer);
     
     // Track page focus/blur
     window.addEventListener('focus', function() {
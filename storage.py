@@ -0,0 +1,650 @@
+"""Storage backends for questions, page titles and tracked sessions.
+
+``JsonFileStorage`` is the original ``data/`` layout (question page files,
+session logs, the summary index and quiz counters).  ``SQLiteStorage`` keeps
+the same data in a single SQLite database in WAL mode, so the dashboard
+queries become indexed SQL instead of directory scans.  Both expose the same
+methods, and both expose a ``questions`` object with the ``QuestionBank``
+interface.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import session_log
+from question_bank import PageEdits, QuestionBank
+from quiz_stats import (PROGRESS_EVENTS, QuizStatsStore, apply_answers, apply_progress, counted_answer_id, decode_bits,
+                        encode_bits, is_progress_event, new_stats, progress_bits)
+from event_index import EventIndex
+from retention import RollupStore, merge_into_day, new_day
+from scan import ScanPool
+from session_index import SessionIndex, apply_events, new_record, sort_key, summarize
+
+logger = logging.getLogger(__name__)
+
+
+def _scan_quiz_stats(sessions_dir, session_id):
+    """Quiz counters of a session computed from its events, run on the scan pool"""
+    return apply_answers(new_stats(), session_log.iter_events(sessions_dir, session_id))
+
+
+class JsonFileStorage:
+    name = 'json'
+
+    def __init__(self, data_dir, scanner=None):
+        self.data_dir = data_dir
+        self.sessions_dir = os.path.join(data_dir, 'sessions')
+        # Session files are parsed on this scan.ScanPool, serially by default
+        self.scanner = scanner or ScanPool(workers=1)
+        self.questions = QuestionBank(data_dir)
+        self.session_index = SessionIndex(
+            self.sessions_dir, os.path.join(data_dir, 'session_index.json'), self.scanner)
+        self.quiz_stats = QuizStatsStore(os.path.join(data_dir, 'quiz_stats'), self.iter_events)
+        self.event_index = EventIndex(self.sessions_dir, os.path.join(data_dir, 'event_index'))
+        self.rollups = RollupStore(os.path.join(data_dir, 'rollups'))
+
+    # Page titles
+
+    def _page_titles_path(self):
+        return os.path.join(self.data_dir, 'page-title.json')
+
+    def get_page_titles(self):
+        path = self._page_titles_path()
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def save_page_titles(self, titles):
+        with open(self._page_titles_path(), 'w', encoding='utf-8') as f:
+            json.dump(titles, f, indent=2, ensure_ascii=False)
+
+    def page_titles_version(self):
+        try:
+            return os.stat(self._page_titles_path()).st_mtime_ns
+        except OSError:
+            return 0
+
+    # Sessions
+
+    def append_events(self, session_id, events):
+        """Append tracked events of one session and update its quiz counters"""
+        self.quiz_stats.record_events(
+            session_id, events, lambda sid, evts: session_log.append_events(self.sessions_dir, sid, evts))
+
+    def record_progress(self, session_id, events):
+        """Update the quiz progress of a session from its events without logging them"""
+        self.quiz_stats.record_progress(session_id, events)
+
+    def sync_sessions(self, session_ids):
+        """Make the events appended to these sessions durable"""
+        session_log.sync_sessions(self.sessions_dir, session_ids)
+
+    def list_session_ids(self):
+        return session_log.list_session_ids(self.sessions_dir)
+
+    def session_exists(self, session_id):
+        return session_log.session_exists(self.sessions_dir, session_id)
+
+    def iter_events(self, session_id):
+        return session_log.iter_events(self.sessions_dir, session_id)
+
+    def read_events(self, session_id):
+        return session_log.read_events(self.sessions_dir, session_id)
+
+    def event_window(self, session_id, offset=0, limit=None, event_name=None, start=None, end=None):
+        """Return (matching count, events) or None, see EventIndex.window"""
+        return self.event_index.window(session_id, offset, limit, event_name, start, end)
+
+    def delete_session(self, session_id, before_delete=None):
+        """Remove every file of a session, returns False if there was none
+
+        before_delete(events) is called with the session's events while
+        appends to the session wait, so no event is lost between the two.
+        """
+        deleted = False
+        if self.session_exists(session_id):
+            with session_log.locked_session(self.sessions_dir, session_id):
+                if before_delete is not None:
+                    before_delete(self.iter_events(session_id))
+                deleted = session_log.delete_session(self.sessions_dir, session_id)
+        # After the log lock, an append waiting for it may hold the counters' lock
+        self.quiz_stats.delete(session_id)
+        self.event_index.delete(session_id)
+        return deleted
+
+    def undated_session_ids(self, before_ms):
+        """Ids of sessions without a usable start time whose files were last written before before_ms"""
+        return self.session_index.undated(before_ms)
+
+    def session_summaries(self):
+        return self.session_index.summaries()
+
+    def query_session_summaries(self, filters=None, after=None, descending=True, limit=None):
+        """Yield (sort key, dashboard row) pairs, see SessionIndex.query"""
+        return self.session_index.query(filters, after, descending, limit)
+
+    def session_progress(self, session_id):
+        """Return the (answered, correct) question id bitsets of a session"""
+        if not self.session_exists(session_id) and not self.quiz_stats.has(session_id):
+            return 0, 0
+        return progress_bits(self.quiz_stats.get(session_id))
+
+    def quiz_progress(self):
+        """Return (session_id, answered, correct) for every session"""
+        session_ids = self.list_session_ids()
+        # Sessions without counters yet are backfilled in parallel first
+        jobs = [(self.sessions_dir, session_id) for session_id in session_ids
+                if not self.quiz_stats.has(session_id)]
+        failed = set()
+        for (_, session_id), stats, e in self.scanner.map(_scan_quiz_stats, jobs):
+            if e is not None:
+                logger.warning("Error counting quiz answers of session %s: %s", session_id, e)
+                failed.add(session_id)
+            else:
+                self.quiz_stats.add_backfill(session_id, stats)
+        progress = []
+        for session_id in session_ids:
+            if session_id in failed:
+                continue
+            try:
+                stats = self.quiz_stats.get(session_id)
+            except (OSError, ValueError):
+                continue
+            progress.append((session_id, len(stats['answered']), stats['correct']))
+        return progress
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    question_id INTEGER,
+    page INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_questions_page ON questions (page, position);
+CREATE INDEX IF NOT EXISTS idx_questions_id ON questions (question_id);
+CREATE TABLE IF NOT EXISTS page_titles (
+    page TEXT PRIMARY KEY,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    os TEXT,
+    model TEXT,
+    ip TEXT,
+    start_time REAL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions (start_time);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    event_name TEXT,
+    timestamp REAL,
+    question_key TEXT,
+    is_correct INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_session ON events (session_id, id);
+CREATE INDEX IF NOT EXISTS idx_events_name ON events (event_name, session_id);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp);
+CREATE TABLE IF NOT EXISTS quiz_progress (
+    session_id TEXT PRIMARY KEY,
+    answered TEXT NOT NULL,
+    correct TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    day TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+'''
+
+
+class _SQLiteDatabase:
+    """Per-thread connections and (nestable) write transactions"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode, transactions are opened explicitly in transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def meta_value(self, key):
+        row = self.connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_meta(self, key):
+        self.connection().execute(
+            'INSERT INTO meta (key, value) VALUES (?, 1) '
+            'ON CONFLICT(key) DO UPDATE SET value = value + 1', (key,))
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        conn = self.db.connection()
+        if self.db._local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self.db._local.depth += 1
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self.db.connection()
+        self.db._local.depth -= 1
+        if self.db._local.depth == 0:
+            conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class SQLiteQuestionBank(PageEdits):
+    """QuestionBank interface over the questions table, cached per version"""
+
+    def __init__(self, db, revalidate_interval=1.0):
+        self.db = db
+        self.revalidate_interval = revalidate_interval
+        self.version = None
+        self._pages = {}
+        self._by_id = {}
+        self._page_of = {}
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def write_lock(self):
+        # One IMMEDIATE transaction around a read-modify-write serializes writers
+        # across threads and processes
+        return self.db.transaction()
+
+    def _load(self):
+        pages = {}
+        by_id = {}
+        page_of = {}
+        rows = self.db.connection().execute('SELECT page, data FROM questions ORDER BY page, position')
+        for page_num, data in rows:
+            question = json.loads(data)
+            pages.setdefault(page_num, []).append(question)
+            if 'id' in question:
+                by_id[question['id']] = question
+                page_of[question['id']] = page_num
+        self._pages = pages
+        self._by_id = by_id
+        self._page_of = page_of
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.revalidate_interval:
+            return
+        with self._lock:
+            version = self.db.meta_value('questions_version')
+            if version != self.version:
+                self._load()
+                self.version = version
+            self._checked_at = now
+
+    def bump(self):
+        with self._lock:
+            self._checked_at = float('-inf')
+
+    def save(self, questions):
+        """Replace the rows of every page whose questions changed"""
+        pages = {}
+        for question in questions:
+            page_num = question.get('page', 0)
+            try:
+                page_num = int(page_num)
+            except (TypeError, ValueError):
+                pass
+            pages.setdefault(page_num, []).append(question)
+        with self.db.transaction() as conn:
+            self.bump()
+            self._ensure_fresh()
+            current = self._pages
+            changed = [p for p in pages if current.get(p) != pages[p]]
+            changed += [p for p in current if p not in pages]
+            for page_num in changed:
+                conn.execute('DELETE FROM questions WHERE page = ?', (page_num,))
+                conn.executemany(
+                    'INSERT INTO questions (question_id, page, position, data) VALUES (?, ?, ?, ?)',
+                    [(q.get('id'), page_num, position, json.dumps(q, ensure_ascii=False))
+                     for position, q in enumerate(pages.get(page_num, []))])
+            if changed:
+                self.db.bump_meta('questions_version')
+        self.bump()
+        return changed
+
+    def _last_id(self):
+        return self.db.meta_value('questions_last_id')
+
+    def _store_last_id(self, last_id):
+        self.db.connection().execute(
+            'INSERT INTO meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value', ('questions_last_id', last_id))
+
+    def _write_pages(self, pages):
+        with self.db.transaction() as conn:
+            for page_num, questions in pages.items():
+                conn.execute('DELETE FROM questions WHERE page = ?', (page_num,))
+                conn.executemany(
+                    'INSERT INTO questions (question_id, page, position, data) VALUES (?, ?, ?, ?)',
+                    [(q.get('id'), page_num, position, json.dumps(q, ensure_ascii=False))
+                     for position, q in enumerate(questions)])
+            self.db.bump_meta('questions_version')
+        self.bump()
+
+    def page(self, page_num):
+        self._ensure_fresh()
+        return self._pages.get(page_num)
+
+    def get(self, question_id):
+        self._ensure_fresh()
+        return self._by_id.get(question_id)
+
+    def page_numbers(self):
+        self._ensure_fresh()
+        return sorted(self._pages)
+
+    def total_count(self):
+        self._ensure_fresh()
+        return sum(len(questions) for questions in self._pages.values())
+
+    def all_questions(self):
+        # Parsed again from the rows, the caller gets its own copy to modify
+        rows = self.db.connection().execute('SELECT data FROM questions ORDER BY page, position')
+        return [json.loads(data) for (data,) in rows]
+
+    def current_version(self):
+        self._ensure_fresh()
+        return self.version
+
+
+class SQLiteRollupStore:
+    """RollupStore interface over the rollups table"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, day):
+        row = self.db.connection().execute('SELECT data FROM rollups WHERE day = ?', (day,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, session_id, day, contribution):
+        with self.db.transaction() as conn:
+            rollup = self.get(day) or new_day(day)
+            if merge_into_day(rollup, session_id, contribution):
+                conn.execute('INSERT OR REPLACE INTO rollups (day, data) VALUES (?, ?)', (day, json.dumps(rollup)))
+
+    def days(self, start=None, end=None):
+        rows = self.db.connection().execute(
+            'SELECT data FROM rollups WHERE day >= ? AND day <= ? ORDER BY day',
+            (start or '', end or '\uffff'))
+        return [json.loads(data) for (data,) in rows]
+
+
+class SQLiteStorage:
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self.db = _SQLiteDatabase(path)
+        self.questions = SQLiteQuestionBank(self.db)
+        self.rollups = SQLiteRollupStore(self.db)
+
+    # Page titles
+
+    def get_page_titles(self):
+        rows = self.db.connection().execute('SELECT page, title FROM page_titles')
+        return {page: title for page, title in rows}
+
+    def save_page_titles(self, titles):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM page_titles')
+            conn.executemany('INSERT INTO page_titles (page, title) VALUES (?, ?)',
+                             [(str(page), title) for page, title in titles.items()])
+            self.db.bump_meta('page_titles_version')
+
+    def page_titles_version(self):
+        return self.db.meta_value('page_titles_version')
+
+    # Sessions
+
+    @staticmethod
+    def _event_row(session_id, event):
+        event_data = event.get('eventData') if isinstance(event, dict) else None
+        event_data = event_data if isinstance(event_data, dict) else {}
+        timestamp = event_data.get('timestamp')
+        if not isinstance(timestamp, (int, float)):
+            timestamp = None
+        question_key = is_correct = None
+        question_id = counted_answer_id(event)
+        if question_id is not None:
+            # JSON encoded so 5 and "5" stay distinct, as in the file backend
+            question_key = json.dumps(question_id)
+            is_correct = 1 if event_data.get('isCorrect') else 0
+        return (session_id, event.get('eventName'), timestamp, question_key, is_correct,
+                json.dumps(event, ensure_ascii=False))
+
+    def append_events(self, session_id, events):
+        """Insert events and advance the session's summary in one transaction"""
+        events = [e for e in events if isinstance(e, dict)]
+        if not events:
+            return
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT summary FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            record = json.loads(row[0]) if row else new_record()
+            apply_events(record, events)
+            if any(is_progress_event(e) for e in events):
+                # Before the insert, a session without a progress row is rebuilt from its older events
+                answered, correct = self._stored_progress(conn, session_id)
+                self._store_progress(conn, session_id, *apply_progress(answered, correct, events))
+            conn.executemany(
+                'INSERT INTO events (session_id, event_name, timestamp, question_key, is_correct, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)', [self._event_row(session_id, e) for e in events])
+            conn.execute(
+                'INSERT INTO sessions (session_id, os, model, ip, start_time, event_count, summary) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET '
+                'event_count = excluded.event_count, summary = excluded.summary',
+                (session_id, record['os'], record['model'], record['ip'],
+                 record['start_time'] if isinstance(record['start_time'], (int, float)) else None,
+                 record['event_count'], json.dumps(record)))
+
+    @staticmethod
+    def _stored_progress(conn, session_id):
+        row = conn.execute('SELECT answered, correct FROM quiz_progress WHERE session_id = ?',
+                           (session_id,)).fetchone()
+        if row is not None:
+            return decode_bits(row[0]), decode_bits(row[1])
+        rows = conn.execute(
+            'SELECT data FROM events WHERE session_id = ? AND event_name IN (?, ?) ORDER BY id',
+            (session_id,) + PROGRESS_EVENTS)
+        return apply_progress(0, 0, (json.loads(data) for (data,) in rows))
+
+    @staticmethod
+    def _store_progress(conn, session_id, answered, correct):
+        conn.execute(
+            'INSERT INTO quiz_progress (session_id, answered, correct) VALUES (?, ?, ?) '
+            'ON CONFLICT(session_id) DO UPDATE SET answered = excluded.answered, correct = excluded.correct',
+            (session_id, encode_bits(answered), encode_bits(correct)))
+
+    def record_progress(self, session_id, events):
+        """Update the quiz progress of a session from its events without logging them"""
+        events = [e for e in events if is_progress_event(e)]
+        if not events:
+            return
+        with self.db.transaction() as conn:
+            answered, correct = self._stored_progress(conn, session_id)
+            self._store_progress(conn, session_id, *apply_progress(answered, correct, events))
+
+    def session_progress(self, session_id):
+        """Return the (answered, correct) question id bitsets of a session"""
+        row = self.db.connection().execute(
+            'SELECT answered, correct FROM quiz_progress WHERE session_id = ?', (session_id,)).fetchone()
+        if row is not None:
+            return decode_bits(row[0]), decode_bits(row[1])
+        if not self.session_exists(session_id):
+            return 0, 0
+        # Sessions imported or written before the table existed, stored once
+        with self.db.transaction() as conn:
+            answered, correct = self._stored_progress(conn, session_id)
+            self._store_progress(conn, session_id, answered, correct)
+        return answered, correct
+
+    def sync_sessions(self, session_ids):
+        """Make committed events durable, synchronous=NORMAL only syncs the WAL at checkpoints"""
+        self.db.connection().execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def list_session_ids(self):
+        rows = self.db.connection().execute('SELECT session_id FROM sessions ORDER BY session_id')
+        return [session_id for (session_id,) in rows]
+
+    def session_exists(self, session_id):
+        return self.db.connection().execute(
+            'SELECT 1 FROM sessions WHERE session_id = ?', (session_id,)).fetchone() is not None
+
+    def iter_events(self, session_id):
+        rows = self.db.connection().execute(
+            'SELECT data FROM events WHERE session_id = ? ORDER BY id', (session_id,))
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def read_events(self, session_id):
+        return list(self.iter_events(session_id))
+
+    def event_window(self, session_id, offset=0, limit=None, event_name=None, start=None, end=None):
+        if not self.session_exists(session_id):
+            return None
+        where = ['session_id = ?']
+        params = [session_id]
+        if event_name is not None:
+            where.append('event_name = ?')
+            params.append(event_name)
+        if start is not None:
+            where.append('timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            where.append('timestamp < ?')
+            params.append(end)
+        conn = self.db.connection()
+        where = ' AND '.join(where)
+        total = conn.execute(f'SELECT COUNT(*) FROM events WHERE {where}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT data FROM events WHERE {where} ORDER BY id LIMIT ? OFFSET ?',
+                            params + [-1 if limit is None else limit, offset])
+        return total, [json.loads(data) for (data,) in rows]
+
+    def delete_session(self, session_id, before_delete=None):
+        """Delete a session, returns False if there was none
+
+        before_delete(events) is called with the session's events in the same
+        transaction, so no event is appended between the two.
+        """
+        with self.db.transaction() as conn:
+            if before_delete is not None:
+                before_delete(self.iter_events(session_id))
+            conn.execute('DELETE FROM events WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM quiz_progress WHERE session_id = ?', (session_id,))
+            return conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,)).rowcount > 0
+
+    def undated_session_ids(self, before_ms):
+        """Ids of sessions without a start time whose last event is older than before_ms
+
+        Sessions none of whose events has a timestamp cannot be dated and are kept.
+        """
+        rows = self.db.connection().execute(
+            'SELECT s.session_id FROM sessions s WHERE s.start_time IS NULL AND '
+            '(SELECT MAX(e.timestamp) FROM events e WHERE e.session_id = s.session_id) < ? '
+            'ORDER BY s.session_id', (before_ms,))
+        return [session_id for (session_id,) in rows]
+
+    def session_summaries(self):
+        rows = self.db.connection().execute(
+            'SELECT session_id, summary FROM sessions WHERE event_count > 0 ORDER BY session_id')
+        now_ms = time.time() * 1000
+        return [summarize(session_id, json.loads(summary), now_ms) for session_id, summary in rows]
+
+    def query_session_summaries(self, filters=None, after=None, descending=True, limit=None):
+        filters = filters or {}
+        where = ['event_count > 0']
+        params = []
+        for field in ('os', 'model'):
+            if filters.get(field) is not None:
+                where.append(f'{field} = ? COLLATE NOCASE')
+                params.append(filters[field])
+        if filters.get('ip') is not None:
+            where.append('ip = ?')
+            params.append(filters['ip'])
+        if filters.get('start_from') is not None:
+            where.append('start_time >= ?')
+            params.append(filters['start_from'])
+        if filters.get('start_to') is not None:
+            where.append('start_time < ?')
+            params.append(filters['start_to'])
+        if after is not None:
+            where.append(f"(COALESCE(start_time, 0), session_id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = 'DESC' if descending else 'ASC'
+        sql = (f"SELECT session_id, start_time, summary FROM sessions WHERE {' AND '.join(where)} "
+               f"ORDER BY COALESCE(start_time, 0) {direction}, session_id {direction}")
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        now_ms = time.time() * 1000
+        for session_id, start_time, summary in self.db.connection().execute(sql, params):
+            yield sort_key(session_id, start_time), summarize(session_id, json.loads(summary), now_ms)
+
+    def quiz_progress(self):
+        rows = self.db.connection().execute(
+            'SELECT s.session_id, COUNT(DISTINCT e.question_key), COALESCE(SUM(e.is_correct), 0) '
+            'FROM sessions s LEFT JOIN events e '
+            "ON e.session_id = s.session_id AND e.event_name = 'quizAnswer' AND e.question_key IS NOT NULL "
+            'GROUP BY s.session_id ORDER BY s.session_id')
+        return [(session_id, answered, correct) for session_id, answered, correct in rows]
+
+    def import_from(self, source):
+        """Copy questions, page titles and sessions from another storage
+
+        Sessions that already exist here are replaced, so the import can be re-run.
+        Returns the number of imported sessions.
+        """
+        self.questions.save(source.questions.all_questions())
+        self.save_page_titles(source.get_page_titles())
+        count = 0
+        for session_id in source.list_session_ids():
+            try:
+                events = source.read_events(session_id)
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping session %s: %s", session_id, e)
+                continue
+            with self.db.transaction():
+                self.delete_session(session_id)
+                self.append_events(session_id, events)
+            count += 1
+        return count
@@ -0,0 +1,67 @@
+import analytics
+import pytest
+from session_index import apply_events, new_record
+
+
+def _event(name, timestamp, **data):
+    return {'eventName': name, 'eventData': dict(data, timestamp=timestamp)}
+
+
+def _record():
+    return {'page_visits': {}, 'current_page': None, 'page_start_time': None, 'visits_error': False}
+
+
+def test_dwell_per_page():
+    record = _record()
+    analytics.replay_visits(record, [
+        _event('pageView', 0, url='/'),
+        _event('pageView', 60000, url='/quiz/page/1'),
+        _event('quizAnswer', 90000, url='/quiz/page/1'),
+        _event('quizPageNavigation', 120000, toPage=2),
+        _event('quizPageNavigation', 120000, toPage=1),  # no time on page 2, not charged
+        _event('pageView', '1970-01-01T00:03:00.500Z', url='/quiz/page/3'),
+    ])
+    # The quizAnswer restarts the clock, time is counted from the last event
+    assert record['page_visits'] == {'home': 1.0, '1': pytest.approx(0.5 + 60.5 / 60)}
+    assert list(record['page_visits']) == ['home', '1']
+    assert record['current_page'] == '3'
+    assert not record['visits_error']
+
+
+@pytest.mark.parametrize('bad, dwell', [
+    ('not an event', {}),
+    ({'eventName': 'pageView', 'eventData': None}, {}),
+    (_event('quizPageNavigation', None, toPage=4), {}),
+    # A url that is not a string still ends the visit of the page before it
+    (_event('pageView', 3000, url=5), {'home': 0.05}),
+])
+def test_malformed_event_stops_the_replay(bad, dwell):
+    record = new_record()
+    events = [_event('pageView', 0, url='/'), bad, _event('pageView', 9000, url='/quiz/page/1'),
+              _event('pageView', 99000, url='/')]
+    apply_events(record, events)
+    assert record['visits_error']
+    assert record['event_count'] == 4
+    assert record['page_visits'] == dwell
+
+
+def test_chunked_replay_matches_one_pass():
+    events = [_event('pageView' if i % 3 else 'quizPageNavigation', i * 1500,
+                     url=f'/quiz/page/{i % 7}', toPage=i % 5) for i in range(500)]
+    whole, chunked = _record(), _record()
+    analytics.replay_visits(whole, events)
+    analytics.replay_visits(chunked, iter(events), chunk_size=7)
+    assert whole == chunked
+
+
+def test_python_and_numpy_reductions_agree(monkeypatch):
+    events = [_event('pageView', i * 1234, url=f'/quiz/page/{i % 11}') for i in range(300)]
+    columns = analytics.load_columns(events)
+    expected = {'3': 1.0}
+    analytics._add_dwell_python(expected, columns)
+    if analytics.np is None:
+        pytest.skip('NumPy is not installed')
+    totals = {'3': 1.0}
+    analytics._add_dwell_numpy(totals, columns)
+    assert totals == expected
+    assert list(totals) == list(expected)
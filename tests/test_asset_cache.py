@@ -0,0 +1,26 @@
+import gzip
+import json
+import flask_app
+
+
+def test_question_page_is_served_precompressed():
+    with flask_app.app.test_client() as c:
+        plain = c.get('/api/questions/0')
+        if plain.status_code == 404:
+            return  # No questions in this checkout
+        packed = c.get('/api/questions/0', headers={'Accept-Encoding': 'gzip'})
+        assert packed.headers['Content-Encoding'] == 'gzip'
+        assert int(packed.headers['Content-Length']) == len(packed.data) < len(plain.data)
+        assert 'Accept-Encoding' in packed.headers['Vary']
+        assert json.loads(gzip.decompress(packed.data)) == plain.get_json()
+
+
+def test_fingerprinted_static_urls_are_immutable():
+    with flask_app.app.test_request_context():
+        url = flask_app.url_for('static', filename='tracking.js')
+    assert '?v=' in url
+    with flask_app.app.test_client() as c:
+        resp = c.get(url)
+        assert 'immutable' in resp.headers['Cache-Control']
+        assert c.get('/static/tracking.js').headers['Cache-Control'] == 'no-cache'
+        assert c.get(url, headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
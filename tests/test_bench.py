@@ -0,0 +1,30 @@
+import collections
+import session_log
+from bench.corpus import generate_corpus
+from bench.load import compare, run_benchmark
+
+
+def test_generated_corpus_is_deterministic(tmp_path):
+    manifests = [generate_corpus(str(tmp_path / name), 5, pages=3, per_page=10, median_events=40, seed=7)
+                 for name in ('a', 'b')]
+    assert manifests[0] == manifests[1]
+    sessions_dir = str(tmp_path / 'a' / 'sessions')
+    session_ids = session_log.list_session_ids(sessions_dir)
+    assert sorted(session_ids) == sorted(session_log.list_session_ids(str(tmp_path / 'b' / 'sessions')))
+    names = collections.Counter(e['eventName'] for sid in session_ids
+                                for e in session_log.iter_events(sessions_dir, sid))
+    assert sum(names.values()) == manifests[0]['events']
+    assert names['questionView'] and names['quizAnswer'] and names['timeSpent']
+
+
+def test_benchmark_reports_every_scenario(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    generate_corpus(data_dir, 4, pages=2, per_page=5, median_events=20)
+    report = run_benchmark(data_dir, requests=12, threads=3)
+    assert set(report['scenarios']) == {'track', 'questions', 'active_user', 'dashboard_sessions', 'quiz_dashboard'}
+    for result in report['scenarios'].values():
+        assert result['errors'] == 0 and result['requests'] == 12
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'] <= result['max_ms']
+    assert report['corpus']['sessions'] == 4 and report['peak_rss_mb']['self'] > 0
+    rows = compare(report, report)
+    assert all(ratio == 1 for _, _, _, _, ratio in rows if ratio is not None)
@@ -0,0 +1,127 @@
+import socket
+import threading
+
+import flask_app
+import pytest
+import session_log
+from collector import Collector, CollectorClient, CollectorUnavailable
+from storage import JsonFileStorage
+
+
+@pytest.fixture
+def collector(tmp_path):
+    storage = JsonFileStorage(str(tmp_path / 'data'))
+    collector = Collector(storage.append_events, storage.sync_sessions, str(tmp_path / 'ingest.sock'),
+                          fsync='always').serve_in_thread()
+    collector.storage = storage
+    yield collector
+    collector.close()
+
+
+def test_concurrent_batches_are_all_written_in_order(collector):
+    client = CollectorClient(collector.socket_path)
+
+    def send(thread):
+        for i in range(50):
+            client.send({'shared': [{'eventName': 'e', 'eventData': {'thread': thread, 'i': i, 'k': k}}
+                                    for k in range(2)],
+                         f"own-{thread}": [{'eventName': 'e', 'eventData': {'i': i}}]})
+
+    threads = [threading.Thread(target=send, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    events = session_log.read_events(collector.storage.sessions_dir, 'shared')
+    assert len(events) == 6 * 50 * 2
+    for n in range(6):
+        mine = [(e['eventData']['i'], e['eventData']['k']) for e in events if e['eventData']['thread'] == n]
+        assert mine == sorted(mine)
+        assert len(session_log.read_events(collector.storage.sessions_dir, f"own-{n}")) == 50
+    stats = collector.stats()
+    assert stats['batches'] == 300 and stats['write_errors'] == 0
+    # Batches that arrive together are synced together
+    assert 1 <= stats['syncs'] == stats['groups'] <= 300
+
+
+def test_invalid_batch_is_refused(collector):
+    with pytest.raises(OSError):
+        CollectorClient(collector.socket_path).send({'s1': 'not a list'})
+
+
+def test_track_forwards_to_the_collector_and_falls_back_without_one(collector, tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path / 'web'))
+    event = {'sessionId': 's1', 'eventName': 'pageView', 'eventData': {'url': '/', 'timestamp': 1}}
+    with flask_app.app.test_client() as c:
+        monkeypatch.setattr(flask_app, 'ingest_client', CollectorClient(collector.socket_path))
+        assert c.post('/api/track', json=event).status_code == 200
+        assert session_log.read_events(collector.storage.sessions_dir, 's1') == [event]
+
+        monkeypatch.setattr(flask_app, 'ingest_client', CollectorClient(str(tmp_path / 'missing.sock')))
+        with pytest.raises(CollectorUnavailable):
+            flask_app.ingest_client.send({'s1': [event]})
+        assert c.post('/api/track', json=event).status_code == 200
+        assert session_log.read_events(str(tmp_path / 'web' / 'sessions'), 's1') == [event]
+
+
+def test_track_reports_a_failed_collector_write(tmp_path, monkeypatch):
+    def refuse(session_id, events):
+        raise OSError('disk full')
+
+    failing = Collector(refuse, lambda session_ids: None, str(tmp_path / 'failing.sock')).serve_in_thread()
+    try:
+        monkeypatch.setattr(flask_app, 'ingest_client', CollectorClient(failing.socket_path))
+        with flask_app.app.test_client() as c:
+            resp = c.post('/api/track', json={'sessionId': 's1', 'eventName': 'pageView', 'eventData': {}})
+        assert resp.status_code == 503
+        assert resp.get_json()['possibly_written'] is True
+    finally:
+        failing.close()
+
+
+def test_client_reconnects_to_a_restarted_collector(collector):
+    client = CollectorClient(collector.socket_path)
+    client.send({'s1': [1]})
+    collector.close()
+    storage = collector.storage
+    restarted = Collector(storage.append_events, storage.sync_sessions, collector.socket_path).serve_in_thread()
+    try:
+        client.send({'s1': [2]})
+    finally:
+        restarted.close()
+    assert session_log.read_events(storage.sessions_dir, 's1') == [1, 2]
+
+
+def test_batch_is_not_sent_again_after_the_collector_read_it(tmp_path):
+    path = str(tmp_path / 'fake.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    received = []
+
+    def serve():
+        # Acks the first batch, then goes away after reading the second one
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn, conn.makefile('rb') as reader:
+                for line in reader:
+                    received.append(line)
+                    if len(received) > 1:
+                        break
+                    conn.sendall(b'{"ok": true}\n')
+
+    threading.Thread(target=serve, daemon=True).start()
+    client = CollectorClient(path)
+    try:
+        client.send({'s1': [1]})
+        with pytest.raises(OSError) as excinfo:
+            client.send({'s1': [2]})
+        assert not isinstance(excinfo.value, CollectorUnavailable)
+        assert len(received) == 2
+    finally:
+        client.close()
+        server.close()
@@ -0,0 +1,47 @@
+import flask_app
+import pytest
+
+
+def _event(sid, ts, os_name='iOS', ip='1.2.3.4'):
+    return {'sessionId': sid, 'deviceInfo': {'os': os_name, 'model': 'Phone'}, 'ip': ip,
+            'eventName': 'pageView', 'eventData': {'url': '/', 'timestamp': ts}}
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def client(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(flask_app, 'STORAGE_BACKEND', request.param)
+    for i in range(7):
+        flask_app.record_session_events(f's{i}', [_event(f's{i}', 1000 * (i + 1), 'Android' if i % 2 else 'iOS')])
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        yield c
+
+
+def test_cursor_pages_cover_every_session_newest_first(client):
+    seen, cursor = [], None
+    while True:
+        resp = client.get('/api/dashboard/sessions', query_string=dict(limit=3, **({'cursor': cursor} if cursor else {})))
+        seen += [row['id'] for row in resp.get_json()]
+        cursor = resp.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen == [f's{i}' for i in reversed(range(7))]
+
+
+def test_filters_and_ascending_order(client):
+    rows = client.get('/api/dashboard/sessions?os=android&order=asc&from=2000&to=6000').get_json()
+    assert [row['id'] for row in rows] == ['s1', 's3']
+    assert client.get('/api/dashboard/sessions?limit=0').status_code == 400
+    assert client.get('/api/dashboard/sessions?cursor=nope').status_code == 400
+
+
+def test_ndjson_stream(client):
+    resp = client.get('/api/dashboard/sessions?format=ndjson&limit=2')
+    assert resp.mimetype == 'application/x-ndjson'
+    lines = [flask_app.json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [line.get('id') for line in lines[:2]] == ['s6', 's5']
+    rest = client.get('/api/dashboard/sessions', query_string={'cursor': lines[2]['next_cursor']}).get_json()
+    assert [row['id'] for row in rest] == ['s4', 's3', 's2', 's1', 's0']
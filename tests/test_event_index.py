@@ -0,0 +1,93 @@
+import json
+import flask_app
+import pytest
+from event_index import EventIndex
+
+
+def _event(i, name):
+    return {'sessionId': 's1', 'eventName': name, 'eventData': {'timestamp': 1000 + i, 'note': 'é' * (i % 3)}}
+
+
+@pytest.fixture
+def sessions_dir(tmp_path):
+    sessions = tmp_path / 'sessions'
+    sessions.mkdir()
+    legacy = [_event(i, 'questionView' if i % 2 else 'quizAnswer') for i in range(10)]
+    (sessions / 's1.json').write_text(json.dumps(legacy, indent=2, ensure_ascii=False), encoding='utf-8')
+    return sessions
+
+
+def test_window_reads_only_selected_events(sessions_dir, tmp_path):
+    index = EventIndex(str(sessions_dir), str(tmp_path / 'event_index'))
+    total, events = index.window('s1', offset=2, limit=3)
+    assert total == 10 and [e['eventData']['timestamp'] for e in events] == [1002, 1003, 1004]
+    total, events = index.window('s1', event_name='quizAnswer', offset=1, limit=2)
+    assert total == 5 and [e['eventData']['timestamp'] for e in events] == [1002, 1004]
+    total, events = index.window('s1', start=1007, end=1009)
+    assert [e['eventData']['timestamp'] for e in events] == [1007, 1008]
+    assert index.window('missing') is None
+
+
+def test_appended_log_events_are_indexed_incrementally(sessions_dir, tmp_path):
+    index = EventIndex(str(sessions_dir), str(tmp_path / 'event_index'))
+    assert index.window('s1')[0] == 10
+    with open(sessions_dir / 's1.jsonl', 'a', encoding='utf-8') as f:
+        f.write(json.dumps(_event(10, 'pageView')) + '\n')
+    index.window('s1')
+    with open(sessions_dir / 's1.jsonl', 'a', encoding='utf-8') as f:
+        f.write(json.dumps(_event(11, 'pageView')) + '\n{"partial')
+    # A fresh instance reads the persisted index and only tails the log
+    total, events = EventIndex(str(sessions_dir), str(tmp_path / 'event_index')).window('s1', event_name='pageView')
+    assert total == 2 and [e['eventData']['timestamp'] for e in events] == [1010, 1011]
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_session_details_window_endpoint(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(flask_app, 'STORAGE_BACKEND', backend)
+    flask_app.record_session_events('s1', [_event(i, 'quizAnswer' if i % 3 == 0 else 'timeSpent') for i in range(9)])
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        assert len(c.get('/api/dashboard/session/s1').get_json()) == 9
+        resp = c.get('/api/dashboard/session/s1?eventName=quizAnswer&offset=1&limit=1')
+        assert resp.headers['X-Total-Count'] == '3'
+        assert [e['eventData']['timestamp'] for e in resp.get_json()] == [1003]
+        assert c.get('/api/dashboard/session/s1?offset=-1').status_code == 400
+
+
+def test_window_over_compact_file(sessions_dir, tmp_path):
+    import session_log
+    expected = session_log.read_events(str(sessions_dir), 's1')
+    session_log.compact_session(str(sessions_dir), 's1')
+    total, events = EventIndex(str(sessions_dir), str(tmp_path / 'event_index')).window('s1', offset=3, limit=4)
+    assert total == 10 and events == expected[3:7]
+
+
+def test_legacy_array_is_indexed_in_chunks(sessions_dir, tmp_path, monkeypatch):
+    import session_log
+    monkeypatch.setattr(session_log, 'READ_CHUNK_SIZE', 7)
+    legacy = [_event(i, 'quizAnswer') for i in range(10)]
+    text = json.dumps(legacy, indent=2, ensure_ascii=False).replace('\n', '\r\n')
+    (sessions_dir / 's1.json').write_bytes(text.encode('utf-8'))
+    total, events = EventIndex(str(sessions_dir), str(tmp_path / 'event_index')).window('s1')
+    assert total == 10 and events == legacy
+
+
+def test_window_survives_compaction_after_refresh(sessions_dir, tmp_path, monkeypatch):
+    import session_log
+    expected = session_log.read_events(str(sessions_dir), 's1')
+    index = EventIndex(str(sessions_dir), str(tmp_path / 'event_index'))
+    refresh = index._refresh
+    compacted = []
+
+    def refresh_then_compact(session_id):
+        result = refresh(session_id)
+        if not compacted:
+            compacted.append(session_log.compact_session(str(sessions_dir), session_id))
+        return result
+
+    monkeypatch.setattr(index, '_refresh', refresh_then_compact)
+    total, events = index.window('s1', offset=2, limit=5)
+    assert compacted and total == 10 and events == expected[2:7]
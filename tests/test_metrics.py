@@ -0,0 +1,30 @@
+import flask_app
+from metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    registry.histogram('latency', 'Latency', (0.1, 1.0))
+    registry.observe('latency', 0.05, endpoint='a')
+    registry.observe('latency', 0.5, endpoint='a')
+    registry.observe('latency', 5, endpoint='a')
+    text = registry.render()
+    assert 'latency_bucket{endpoint="a",le="0.1"} 1' in text
+    assert 'latency_bucket{endpoint="a",le="1.0"} 2' in text
+    assert 'latency_bucket{endpoint="a",le="+Inf"} 3' in text
+    assert 'latency_count{endpoint="a"} 3' in text
+
+
+def test_metrics_endpoint_is_admin_only_and_counts_requests():
+    with flask_app.app.test_client() as c:
+        assert c.get('/metrics').status_code == 401
+        c.get('/api/questions/999999')
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        resp = c.get('/metrics')
+        assert resp.status_code == 200
+        assert resp.content_type.startswith('text/plain; version=0.0.4')
+        text = resp.get_data(as_text=True)
+        assert 'http_requests_total{endpoint="get_questions",method="GET",status="404"}' in text
+        assert 'http_request_duration_seconds_count{endpoint="get_questions"}' in text
@@ -0,0 +1,92 @@
+import flask_app
+from presence import PresenceTracker, SQLitePresence, CountBroadcaster
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_sessions_expire_after_ttl_and_empty_pages_are_dropped():
+    clock = FakeClock()
+    tracker = PresenceTracker(ttl=300, resolution=5, clock=clock)
+    tracker.touch('a', 1)
+    tracker.touch('b', 1)
+    tracker.touch('c', 2)
+    clock.now += 200
+    tracker.touch('a', 1)  # heartbeat moves a to a later slot
+    clock.now += 150
+    tracker.sweep()
+    assert tracker.counts() == {1: 1}
+    clock.now += 200
+    tracker.sweep()
+    assert tracker.counts() == {}
+    assert tracker.count(1) == 0
+
+
+def test_inactive_removes_immediately():
+    tracker = PresenceTracker(clock=FakeClock())
+    tracker.touch('a', 3)
+    tracker.touch('a', 3, is_active=False)
+    assert tracker.counts() == {}
+
+
+def test_all_pages_endpoint(monkeypatch):
+    monkeypatch.setattr(flask_app, 'presence', PresenceTracker(clock=FakeClock()))
+    with flask_app.app.test_client() as c:
+        c.post('/api/active-user', json={'sessionId': 's1', 'page': 0})
+        c.post('/api/active-user', json={'sessionId': 's2', 'page': 0})
+        c.post('/api/active-user', json={'sessionId': 's3', 'page': 4})
+        assert c.get('/api/active-users').get_json() == {'pages': {'0': 2, '4': 1}, 'total': 3}
+        assert c.get('/api/active-users/0').get_json() == {'page': 0, 'active_users': 2}
+
+
+def test_count_stream_pushes_only_changes(monkeypatch):
+    tracker = PresenceTracker(clock=FakeClock())
+    monkeypatch.setattr(flask_app, 'presence', tracker)
+    monkeypatch.setattr(flask_app, 'presence_broadcaster',
+                        CountBroadcaster(tracker.counts, interval=0.01))
+    monkeypatch.setattr(flask_app, 'ACTIVE_USERS_KEEPALIVE', 0.05)
+    with flask_app.app.test_client() as c:
+        resp = c.get('/api/active-users/2/stream', buffered=False)
+        assert resp.mimetype == 'text/event-stream'
+        chunks = iter(resp.response)
+        assert b'"active_users": 0' in next(chunks)
+        assert next(chunks) == b': keepalive\n\n'
+        tracker.touch('a', 2)
+        tracker.touch('b', 5)
+        assert b'"active_users": 1' in next(chunks)
+        resp.close()
+
+
+def test_count_stream_ends_so_the_browser_reconnects(monkeypatch):
+    tracker = PresenceTracker(clock=FakeClock())
+    monkeypatch.setattr(flask_app, 'presence', tracker)
+    monkeypatch.setattr(flask_app, 'presence_broadcaster',
+                        CountBroadcaster(tracker.counts, interval=0.01))
+    monkeypatch.setattr(flask_app, 'ACTIVE_USERS_KEEPALIVE', 0.05)
+    monkeypatch.setattr(flask_app, 'ACTIVE_USERS_STREAM_SECONDS', 0.2)
+    with flask_app.app.test_client() as c:
+        resp = c.get('/api/active-users/2/stream', buffered=False)
+        chunks = list(resp.response)
+        resp.close()
+    assert chunks[0].startswith(b'retry: 5000\n')
+    assert 2 <= len(chunks) <= 6
+
+
+def test_sqlite_presence_is_shared_between_workers(tmp_path):
+    clock = FakeClock()
+    worker_a = SQLitePresence(str(tmp_path / 'presence.db'), clock=clock)
+    worker_b = SQLitePresence(str(tmp_path / 'presence.db'), clock=clock)
+    worker_a.touch('s1', 1)
+    worker_b.touch('s2', 1)
+    worker_b.touch('s3', 2)
+    assert worker_a.count(1) == worker_b.count(1) == 2
+    worker_a.touch('s3', 2, is_active=False)
+    assert worker_b.counts() == {1: 2}
+    clock.now += 301
+    assert worker_a.counts() == {}
+    assert worker_b.sweep() == 2
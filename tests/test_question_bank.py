@@ -0,0 +1,178 @@
+import json
+import os
+import pytest
+from question_bank import QuestionBank
+from storage import SQLiteStorage
+
+
+def _write(path, questions):
+    path.write_text(json.dumps(questions))
+
+
+def test_bank_serves_from_memory_and_revalidates(tmp_path):
+    _write(tmp_path / 'questions_0.json', [{'id': 1, 'page': 0}])
+    _write(tmp_path / 'questions_2.json', [{'id': 2, 'page': 2}, {'id': 3, 'page': 2}])
+    bank = QuestionBank(str(tmp_path), revalidate_interval=3600)
+
+    assert bank.page_numbers() == [0, 2]
+    assert bank.page(1) is None
+    assert bank.get(3)['page'] == 2
+    assert bank.total_count() == 3
+    assert [q['id'] for q in bank.all_questions()] == [1, 2, 3]
+
+    # Not seen until the interval expires or the bank is bumped
+    _write(tmp_path / 'questions_0.json', [{'id': 1, 'page': 0}, {'id': 4, 'page': 0}])
+    os.utime(tmp_path / 'questions_0.json', ns=(1, 1))
+    assert len(bank.page(0)) == 1
+    bank.bump()
+    assert len(bank.page(0)) == 2
+
+    # all_questions() hands out copies the admin code may modify
+    bank.all_questions()[0]['page'] = 5
+    assert bank.get(1)['page'] == 0
+
+
+def test_summary_endpoint_counts_pages(tmp_path, monkeypatch):
+    import flask_app
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    _write(tmp_path / 'questions_1.json', [{'id': 1, 'page': 1}, {'id': 2, 'page': 1}])
+    _write(tmp_path / 'questions_3.json', [{'id': 3, 'page': 3}])
+    (tmp_path / 'page-title.json').write_text(json.dumps({'1': 'First'}))
+    with flask_app.app.test_client() as c:
+        resp = c.get('/api/questions/summary')
+        data = resp.get_json()
+        assert (data['start_page'], data['end_page'], data['total_questions']) == (1, 3, 3)
+        assert data['counts'] == {'1': 2, '3': 1}
+        assert data['titles'] == {'1': 'First'}
+        assert c.get('/api/questions/summary', headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+
+def test_save_rewrites_only_changed_pages(tmp_path):
+    _write(tmp_path / 'questions_0.json', [{'id': 1, 'page': 0}])
+    _write(tmp_path / 'questions_1.json', [{'id': 2, 'page': 1}])
+    _write(tmp_path / 'questions_2.json', [{'id': 3, 'page': 2}])
+    os.utime(tmp_path / 'questions_0.json', ns=(1, 1))
+    bank = QuestionBank(str(tmp_path))
+
+    questions = bank.all_questions()
+    questions[1]['text'] = 'edited'
+    questions[2]['page'] = 0
+    changed = bank.save(questions)
+
+    assert sorted(changed) == [0, 1, 2]
+    assert not (tmp_path / 'questions_2.json').exists()
+    assert [q['id'] for q in bank.page(0)] == [1, 3]
+    assert bank.save(bank.all_questions()) == []
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_edits_keep_ids_and_rewrite_only_changed_pages(tmp_path, backend):
+    if backend == 'json':
+        bank = QuestionBank(str(tmp_path))
+    else:
+        bank = SQLiteStorage(str(tmp_path / 'app.db')).questions
+    bank.save([{'id': 1, 'page': 0}, {'id': 2, 'page': 0}, {'id': 3, 'page': 0}, {'id': 4, 'page': 1}])
+
+    assert bank.delete(4) and not bank.delete(4)
+    assert bank.page(1) is None
+    # The id of a deleted question is not handed out again
+    assert bank.add({'question': 'new'}, page=1)['id'] == 5
+    assert bank.allocate_id() == 6
+
+    assert bank.move([(3, 0, 0), (1, 1, 0)]) == [0, 1]
+    assert [q['id'] for q in bank.page(0)] == [3, 2]
+    assert [(q['id'], q['page']) for q in bank.page(1)] == [(1, 1), (5, 1)]
+    assert bank.move([(2, 0, 1)]) == []
+
+    assert bank.update(2, {'question': 'edited', 'page': 0})['id'] == 2
+    assert [q['id'] for q in bank.page(0)] == [3, 2] and bank.get(2)['question'] == 'edited'
+    with pytest.raises(ValueError):
+        bank.update(2, {'id': 3, 'page': 0})
+    with pytest.raises(KeyError):
+        bank.move([(99, 0, 0)])
+    assert bank.update(99, {}) is None
+
+
+def test_admin_endpoints_do_not_renumber(tmp_path, monkeypatch):
+    import flask_app
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    _write(tmp_path / 'questions_0.json', [{'id': i, 'page': 0} for i in (1, 2, 3)])
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        assert c.delete('/api/admin/question/1').status_code == 200
+        assert c.delete('/api/admin/question/1').status_code == 404
+        resp = c.patch('/api/admin/questions/reorder', json={'moves': [{'id': 3, 'page': 1, 'position': 0}]})
+        assert resp.get_json() == {'success': True, 'pages': [0, 1]}
+        added = c.post('/api/admin/question', json={'question': 'q', 'options': [], 'page': 1}).get_json()
+        assert added['question']['id'] == 4
+        assert [q['id'] for q in c.get('/api/questions/0').get_json()] == [2]
+        assert [q['id'] for q in c.get('/api/questions/1').get_json()] == [3, 4]
+        assert c.patch('/api/admin/questions/reorder', json={'moves': [{'id': 9}]}).status_code == 404
+
+
+def _question(qid=None, page=0, **fields):
+    question = dict({'question': f'Q{qid}', 'options': [{'id': 'A', 'text': 'a'}, {'id': 'B', 'text': 'b'}],
+                     'correct_answer': 'A', 'explanation': '', 'page': page}, **fields)
+    if qid is not None:
+        question['id'] = qid
+    return question
+
+
+def test_import_and_export_stream_ndjson(tmp_path, monkeypatch):
+    import flask_app
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    _write(tmp_path / 'questions_0.json', [_question(1), _question(2)])
+    _write(tmp_path / 'questions_1.json', [_question(3, page=1)])
+    os.utime(tmp_path / 'questions_1.json', ns=(1, 1))
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+
+        bad = [_question(), _question(options=[]), _question(correct_answer='C'),
+               _question(page=-1)]
+        resp = c.post('/api/admin/questions/import', data=''.join(json.dumps(q) + '\n' for q in bad) + '{x\n',
+                      content_type='application/x-ndjson')
+        assert resp.status_code == 400
+        assert [e['record'] for e in resp.get_json()['errors']] == [2, 3, 4, 5]
+        assert flask_app.get_question_bank().total_count() == 3
+
+        lines = [_question(2, question='edited'), _question(page=2), _question(page=2)]
+        resp = c.post('/api/admin/questions/import', data='\n'.join(json.dumps(q) for q in lines),
+                      content_type='application/x-ndjson')
+        assert resp.get_json() == {'success': True, 'added': 2, 'updated': 1, 'removed': 0, 'pages': [0, 2]}
+        assert os.stat(tmp_path / 'questions_1.json').st_mtime_ns == 1  # untouched page
+
+        exported = [json.loads(line) for line in c.get('/api/admin/questions/export').get_data(as_text=True).splitlines()]
+        assert [(q['id'], q['page']) for q in exported] == [(1, 0), (2, 0), (3, 1), (4, 2), (5, 2)]
+        assert exported[1]['question'] == 'edited'
+
+        resp = c.post('/api/admin/questions/import?mode=replace', json=exported[3:])
+        assert resp.get_json()['removed'] == 3
+        assert flask_app.get_question_bank().page_numbers() == [2]
+        # Ids of the removed questions are not handed out again
+        assert c.post('/api/admin/question', json=_question()).get_json()['question']['id'] == 6
+
+
+def test_bundled_bank_survives_export_and_import(tmp_path, monkeypatch):
+    import flask_app
+    bundled = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    for name in os.listdir(bundled):
+        if name.startswith('questions_') and name.endswith('.json'):
+            with open(os.path.join(bundled, name), encoding='utf-8') as f:
+                _write(tmp_path / name, json.load(f))
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        exported = c.get('/api/admin/questions/export').get_data(as_text=True)
+        resp = c.post('/api/admin/questions/import', data=exported, content_type='application/x-ndjson')
+        assert resp.status_code == 200, resp.get_json()
+        assert resp.get_json()['added'] == 0
+        assert resp.get_json()['updated'] == len(exported.splitlines())
+        assert c.get('/api/admin/questions/export').get_data(as_text=True) == exported
+    flask_app.invalidate_question_caches()
@@ -0,0 +1,123 @@
+import json
+import multiprocessing
+import pytest
+import flask_app
+import session_log
+from quiz_stats import QuizStatsStore, fcntl
+
+
+def _answer(qid, correct):
+    return {'sessionId': 'q1', 'deviceInfo': {}, 'ip': '1.2.3.4', 'eventName': 'quizAnswer',
+            'eventData': {'questionId': qid, 'isCorrect': correct, 'timestamp': 1}}
+
+
+def test_quiz_counters_follow_ingest(tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    (tmp_path / 'questions_0.json').write_text(json.dumps([{'id': i} for i in range(1, 5)]))
+    flask_app.invalidate_question_caches()
+    sessions = tmp_path / 'sessions'
+    sessions.mkdir()
+    # A legacy session without counters gets backfilled
+    (sessions / 'q1.json').write_text(json.dumps([_answer(1, True)]))
+
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        [row] = c.get('/api/quiz_dashboard/data').get_json()
+        assert (row['answered'], row['correct'], row['total']) == (1, 1, 4)
+
+        flask_app.record_session_events('q1', [_answer(1, False), _answer(2, True)])
+        [row] = c.get('/api/quiz_dashboard/data').get_json()
+        assert (row['answered'], row['correct'], row['progress_percentage']) == (2, 2, 50)
+
+        # Ids that are not strings or integers are ignored
+        flask_app.record_session_events('q1', [_answer([1], True), _answer({'id': 1}, True), _answer(True, True)])
+        [row] = c.get('/api/quiz_dashboard/data').get_json()
+        assert (row['answered'], row['correct']) == (2, 2)
+
+        # Answers migrated from the progress cookies restore progress without being counted again
+        migrated = _answer(3, True)
+        migrated['eventData']['migrated'] = True
+        flask_app.record_session_events('q1', [migrated])
+        [row] = c.get('/api/quiz_dashboard/data').get_json()
+        assert (row['answered'], row['correct']) == (2, 2)
+        assert flask_app.get_storage().session_progress('q1')[0] == 0b1110
+
+        flask_app.save_all_questions([{'id': 1, 'page': 0}, {'id': 2, 'page': 0}])
+        [row] = c.get('/api/quiz_dashboard/data').get_json()
+        assert row['total'] == 2
+    flask_app.invalidate_question_caches()
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_progress_endpoint_counts_answers_per_page(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(flask_app, 'STORAGE_BACKEND', backend)
+    flask_app.save_all_questions([{'id': i, 'page': 0} for i in (1, 2, 3)] + [{'id': 7, 'page': 1}])
+    flask_app.record_session_events('p1', [_answer(1, True), _answer('2', False), _answer(7, True),
+                                           _answer(10 ** 9, True)])
+
+    with flask_app.app.test_client() as c:
+        assert c.get('/api/progress').status_code == 400
+        c.set_cookie('user_session_id', 'p1')
+        data = c.get('/api/progress').get_json()
+        assert (data['answered'], data['correct'], data['total_questions']) == (3, 2, 4)
+        assert data['pages'] == {
+            '0': {'answered': 2, 'correct': 1, 'total': 3, 'answered_ids': [1, 2], 'correct_ids': [1]},
+            '1': {'answered': 1, 'correct': 1, 'total': 1, 'answered_ids': [7], 'correct_ids': [7]}}
+
+        # Answering again replaces the outcome, a reset forgets the questions
+        flask_app.record_session_events('p1', [_answer(2, True), dict(_answer(None, False), eventName='quizReset',
+                                                                      eventData={'questionIds': [1, '7']})])
+        # The session comes from the cookie only
+        data = c.get('/api/progress?sessionId=unknown').get_json()
+        assert (data['answered'], data['correct'], data['pages']['0']['answered_ids']) == (1, 1, [2])
+
+        # Logged-in sessions keep their progress, but none of their events are tracked
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+        c.post('/api/track', json=dict(_answer(3, True), sessionId='p1'))
+        c.post('/api/track/batch', json=[dict(_answer(1, True), sessionId='admin1'),
+                                         dict(_answer(None, False), sessionId='admin1', eventName='pageView')])
+        assert c.get('/api/progress').get_json()['answered'] == 2
+        assert [e['eventName'] for e in flask_app.get_storage().read_events('p1')][-1] == 'quizReset'
+        c.set_cookie('user_session_id', 'admin1')
+        assert c.get('/api/progress').get_json()['answered'] == 1
+        assert not flask_app.get_storage().session_exists('admin1')
+        assert 'admin1' not in [sid for sid, _, _ in flask_app.get_storage().quiz_progress()]
+
+        c.set_cookie('user_session_id', 'unknown')
+        assert c.get('/api/progress').get_json()['answered'] == 0
+        c.set_cookie('user_session_id', '../etc')
+        assert c.get('/api/progress').status_code == 400
+    assert not (tmp_path / 'quiz_stats' / 'unknown.json').exists()
+    flask_app.invalidate_question_caches()
+
+
+def test_counters_without_bitsets_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    flask_app.record_session_events('q1', [_answer(3, True)])
+    (tmp_path / 'quiz_stats' / 'q1.json').write_text(json.dumps({'answered': [3], 'correct': 1}))
+    assert flask_app.get_storage().session_progress('q1') == (1 << 3, 1 << 3)
+
+
+def _record_answers(data_dir, first):
+    sessions_dir = str(data_dir / 'sessions')
+    store = QuizStatsStore(str(data_dir / 'quiz_stats'),
+                           lambda sid: session_log.iter_events(sessions_dir, sid))
+    for qid in range(first, first + 40):
+        store.record_events('m1', [_answer(qid, True)],
+                            lambda sid, events: session_log.append_events(sessions_dir, sid, events))
+
+
+@pytest.mark.skipif(fcntl is None, reason='needs flock')
+def test_counters_are_locked_across_processes(tmp_path):
+    workers = [multiprocessing.Process(target=_record_answers, args=(tmp_path, first)) for first in (0, 40, 80)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stats = json.loads((tmp_path / 'quiz_stats' / 'm1.json').read_text())
+    assert (len(stats['answered']), stats['correct']) == (120, 120)
+    assert sorted(p.name for p in (tmp_path / 'quiz_stats').iterdir()) == ['m1.json', 'm1.lock']
@@ -0,0 +1,152 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import flask_app
+import pytest
+from jobs import JobRunner
+from retention import RollupStore, bulk_delete, retention_filters
+from storage import JsonFileStorage, SQLiteStorage
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def _events(sid, start, os_name):
+    header = {'sessionId': sid, 'deviceInfo': {'os': os_name, 'model': 'Phone'}, 'ip': '1.2.3.4'}
+    return [
+        dict(header, eventName='pageView', eventData={'url': '/quiz/page/1', 'timestamp': start}),
+        dict(header, eventName='quizAnswer',
+             eventData={'url': '/quiz/page/1', 'questionId': 7, 'isCorrect': True, 'timestamp': start + 1000}),
+        dict(header, eventName='quizPageNavigation', eventData={'toPage': 2, 'timestamp': start + 60000}),
+    ]
+
+
+def _wait(client, job):
+    for _ in range(200):
+        job = client.get(f"/api/admin/jobs/{job['id']}").get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_retention_rolls_up_and_deletes_old_sessions(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(flask_app, 'STORAGE_BACKEND', backend)
+    old = 1700000000000  # 2023-11-14
+    now = time.time() * 1000
+    flask_app.record_session_events('old1', _events('old1', old, 'iOS'))
+    flask_app.record_session_events('old2', _events('old2', old + 1000, 'Android'))
+    flask_app.record_session_events('new', _events('new', now - DAY_MS, 'iOS'))
+
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        resp = c.post('/api/admin/retention/run', json={'days': 30})
+        assert resp.status_code == 202
+        job = _wait(c, resp.get_json())
+        assert job['status'] == 'done' and (job['done'], job['total']) == (2, 2)
+        assert job['result']['deleted'] == 2
+
+        assert [row['id'] for row in c.get('/api/dashboard/sessions').get_json()] == ['new']
+        [day] = c.get('/api/dashboard/rollups').get_json()
+        assert day['day'] == '2023-11-14' and day['sessions'] == 2 and day['events'] == 6
+        assert day['quiz'] == {'answers': 2, 'correct': 2, 'questions': {'7': {'answers': 2, 'correct': 2}}}
+        assert day['devices']['os'] == {'iOS': 1, 'Android': 1}
+        # Time is counted from the last event on the page, as on the live dashboard
+        assert day['page_dwell_minutes'] == {'1': pytest.approx(2 * 59 / 60)}
+        assert 'session_ids' not in day
+
+
+def test_bulk_delete_requires_a_filter(tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    flask_app.record_session_events('a', _events('a', 1000, 'iOS'))
+    flask_app.record_session_events('b', _events('b', 2000, 'Android'))
+    with flask_app.app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        assert c.post('/api/admin/sessions/bulk-delete', json={}).status_code == 400
+        job = _wait(c, c.post('/api/admin/sessions/bulk-delete', json={'os': 'android', 'rollup': False}).get_json())
+        assert job['result'] == {'matched': 1, 'deleted': 1, 'rolled_up': 0, 'undated': 0, 'failed': []}
+        assert [row['id'] for row in c.get('/api/dashboard/sessions').get_json()] == ['a']
+        assert c.get('/api/dashboard/rollups').get_json() == []
+
+
+def test_retention_prunes_old_sessions_without_a_start_time(tmp_path):
+    storage = JsonFileStorage(str(tmp_path))
+    os.makedirs(storage.sessions_dir)
+    for name, content in (('empty.jsonl', ''), ('corrupt.json', '[{"eventName": '), ('recent.json', '[')):
+        (tmp_path / 'sessions' / name).write_text(content)
+    old = 1700000000
+    for name in ('empty.jsonl', 'corrupt.json'):
+        os.utime(tmp_path / 'sessions' / name, (old, old))
+    storage.append_events('dated', _events('dated', old * 1000, 'iOS'))
+
+    result = bulk_delete(storage, retention_filters(30, time.time() * 1000), undated_before=(old + 60) * 1000)
+    assert (result['deleted'], result['rolled_up'], result['undated'], result['failed']) == (3, 1, 2, [])
+    assert storage.list_session_ids() == ['recent']
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_events_appended_during_the_rollup_are_kept(backend, tmp_path):
+    storage = JsonFileStorage(str(tmp_path)) if backend == 'json' else SQLiteStorage(str(tmp_path / 'app.db'))
+    storage.append_events('s1', _events('s1', 1700000000000, 'iOS'))
+    late = _events('s1', 1800000000000, 'iOS')[:1]
+    appender = threading.Thread(target=storage.append_events, args=('s1', late))
+    add = storage.rollups.add
+
+    def add_while_appending(*args):
+        add(*args)
+        # The append has to wait until the session is deleted
+        appender.start()
+        appender.join(0.2)
+
+    storage.rollups.add = add_while_appending
+    assert bulk_delete(storage, {'start_to': 1750000000000})['deleted'] == 1
+    appender.join()
+    assert storage.read_events('s1') == late
+    assert storage.rollups.days()[0]['events'] == 3
+
+
+def test_job_state_is_shared_through_the_jobs_directory(tmp_path):
+    runner = JobRunner(str(tmp_path))
+    job = runner.submit('count', lambda progress: progress(1, 1) or 'ok')
+    for _ in range(200):
+        if runner.get(job['id'])['status'] == 'done':
+            break
+        time.sleep(0.01)
+    # Another worker process reads the same directory
+    other = JobRunner(str(tmp_path))
+    assert other.get(job['id'])['result'] == 'ok'
+    assert [j['id'] for j in other.list()] == [job['id']]
+    assert other.get('../' + job['id']) is None
+
+    # A job left running by a process that is gone is reported as failed
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    stale = dict(job, id='0' * 32, status='running', finished_at=None, pid=exited.pid)
+    (tmp_path / f"{stale['id']}.json").write_text(json.dumps(stale))
+    assert other.get(stale['id'])['status'] == 'failed'
+
+
+def _roll_up(rollup_dir, worker):
+    store = RollupStore(rollup_dir)
+    for i in range(30):
+        store.add(f"w{worker}-{i}", '2023-11-14', {'events': 1, 'page_dwell_minutes': {}, 'questions': {},
+                                                    'os': 'iOS', 'model': 'Phone'})
+
+
+def test_rollups_are_locked_across_processes(tmp_path):
+    workers = [multiprocessing.Process(target=_roll_up, args=(str(tmp_path), n)) for n in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    [day] = RollupStore(str(tmp_path)).days()
+    assert (day['sessions'], day['events'], day['devices']['os']) == (90, 90, {'iOS': 90})
@@ -0,0 +1,49 @@
+import pytest
+import session_log
+from scan import ScanPool
+from storage import JsonFileStorage
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = ScanPool(2)
+    yield pool
+    pool.close()
+
+
+def _events(sid, n):
+    header = {'sessionId': sid, 'deviceInfo': {'os': 'iOS', 'model': 'Phone'}, 'ip': '1.2.3.4'}
+    return [dict(header, eventName='quizAnswer' if i % 2 else 'pageView',
+                 eventData={'url': f'/quiz/page/{i % 3}', 'questionId': i, 'isCorrect': i % 4 == 1,
+                            'timestamp': 1700000000000 + i * 1000})
+            for i in range(n)]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_map_keeps_order_and_reports_errors(workers, pool):
+    scanner = pool if workers > 1 else ScanPool(1)
+    results = list(scanner.map(int, [('1',), ('x',), ('3',)]))
+    assert [(args, result) for args, result, _ in results] == [(('1',), 1), (('x',), None), (('3',), 3)]
+    assert [type(e) for _, _, e in results] == [type(None), ValueError, type(None)]
+
+
+def test_pool_and_serial_scans_agree(tmp_path, pool):
+    for data_dir in ('serial', 'pool'):
+        sessions_dir = str(tmp_path / data_dir / 'sessions')
+        for i in range(5):
+            session_log.append_events(sessions_dir, f's{i}', _events(f's{i}', 10 + i))
+        with open(f"{sessions_dir}/broken.json", 'w') as f:
+            f.write('[{"eventName": ')
+    serial = JsonFileStorage(str(tmp_path / 'serial'))
+    parallel = JsonFileStorage(str(tmp_path / 'pool'), scanner=pool)
+
+    def records(storage):
+        storage.session_index.refresh()
+        return {sid: {k: v for k, v in record.items() if k != 'files'}
+                for sid, record in storage.session_index._records.items()}
+
+    assert records(parallel) == records(serial)
+    assert parallel.session_index._records['broken']['invalid']
+    assert sorted(parallel.quiz_progress()) == sorted(serial.quiz_progress())
+    assert ('s3', 6, 3) in parallel.quiz_progress()
+    assert pool._executor is not None
@@ -0,0 +1,71 @@
+import multiprocessing
+import session_log
+from session_index import SessionIndex
+
+
+def _event(name, url, ts, **data):
+    return {'sessionId': 's1', 'deviceInfo': {'os': 'Android', 'model': 'Pixel'}, 'ip': '1.2.3.4',
+            'eventName': name, 'eventData': dict(data, url=url, timestamp=ts)}
+
+
+def test_index_replays_only_the_new_tail(tmp_path):
+    sessions_dir = str(tmp_path / 'sessions')
+    index_path = str(tmp_path / 'index.json')
+    session_log.append_events(sessions_dir, 's1', [
+        _event('pageView', '/quiz/page/0', 0),
+        _event('quizPageNavigation', '/quiz/page/0', 60000, toPage=1),
+    ])
+    index = SessionIndex(sessions_dir, index_path)
+    [row] = index.summaries()
+    assert row['os'] == 'Android' and row['start_time'] == 0
+    assert row['page_visits']['0'] == 1.0
+
+    session_log.append_event(sessions_dir, 's1', _event('pageView', '/', 180000))
+    record = index._records['s1']
+    first_offset = record['files']['s1.jsonl']['offset']
+    [row] = index.summaries()
+    assert index._records['s1']['files']['s1.jsonl']['offset'] > first_offset
+    assert row['page_visits']['0'] == 1.0
+    assert row['page_visits']['1'] == 2.0
+    assert 'home' in row['page_visits']
+
+    # A fresh process picks up the persisted records
+    assert SessionIndex(sessions_dir, index_path).summaries()[0]['page_visits']['1'] == 2.0
+
+
+def _refresh_repeatedly(sessions_dir, index_path, worker):
+    index = SessionIndex(sessions_dir, index_path)
+    for i in range(20):
+        session_log.append_event(sessions_dir, f"w{worker}-{i}", _event('pageView', '/', i))
+        index.refresh()
+
+
+def test_concurrent_refreshes_across_processes(tmp_path):
+    sessions_dir = str(tmp_path / 'sessions')
+    index_path = str(tmp_path / 'index.json')
+    workers = [multiprocessing.Process(target=_refresh_repeatedly, args=(sessions_dir, index_path, n))
+               for n in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0, 0, 0]
+    assert len(SessionIndex(sessions_dir, index_path).summaries()) == 60
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['index.json', 'sessions']
+
+
+def test_limited_query_pages_match_the_full_order(tmp_path):
+    sessions_dir = str(tmp_path / 'sessions')
+    for i in range(9):
+        session_log.append_event(sessions_dir, f"s{i}", _event('pageView', '/', 1000 * (i % 4)))
+    index = SessionIndex(sessions_dir, str(tmp_path / 'index.json'))
+    for descending in (True, False):
+        full = [key for key, row in index.query(descending=descending)]
+        paged, after = [], None
+        while True:
+            page = [key for key, row in index.query(after=after, descending=descending, limit=2)]
+            if not page:
+                break
+            paged += page
+            after = page[-1]
+        assert paged == full and len(full) == 9
@@ -0,0 +1,94 @@
+import io
+import json
+import flask_app
+import pytest
+import session_log
+import threading
+
+
+def _event(sid, name, ts):
+    return {'sessionId': sid, 'deviceInfo': {'os': 'Linux', 'model': 'Desktop'}, 'ip': '1.2.3.4',
+            'eventName': name, 'eventData': {'url': '/quiz/page/0', 'timestamp': ts}}
+
+
+def test_reads_legacy_and_log_formats(tmp_path):
+    sessions_dir = str(tmp_path)
+    legacy = [_event('s1', 'pageView', 1000)]
+    with open(tmp_path / 's1.json', 'w', encoding='utf-8') as f:
+        json.dump(legacy, f, indent=2)
+    session_log.append_event(sessions_dir, 's1', _event('s1', 'pageBlur', 2000))
+
+    events = session_log.read_events(sessions_dir, 's1')
+    assert [e['eventName'] for e in events] == ['pageView', 'pageBlur']
+    assert session_log.list_session_ids(sessions_dir) == ['s1']
+
+    assert session_log.migrate_session(sessions_dir, 's1')
+    assert not (tmp_path / 's1.json').exists()
+    assert session_log.read_events(sessions_dir, 's1') == events
+
+
+@pytest.mark.skipif(session_log.fcntl is None, reason='needs flock')
+def test_append_during_migration_is_kept(tmp_path, monkeypatch):
+    sessions_dir = str(tmp_path)
+    (tmp_path / 's3.json').write_text(json.dumps([_event('s3', 'pageView', 1000)]))
+    read_events = session_log.read_events
+    appender = threading.Thread(target=session_log.append_event,
+                                args=(sessions_dir, 's3', _event('s3', 'pageBlur', 2000)))
+
+    def append_after_read(*args):
+        events = read_events(*args)
+        # The append has to wait for the migration to replace the log
+        appender.start()
+        appender.join(0.2)
+        return events
+
+    monkeypatch.setattr(session_log, 'read_events', append_after_read)
+    assert session_log.migrate_session(sessions_dir, 's3')
+    appender.join()
+    assert [e['eventName'] for e in read_events(sessions_dir, 's3')] == ['pageView', 'pageBlur']
+
+
+def test_track_appends_one_line_per_event(tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    with flask_app.app.test_client() as c:
+        for ts in (1000, 2000, 3000):
+            resp = c.post('/api/track', json=_event('s2', 'timeSpent', ts))
+            assert resp.status_code == 200
+    with open(tmp_path / 'sessions' / 's2.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+
+
+def test_compact_encoding_round_trips(tmp_path):
+    sessions_dir = str(tmp_path)
+    events = [
+        _event('s3', 'pageView', 1000),
+        _event('s3', 'quizAnswer', 2000),
+        dict(_event('s3', 'quizAnswer', 3000), ip='5.6.7.8'),
+        {'sessionId': 's3', 'eventName': 'timeSpent', 'eventData': {'timestamp': '2025-01-01T00:00:00Z'}},
+        {'sessionId': 's3', 'eventName': None},
+    ]
+    with open(tmp_path / 's3.json', 'w', encoding='utf-8') as f:
+        json.dump(events[:2], f, indent=2)
+    session_log.append_events(sessions_dir, 's3', events[2:])
+
+    old_size, new_size = session_log.compact_session(sessions_dir, 's3')
+    assert new_size < old_size
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['s3.cjsonl']
+    assert session_log.read_events(sessions_dir, 's3') == events
+
+    # Later events go to a new log, read after the compact file
+    session_log.append_event(sessions_dir, 's3', _event('s3', 'pageBlur', 4000))
+    assert session_log.read_events(sessions_dir, 's3') == events + [_event('s3', 'pageBlur', 4000)]
+
+
+def test_json_array_is_streamed_across_chunks():
+    events = [_event('s1', 'pageView', i) for i in range(50)] + [12345, "a ] , [ string", None, -1.5e10]
+    text = json.dumps(events, indent=2)
+    for chunk_size in (1, 3, 64, 1 << 16):
+        assert list(session_log.iter_json_array(io.StringIO(text), chunk_size)) == events
+    assert list(session_log.iter_json_array(io.StringIO(' [ ] '), 1)) == []
+    # Not an array: nothing, like the full reader always did
+    assert list(session_log.iter_json_array(io.StringIO('{"a": [1]}'), 2)) == []
+    for malformed in ('[1 2]', '[1,]', '[1] x', '[{"a": 1}', ''):
+        with pytest.raises(json.JSONDecodeError):
+            list(session_log.iter_json_array(io.StringIO(malformed), 2))
@@ -0,0 +1,43 @@
+import flask_app
+from storage import JsonFileStorage, SQLiteStorage
+
+
+def _event(sid, name, ts, **data):
+    return {'sessionId': sid, 'deviceInfo': {'os': 'iOS', 'model': 'iPhone'}, 'ip': '1.2.3.4',
+            'eventName': name, 'eventData': dict(data, url='/quiz/page/0', timestamp=ts)}
+
+
+def test_sqlite_backend_serves_the_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(flask_app, 'STORAGE_BACKEND', 'sqlite')
+    flask_app.save_all_questions([{'id': 1, 'page': 0}, {'id': 2, 'page': 1}])
+    flask_app.record_session_events('s1', [
+        _event('s1', 'pageView', 1000),
+        _event('s1', 'quizAnswer', 2000, questionId=1, isCorrect=True),
+        _event('s1', 'quizAnswer', 3000, questionId=1, isCorrect=False),
+    ])
+    assert (tmp_path / 'app.db').exists()
+
+    with flask_app.app.test_client() as c:
+        assert c.get('/api/questions/1').get_json() == [{'id': 2, 'page': 1}]
+        with c.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = 'admin'
+        [row] = c.get('/api/quiz_dashboard/data').get_json()
+        assert (row['answered'], row['correct'], row['total']) == (1, 1, 2)
+        [summary] = c.get('/api/dashboard/sessions').get_json()
+        assert summary['os'] == 'iOS' and summary['start_time'] == 1000
+        assert len(c.get('/api/dashboard/session/s1').get_json()) == 3
+        assert c.delete('/api/dashboard/session/s1').status_code == 200
+        assert c.get('/api/dashboard/sessions').get_json() == []
+
+
+def test_import_from_file_layout(tmp_path):
+    source = JsonFileStorage(str(tmp_path / 'data'))
+    source.questions.save([{'id': 7, 'page': 3}])
+    source.append_events('s2', [_event('s2', 'pageView', 5)])
+    target = SQLiteStorage(str(tmp_path / 'app.db'))
+    assert target.import_from(source) == 1
+    assert target.import_from(source) == 1  # re-running replaces, it does not duplicate
+    assert target.read_events('s2') == source.read_events('s2')
+    assert target.questions.page(3) == [{'id': 7, 'page': 3}]
@@ -0,0 +1,49 @@
+import threading
+import time
+import flask_app
+import session_log
+from ingest import WriteBehindQueue
+
+
+def _event(sid, ts):
+    return {'sessionId': sid, 'deviceInfo': {}, 'ip': '1.2.3.4', 'eventName': 'timeSpent',
+            'eventData': {'duration': 1, 'timestamp': ts}}
+
+
+def test_batch_is_written_behind(tmp_path, monkeypatch):
+    monkeypatch.setattr(flask_app, 'DATA_DIR', str(tmp_path))
+    events = [_event('a', 1), _event('b', 2), _event('a', 3)]
+    with flask_app.app.test_client() as c:
+        resp = c.post('/api/track/batch', json={'events': events})
+        assert resp.status_code == 200
+        assert resp.get_json()['accepted'] == 3
+    assert flask_app.track_queue.flush(timeout=5)
+    sessions_dir = str(tmp_path / 'sessions')
+    assert [e['eventData']['timestamp'] for e in session_log.read_events(sessions_dir, 'a')] == [1, 3]
+    assert len(session_log.read_events(sessions_dir, 'b')) == 1
+
+
+def test_full_queue_rejects_whole_batch():
+    written = []
+    q = WriteBehindQueue(lambda sid, events: written.extend(events), max_pending=2)
+    assert not q.submit({'a': [1, 2], 'b': [3]})
+    assert q.stats()['rejected_events'] == 3
+    assert q.submit({'a': [1, 2]})
+    assert q.flush(timeout=5)
+    assert written == [1, 2]
+    q.close()
+
+
+def test_events_being_written_count_against_the_bound():
+    release = threading.Event()
+    q = WriteBehindQueue(lambda sid, events: release.wait(5), max_pending=2, flush_interval=0.01)
+    assert q.submit({'a': [1, 2]})
+    deadline = time.monotonic() + 5
+    while q.stats()['in_flight_events'] != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert q.stats()['queue_full']
+    assert not q.submit({'a': [3]})
+    release.set()
+    assert q.flush(timeout=5)
+    assert q.submit({'a': [3]})
+    q.close()